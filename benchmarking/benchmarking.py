@@ -10,7 +10,9 @@ config = {
         "api_version": "",
         "api_base": "",
         "api_key": "",
-        "embedding_id":"text-embedding-ada-002"
+        "embedding_id":"text-embedding-ada-002",
+        "cache": True,
+        "cache_path": "./escargot_cache/azuregpt35-16k.sqlite"
     },
     "memgraph" : {
         "host": "",
@@ -25,6 +27,7 @@ config = {
 }
 
 from escargot import Escargot
+from escargot.utils import retrying
 escargot = Escargot(config, node_types = "BiologicalProcess, BodyPart, CellularComponent, Datatype, Disease, Drug, DrugClass, Gene, MolecularFunction, Pathway, Symptom", relationship_types = """CHEMICALBINDSGENE
 CHEMICALDECREASESEXPRESSION
 CHEMICALINCREASESEXPRESSION
@@ -84,18 +87,24 @@ for json_file in json_files:
     with open("../dataset/"+json_file) as f:
         data = json.load(f)
     responses[json_file] = {}
-    for question in data:
-        response = ''
-        tries = 0
-        while response == '' and tries < 3:
-            escargot.graph_client.cache = {}
-            try:
-                response = escargot.ask(question['question'], answer_type= "array",debug_level = 0)
-            except Exception as e:
-                response = ''
-            tries += 1
-        
-        print('question:', question['question'], 'answer:', question['answer'], 'response:', response)
+    questions = [question['question'] for question in data]
+    answers = {}
+    for result in escargot.ask_many(questions, answer_type= "array", debug_level = 0, concurrency = 8):
+        answers[result['index']] = result['output'] if result['error'] is None else ''
+    # send the failed questions back through ask_many, up to 2 more rounds
+    for _ in range(2):
+        failed = [index for index in range(len(questions)) if answers[index] == '']
+        if failed == []:
+            break
+        # the cached responses of the failed try would fail again
+        with retrying():
+            for result in escargot.ask_many([questions[index] for index in failed], answer_type= "array", debug_level = 0, concurrency = 8):
+                if result['error'] is None:
+                    answers[failed[result['index']]] = result['output']
+
+    for index, question in enumerate(questions):
+        response = answers[index]
+        print('question:', question, 'answer:', data[index]['answer'], 'response:', response)
         print("------------------------------------------------------------------------------------------------------------------------------\n")
-        responses[json_file][question['question']] = str(response)
+        responses[json_file][question] = str(response)
 dill.dump(responses, open('Escargot_esponses.pkl', 'wb'))
\ No newline at end of file
@@ -0,0 +1,2 @@
+from escargot.cache.cache import LRUCache, SQLiteCache, EmbeddingCache, build_cache, make_key
+from escargot.cache.plan_cache import PlanCache
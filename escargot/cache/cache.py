@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import dill as pickle
+import numpy as np
+
+_MISSING = object()
+
+
+def make_key(*parts) -> str:
+    """
+    Build a cache key from its parts. Long parts such as prompts are only stored as a hash.
+
+    :param parts: The parts of the key. They must be JSON serializable.
+    :return: The SHA-256 hex digest of the parts.
+    :rtype: str
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache bounded in size, evicting the least recently used entries first.
+    Entries optionally expire after a time to live.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None) -> None:
+        """
+        Initialize the cache.
+
+        :param max_size: The maximum number of entries. Defaults to 1024.
+        :type max_size: int
+        :param ttl: The time to live of an entry in seconds. Defaults to None (entries do not expire).
+        :type ttl: Optional[float]
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get the value of a key and mark it as recently used.
+
+        :param key: The key.
+        :param default: The value returned if the key is missing or expired. Defaults to None.
+        :return: The cached value or the default.
+        """
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Set the value of a key, evicting the least recently used entries if the cache is full.
+
+        :param key: The key.
+        :param value: The value.
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+        return entry is not _MISSING and (entry[1] is None or entry[1] > time.time())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SQLiteCache:
+    """
+    Thread-safe disk-backed cache stored in a SQLite file, so that entries survive the process.
+    It has the same interface and bounds as LRUCache. Values are serialized with dill.
+    """
+
+    def __init__(self, path: str, max_size: int = 100000, ttl: Optional[float] = None) -> None:
+        """
+        Initialize the cache, creating the SQLite file if it does not exist.
+
+        :param path: The path to the SQLite file.
+        :type path: str
+        :param max_size: The maximum number of entries. Defaults to 100000.
+        :type max_size: int
+        :param ttl: The time to live of an entry in seconds. Defaults to None (entries do not expire).
+        :type ttl: Optional[float]
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                if row[1] is None or row[1] > now:
+                    self.connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return pickle.loads(row[0])
+                self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value), expires, now),
+            )
+            count = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_size:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (count - self.max_size,),
+                )
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return default if value is _MISSING else value
+
+    def clear(self) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM cache")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            row = self.connection.execute("SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def build_cache(config: Dict, prefix: str = "cache", default_size: int = 1024):
+    """
+    Build a cache from a configuration dictionary.
+    The keys read are "<prefix>_size", "<prefix>_ttl" and "<prefix>_path".
+    If a path is given, the cache is stored on disk in a SQLite file, otherwise it is kept in memory.
+
+    :param config: The configuration dictionary.
+    :type config: Dict
+    :param prefix: The prefix of the configuration keys. Defaults to "cache".
+    :type prefix: str
+    :param default_size: The maximum number of entries if not configured. Defaults to 1024.
+    :type default_size: int
+    :return: The cache.
+    :rtype: Union[LRUCache, SQLiteCache]
+    """
+    max_size = config.get(f"{prefix}_size", default_size)
+    ttl = config.get(f"{prefix}_ttl", None)
+    path = config.get(f"{prefix}_path", None)
+    if path:
+        return SQLiteCache(path, max_size=max_size, ttl=ttl)
+    return LRUCache(max_size=max_size, ttl=ttl)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings, with an in-memory LRU cache in front of an optional
+    SQLite store in which the embeddings are kept as float32 arrays.
+    """
+
+    def __init__(self, max_size: int = 10000, path: Optional[str] = None) -> None:
+        """
+        Initialize the cache, creating the SQLite file if a path is given and it does not exist.
+
+        :param max_size: The maximum number of embeddings kept in memory. Defaults to 10000.
+        :type max_size: int
+        :param path: The path to the SQLite file. Defaults to None (embeddings are only kept in memory).
+        :type path: Optional[str]
+        """
+        self.memory = LRUCache(max_size=max_size)
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            with self.lock, self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """
+        Get a cached embedding.
+
+        :param key: The key of the embedding.
+        :return: The embedding, or None if it is not cached.
+        :rtype: Optional[List[float]]
+        """
+        embedding = self.memory.get(key)
+        if embedding is not None or self.connection is None:
+            return embedding
+        with self.lock:
+            row = self.connection.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        embedding = np.frombuffer(row[0], dtype=np.float32).tolist()
+        self.memory.set(key, embedding)
+        return embedding
+
+    def set(self, key: str, embedding: List[float]) -> None:
+        self.memory.set(key, embedding)
+        if self.connection is not None:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, np.asarray(embedding, dtype=np.float32).tobytes()),
+                )
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.connection is not None:
+            with self.lock, self.connection:
+                self.connection.execute("DELETE FROM embeddings")
@@ -0,0 +1,156 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from escargot.cache.cache import make_key
+
+# Capitalized words that start questions rather than name entities
+STOP_WORDS = {
+    "true", "false", "question", "which", "what", "who", "how", "many", "list", "find", "name", "give",
+    "select", "choose", "is", "are", "does", "do", "can", "the", "a", "an", "of", "and", "or", "in", "to", "following",
+}
+
+
+def placeholder(index: int) -> str:
+    return f"__ENTITY_{index}__"
+
+
+def entity_pattern(entity: str) -> str:
+    return r"(?<!\w)" + re.escape(entity) + r"(?!\w)"
+
+
+class PlanCache:
+    """
+    Cache of the steps of answered questions, keyed on the shape of the question.
+
+    The entity mentions of a question (multiple choice options, names following a node type such as
+    "the drug Loxapine", and capitalized or alphanumeric names such as "CYP3A4") are masked, so that
+    "List the genes which bind to the drug Stanozolol" and "List the genes which bind to the drug Loxapine"
+    share their entry. Entries are also keyed on the answer type and the method of the question, whose steps differ.
+    The XML steps, plan and code are stored with the entities replaced by placeholders,
+    along with the fingerprint of the schema they were planned against, and the entities of the new question
+    are substituted back on a hit.
+    """
+
+    def __init__(self, cache: Any) -> None:
+        """
+        Initialize the plan cache.
+
+        :param cache: The cache backend, such as an LRUCache or a SQLiteCache.
+        """
+        self.cache = cache
+
+    def mask(self, question: str, node_types: str = "") -> Tuple[str, List[str]]:
+        """
+        Mask the entity mentions of a question.
+
+        :param question: The question.
+        :type question: str
+        :param node_types: The node types of the knowledge graph, separated by commas.
+        :type node_types: str
+        :return: The normalized question with the entities replaced by placeholders, and the entities in order of appearance.
+        :rtype: Tuple[str, List[str]]
+        """
+        question = " ".join(str(question).split())
+        types = set()
+        for node_type in re.split(r"[,\s]+", str(node_types).lower()):
+            if node_type != "":
+                types.add(node_type)
+                types.add(node_type + "s")
+        entities: List[str] = []
+
+        # multiple choice options, e.g. "? 1. Dolasetron 2. Trastuzumab 3. Insulin pork"
+        options = re.search(r"(?:^|\s)1\.\s", question)
+        text = question if options is None else question[:options.start()]
+        if options is not None:
+            for option in re.split(r"\s+\d+\.\s+", " " + question[options.end():]):
+                option = option.strip().rstrip("?.")
+                if option != "" and option not in entities:
+                    entities.append(option)
+
+        previous = ""
+        for token in re.findall(r"[^\s?,;:]+", text):
+            token = token.rstrip(".!")
+            lower = token.lower()
+            named = any(char.isupper() or char.isdigit() for char in token) and not token.isdigit()
+            if token != "" and lower not in STOP_WORDS and lower not in types and (named or previous in types):
+                if token not in entities:
+                    entities.append(token)
+            previous = lower
+
+        template = question
+        # longest first, so that an entity contained in another one is not masked inside it
+        for entity in sorted(entities, key=len, reverse=True):
+            template = re.sub(entity_pattern(entity), placeholder(entities.index(entity) + 1), template)
+        return template.lower(), entities
+
+    def get(self, question: str, node_types: str, fingerprint: str, answer_type: str = "natural", method: str = "got") -> Optional[Dict]:
+        """
+        Get the cached plan of a question with its entities substituted.
+        Entries planned against another schema are dropped.
+
+        :param question: The question.
+        :type question: str
+        :param node_types: The node types of the knowledge graph.
+        :type node_types: str
+        :param fingerprint: The fingerprint of the current schema.
+        :type fingerprint: str
+        :param answer_type: The answer type of the question. Defaults to "natural".
+        :type answer_type: str
+        :param method: The method the question is answered with. Defaults to "got".
+        :type method: str
+        :return: The plan, with the keys "xml", "full_plan" and "full_code", or None on a miss.
+        :rtype: Optional[Dict]
+        """
+        template, entities = self.mask(question, node_types)
+        if entities == []:
+            return None
+        key = make_key("plan", template, answer_type, method)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry.get("fingerprint") != fingerprint:
+            self.cache.pop(key)
+            return None
+        plan = {}
+        for field in ("xml", "full_plan", "full_code"):
+            value = entry.get(field) or ""
+            for index, entity in enumerate(entities):
+                value = value.replace(placeholder(index + 1), entity)
+            plan[field] = value
+        return plan
+
+    def set(self, question: str, node_types: str, fingerprint: str, plan: Dict, answer_type: str = "natural", method: str = "got") -> bool:
+        """
+        Store the plan of a question. A plan is only stored if every entity of the question appears in its XML,
+        so that nothing specific to the question is left in the template.
+
+        :param question: The question.
+        :type question: str
+        :param node_types: The node types of the knowledge graph.
+        :type node_types: str
+        :param fingerprint: The fingerprint of the current schema.
+        :type fingerprint: str
+        :param plan: The plan, with the keys "xml", "full_plan" and "full_code".
+        :type plan: Dict
+        :param answer_type: The answer type of the question. Defaults to "natural".
+        :type answer_type: str
+        :param method: The method the question was answered with. Defaults to "got".
+        :type method: str
+        :return: True if the plan was stored, False otherwise.
+        :rtype: bool
+        """
+        template, entities = self.mask(question, node_types)
+        xml = plan.get("xml") or ""
+        if entities == [] or any(re.search(entity_pattern(entity), xml) is None for entity in entities):
+            return False
+        entry = {"fingerprint": fingerprint}
+        for field in ("xml", "full_plan", "full_code"):
+            value = plan.get(field) or ""
+            for entity in sorted(entities, key=len, reverse=True):
+                value = re.sub(entity_pattern(entity), placeholder(entities.index(entity) + 1), value)
+            entry[field] = value
+        self.cache.set(make_key("plan", template, answer_type, method), entry)
+        return True
+
+    def clear(self) -> None:
+        self.cache.clear()
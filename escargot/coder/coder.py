@@ -4,8 +4,11 @@ import re
 import logging
 import numpy as np
 from escargot.prompter import ESCARGOTPrompter
+from escargot.utils import check_cancelled, run_cancellable
+from escargot.metrics import timed
 import ast
 import numpy as np
+import threading
 
 def determine_and_execute(code_snippet, namespace={}):
     local_context = {}
@@ -44,6 +47,8 @@ class Coder:
         self.executed_code = {}
         self.instructions = {}
         self.file_descriptions = file_descriptions
+        # guards the shared state when independent steps are executed concurrently
+        self.lock = threading.Lock()
 
     def execute_code(self, code: str, instruction: str, step_id: str, prompter: ESCARGOTPrompter, logger: logging.Logger, full_code = "") -> str:
         """
@@ -57,27 +62,34 @@ class Coder:
         tries = 3
         compiled = False
 
-        if len(self.instructions) > 0:
-            context = ""
-            for cur_step_id, step in self.instructions.items():
-                context += "Step " + cur_step_id + ": " + step + "\n"
-                context += "Code: " + self.executed_code[cur_step_id] + "\n"
-                output = self.step_output[cur_step_id]
-                if len(str(output)) > 256:
-                    output = str(output)[:256] + "..."
-                context += "Local variables: " + str(output) + "\n"
+        with self.lock:
+            if len(self.instructions) > 0:
+                context = ""
+                for cur_step_id, step in self.instructions.items():
+                    context += "Step " + cur_step_id + ": " + step + "\n"
+                    context += "Code: " + self.executed_code[cur_step_id] + "\n"
+                    output = self.step_output[cur_step_id]
+                    if len(str(output)) > 256:
+                        output = str(output)[:256] + "..."
+                    context += "Local variables: " + str(output) + "\n"
 
             # code = prompter.adjust_code(code, instruction, context)
 
         def knowledge_extract(request):
             return prompter.get_knowledge(request,instruction,code,full_code)
+
+        # Each step executes in its own namespace built from the variables of the steps already executed,
+        # so that steps running concurrently do not overwrite each other's knowledge_extract or variables
+        with self.lock:
+            namespace = self.local_context.copy()
         # Add the knowledge_extract function to the local context
-        self.local_context["knowledge_extract"] = knowledge_extract
-        self.local_context["prompter"] = prompter
+        namespace["knowledge_extract"] = knowledge_extract
+        namespace["prompter"] = prompter
 
-        backup_local_context = self.local_context.copy()
+        backup_namespace = namespace.copy()
         
         while tries > 0 and not compiled:
+            check_cancelled()
             try:
                 #detect long spaces within the code and remove them, but keep \n
                 code = code.replace('            ','')
@@ -88,11 +100,14 @@ class Coder:
                 if """\n\n""" in code:
                     code = code.replace("""\n\n""",'\n')
                 
-                result, expression_type, local_context = determine_and_execute(code, self.local_context)
+                # run so that a cancelled question does not wait for the end of the code
+                # the execution time includes the knowledge requests of the code
+                with timed("exec_seconds"):
+                    result, expression_type, local_context = run_cancellable(determine_and_execute, code, namespace)
                 compiled = True
             except Exception as e:
                 logger.warning(f"Could not execute code: {code}. Encountered exception: {e}")
-                self.local_context = backup_local_context.copy()
+                namespace = backup_namespace.copy()
                 #debug using the prompter and using the error message
                 prompt = prompter.generate_debug_code_prompt(code, instruction, e)
                 code =prompter.lm.get_response_texts(
@@ -100,16 +115,16 @@ class Coder:
                 )[0]
                 # code = prompter.adjust_code(code, instruction, context)
                 tries -= 1
-        if compiled:
-            self.executed_code[step_id] = code
-            self.instructions[step_id] = instruction
-            #check for diff between local_context and backup_local_context
-            if expression_type == 'eval':
-                self.step_output[step_id] = result
-            else:
-                self.step_output[step_id] = local_context
-                self.local_context = self.local_context | local_context
-        logger.info(f"Step output: {self.step_output}")
-        self.local_context_by_step[step_id] = self.local_context.copy()
+        with self.lock:
+            if compiled:
+                self.executed_code[step_id] = code
+                self.instructions[step_id] = instruction
+                #check for diff between local_context and backup_local_context
+                if expression_type == 'eval':
+                    self.step_output[step_id] = result
+                else:
+                    self.step_output[step_id] = local_context
+                    self.local_context = self.local_context | local_context
+            logger.info(f"Step output: {self.step_output}")
+            self.local_context_by_step[step_id] = self.local_context.copy()
         return code,compiled
-    
\ No newline at end of file
@@ -10,14 +10,19 @@ import json
 import logging
 from typing import List, Optional, Dict, Any
 from escargot.language_models import AbstractLanguageModel
-from escargot.operations import GraphOfOperations, Thought
+from escargot.operations import GraphOfOperations, Operation, Thought
 from escargot.prompter import ESCARGOTPrompter
 from escargot.parser import ESCARGOTParser
 from escargot.coder import Coder
+from escargot.utils import OperationCancelled, set_cancellation_event, reset_cancellation_event, retrying, bind_cancellation
+from escargot.metrics import MetricsRecorder, record
 import copy
 import dill as pickle
 import os
 import threading
+import asyncio
+from contextlib import nullcontext
+from concurrent.futures import Executor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 class Controller:
     """
@@ -37,11 +42,18 @@ class Controller:
         problem_parameters: Dict[str, Any],
         max_tokens: Optional[int] = None,
         cancellation_event: Optional[threading.Event] = None,
+        max_workers: int = 1,
+        metrics: Optional[MetricsRecorder] = None,
     ) -> None:
         """
         Initialize the Controller instance with the language model,
         operations graph, prompter, parser, coder, problem parameters,
         and optional token limit and cancellation event.
+
+        If max_workers is larger than 1, operations whose predecessors have all been
+        executed are dispatched concurrently to a thread pool of that size.
+        If a metrics recorder is given, each operation is recorded as a span of its phase.
+        Speculative conversions run on a separate thread pool of max_workers threads, shared by the operations of the run.
         """
         self.logger = logger
         self.lm = lm
@@ -59,6 +71,13 @@ class Controller:
         self.coder = coder
         self.max_tokens = max_tokens
         self.cancellation_event = cancellation_event
+        self.max_workers = max_workers
+        self.metrics = metrics
+        # Executor of the speculative conversions, created when first needed
+        self.speculation_executor: Optional[ThreadPoolExecutor] = None
+        self.speculation_lock = threading.Lock()
+        # Number of runs started, the runs after the first one being retries
+        self.runs = 0
 
     def initialize_execution_queue(self) -> None:
         """
@@ -96,6 +115,88 @@ class Controller:
             return None
         return self.execution_queue[0].predecessors[0].get_thoughts()[0].state["phase"]
 
+    def execute_operation(self, operation: Operation) -> Optional[Operation]:
+        """
+        Execute a single operation, retrying up to max_operation_tries times.
+        The cancellation event is visible to the language model, graph and code calls of the operation,
+        which stop as soon as it is set; a cancelled operation is not retried.
+
+        :param operation: The operation to execute.
+        :return: The executed operation, or None if all tries failed or the operation was cancelled.
+        """
+        operation.max_tokens = self.max_tokens
+        if self.problem_parameters.get("speculative", False):
+            operation.speculation_executor = self.get_speculation_executor()
+        operation_backup = copy.copy(operation)
+
+        tries = 0
+        token = set_cancellation_event(self.cancellation_event)
+        try:
+            with self.metrics_span(operation):
+                while tries < self.max_operation_tries:
+                    # speculative work is not repeated on retries
+                    operation.is_retry = self.runs > 1 or tries > 0
+                    try:
+                        # a retry is not served the cached responses of the try that failed
+                        with retrying(operation.is_retry):
+                            operation.execute(
+                                self.lm, self.prompter, self.parser, self.got_steps, self.logger, self.coder, **self.problem_parameters
+                            )
+                        break
+                    except OperationCancelled:
+                        self.logger.warning("Operation %s cancelled", operation.operation_type)
+                        return None
+                    except Exception as e:
+                        self.logger.error("Error executing operation %s: %s", operation.operation_type, e)
+                        operation = copy.copy(operation_backup)
+                        tries += 1
+                        record("retries")
+        finally:
+            reset_cancellation_event(token)
+
+        del operation_backup
+
+        if tries == self.max_operation_tries:
+            self.logger.error("Max tries reached on executing operation %s", operation.operation_type)
+            return None
+        return operation
+
+    def get_speculation_executor(self) -> ThreadPoolExecutor:
+        """
+        Get the executor of the speculative conversions, creating it the first time.
+
+        :return: The executor, with max_workers threads.
+        """
+        with self.speculation_lock:
+            if self.speculation_executor is None:
+                self.speculation_executor = ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix="escargot-speculation")
+            return self.speculation_executor
+
+    def shutdown_speculation(self) -> None:
+        """
+        Shut down the executor of the speculative conversions, cancelling the conversions that have not started.
+        """
+        with self.speculation_lock:
+            if self.speculation_executor is not None:
+                # the conversions already running finish in the background
+                self.speculation_executor.shutdown(wait=False, cancel_futures=True)
+                self.speculation_executor = None
+
+    def metrics_span(self, operation: Operation):
+        """
+        Open the metrics span of an operation, labeled with the phase it executes and its step, if any.
+
+        :param operation: The operation.
+        :return: The context manager of the span.
+        """
+        if self.metrics is None:
+            return nullcontext()
+        state = operation.get_thoughts()[-1].state if operation.get_thoughts() else {}
+        if state.get("phase") not in ("steps", "output"):
+            previous_thoughts = operation.get_previous_thoughts()
+            state = previous_thoughts[0].state if previous_thoughts else self.problem_parameters
+        return self.metrics.span("phase", phase=state.get("phase"), operation=operation.id, step=state.get("StepID"))
+
     def execute_step(self) -> Optional[Thought]:
         """
         Execute one step from the execution queue.
@@ -109,25 +210,8 @@ class Controller:
             self.logger.debug("No more operations to execute.")
             return None
 
-        current_operation = self.execution_queue.pop(0)
-        current_operation_backup = copy.copy(current_operation)
-        
-        tries = 0
-        while tries < self.max_operation_tries:
-            try:
-                current_operation.execute(
-                    self.lm, self.prompter, self.parser, self.got_steps, self.logger, self.coder, **self.problem_parameters
-                )
-                break
-            except Exception as e:
-                self.logger.error("Error executing operation %s: %s", current_operation.operation_type, e)
-                current_operation = copy.copy(current_operation_backup)
-                tries += 1
-
-        del current_operation_backup
-
-        if tries == self.max_operation_tries:
-            self.logger.error("Max tries reached on executing operation %s", current_operation.operation_type)
+        current_operation = self.execute_operation(self.execution_queue.pop(0))
+        if current_operation is None:
             return None
         
         for operation in current_operation.successors:
@@ -138,6 +222,91 @@ class Controller:
         
         return self.final_thought
 
+    def execute_concurrently(self) -> None:
+        """
+        Execute the operations in the execution queue on a thread pool of max_workers threads.
+        Every operation whose predecessors have been executed is dispatched as soon as it is ready,
+        so independent branches of the steps graph run in parallel.
+        The token limit and cancellation checks are applied each time an operation completes.
+        """
+        scheduled = set(operation.id for operation in self.execution_queue)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while self.execution_queue or running:
+                if self.limit_reached():
+                    break
+
+                while self.execution_queue:
+                    operation = self.execution_queue.pop(0)
+                    running[executor.submit(self.execute_operation, operation)] = operation
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    self.complete_operation(future.result(), scheduled)
+        finally:
+            # Do not wait on operations that are still in flight after a stop was requested
+            executor.shutdown(wait=not running, cancel_futures=True)
+
+    def complete_operation(self, current_operation: Optional[Operation], scheduled: set) -> None:
+        """
+        Queue the successors of an executed operation that became ready, and update the final thought.
+
+        :param current_operation: The executed operation, or None if its execution failed.
+        :param scheduled: The ids of the operations already queued, so that joins are only queued once.
+        """
+        if current_operation is None:
+            return
+        for operation in current_operation.successors:
+            if operation.id not in scheduled and operation.can_be_executed():
+                scheduled.add(operation.id)
+                self.execution_queue.append(operation)
+        self.final_thought = current_operation.get_thoughts()[0]
+
+    def limit_reached(self) -> bool:
+        """
+        Check the token limit and the cancellation event, and mark the final thought if either stops the run.
+
+        :return: True if the run should stop, False otherwise.
+        """
+        # Log current token count if debug level >= 1 (WARNING)
+        if self.logger.isEnabledFor(logging.WARNING):
+            current_tokens = self.lm.prompt_tokens + self.lm.completion_tokens
+            self.logger.warning(f"Current token count: {current_tokens} (Prompt: {self.lm.prompt_tokens}, Completion: {self.lm.completion_tokens})")
+
+        if self.max_tokens is not None and (self.lm.prompt_tokens + self.lm.completion_tokens) > self.max_tokens:
+            self.logger.warning(f"Token limit ({self.max_tokens}) exceeded ({self.lm.prompt_tokens + self.lm.completion_tokens} tokens). Stopping controller run.")
+            if self.final_thought is None:
+                base_state = self.problem_parameters.copy()
+                base_state["phase"] = "token_limit_exceeded"
+                base_state["input"] = f"Operation cancelled due to token limit ({self.max_tokens}) exceeded."
+                self.final_thought = Thought(base_state)
+            else:
+                self.final_thought.state["phase"] = "token_limit_exceeded"
+                self.final_thought.state["input"] = f"Operation cancelled due to token limit ({self.max_tokens}) exceeded."
+                self.final_thought.state["error"] = "TokenLimitExceeded"
+
+            self.run_executed = False
+            return True
+
+        if self.cancellation_event and self.cancellation_event.is_set():
+            self.logger.warning("Cancellation requested, stopping controller run.")
+            if self.final_thought is None:
+                base_state = self.problem_parameters.copy()
+                base_state["phase"] = "cancelled"
+                base_state["input"] = "Operation cancelled due to timeout."
+                self.final_thought = Thought(base_state)
+            else:
+                self.final_thought.state["phase"] = "cancelled"
+                self.final_thought.state["input"] = "Operation cancelled due to timeout."
+                self.final_thought.state["error"] = "Timeout"
+
+            self.run_executed = False
+            return True
+
+        return False
+
     def run(self) -> None:
         """
         Run the controller and execute the operations from the Graph of Operations based on their readiness.
@@ -147,56 +316,103 @@ class Controller:
         
         while not self.run_executed and self.max_run_tries > 0:
             self.max_run_tries -= 1
+            self.runs += 1
             self.execution_queue = []
             self.got_steps = {}
             self.problem_parameters = copy.copy(self.original_problem_parameters)
             self.initialize_execution_queue()
             
-            while self.execution_queue:
-                # Log current token count if debug level >= 1 (WARNING)
-                if self.logger.isEnabledFor(logging.WARNING):
-                    current_tokens = self.lm.prompt_tokens + self.lm.completion_tokens
-                    self.logger.warning(f"Current token count: {current_tokens} (Prompt: {self.lm.prompt_tokens}, Completion: {self.lm.completion_tokens})")
-
-                if self.max_tokens is not None and (self.lm.prompt_tokens + self.lm.completion_tokens) > self.max_tokens:
-                    self.logger.warning(f"Token limit ({self.max_tokens}) exceeded ({self.lm.prompt_tokens + self.lm.completion_tokens} tokens). Stopping controller run.")
-                    if self.final_thought is None:
-                        base_state = self.problem_parameters.copy()
-                        base_state["phase"] = "token_limit_exceeded"
-                        base_state["input"] = f"Operation cancelled due to token limit ({self.max_tokens}) exceeded."
-                        self.final_thought = Thought(base_state)
-                    else:
-                        self.final_thought.state["phase"] = "token_limit_exceeded"
-                        self.final_thought.state["input"] = f"Operation cancelled due to token limit ({self.max_tokens}) exceeded."
-                        self.final_thought.state["error"] = "TokenLimitExceeded"
-
-                    self.run_executed = False
-                    break
+            if self.max_workers > 1:
+                self.execute_concurrently()
+            else:
+                while self.execution_queue:
+                    if self.limit_reached():
+                        break
+                    self.execute_step()
+
+            if self.final_thought and self.final_thought.state["phase"] == "output":
+                self.logger.info("All operations executed")
+                self.run_executed = True
+                self.cache_plan()
+            elif self.final_thought and self.final_thought.state["phase"] in ("cancelled", "token_limit_exceeded"):
+                # a stopped run is not retried
+                break
+
+        self.shutdown_speculation()
+        if self.max_run_tries == 0:
+            self.logger.error("Max tries reached on executing controller")
+
 
-                if self.cancellation_event and self.cancellation_event.is_set():
-                    self.logger.warning("Cancellation requested, stopping controller run.")
-                    if self.final_thought is None:
-                        base_state = self.problem_parameters.copy()
-                        base_state["phase"] = "cancelled"
-                        base_state["input"] = "Operation cancelled due to timeout."
-                        self.final_thought = Thought(base_state)
-                    else:
-                        self.final_thought.state["phase"] = "cancelled"
-                        self.final_thought.state["input"] = "Operation cancelled due to timeout."
-                        self.final_thought.state["error"] = "Timeout"
-
-                    self.run_executed = False
+    async def arun(self, executor: Optional[Executor] = None) -> None:
+        """
+        Asynchronous counterpart of run, to be awaited from an event loop.
+        The operations themselves are blocking (they use the blocking language model API, query and get_embeddings,
+        rather than aquery and aget_embeddings), so each ready operation runs on a thread of the given executor
+        (the default executor of the loop if None), up to max_workers at a time, while the loop awaits it.
+        The questions awaited concurrently from one loop therefore share the threads of the executor,
+        whose size bounds the operations in flight across all of them.
+
+        :param executor: The executor in which operations are run. Defaults to None.
+        """
+        assert self.graph.roots is not None, "The operations graph has no root"
+        loop = asyncio.get_running_loop()
+
+        while not self.run_executed and self.max_run_tries > 0:
+            self.max_run_tries -= 1
+            self.runs += 1
+            self.execution_queue = []
+            self.got_steps = {}
+            self.problem_parameters = copy.copy(self.original_problem_parameters)
+            self.initialize_execution_queue()
+
+            scheduled = set(operation.id for operation in self.execution_queue)
+            running = set()
+            while self.execution_queue or running:
+                if self.limit_reached():
                     break
 
-                self.execute_step()
+                while self.execution_queue and len(running) < self.max_workers:
+                    operation = self.execution_queue.pop(0)
+                    running.add(loop.run_in_executor(executor, bind_cancellation(self.execute_operation), operation))
+
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    self.complete_operation(future.result(), scheduled)
 
             if self.final_thought and self.final_thought.state["phase"] == "output":
                 self.logger.info("All operations executed")
                 self.run_executed = True
+                self.cache_plan()
+            elif self.final_thought and self.final_thought.state["phase"] in ("cancelled", "token_limit_exceeded"):
+                # a stopped run is not retried
+                break
 
+        self.shutdown_speculation()
         if self.max_run_tries == 0:
             self.logger.error("Max tries reached on executing controller")
 
+    def cache_plan(self) -> None:
+        """
+        Store the steps of an executed run in the plan cache of the prompter, unless they came from it.
+        """
+        operations = list(self.graph.roots)
+        visited = set()
+        while operations:
+            operation = operations.pop(0)
+            if operation.id in visited:
+                continue
+            visited.add(operation.id)
+            for thought in operation.get_thoughts():
+                state = thought.state
+                if state.get("phase") == "steps" and "StepID" not in state and "instructions" in state:
+                    if not state.get("cached_plan", False):
+                        try:
+                            if self.prompter.cache_plan(state):
+                                self.logger.info("Cached the plan of question: %s", state["question"])
+                        except Exception as e:
+                            self.logger.warning("Could not cache the plan: %s", e)
+                    return
+            operations.extend(operation.successors)
 
     def get_final_thoughts(self) -> List[List[Thought]]:
         """
@@ -1,2 +1,4 @@
+from .connection_pool import ConnectionPool, get_pool, close_pools
+from .graph_client import GraphClient
 from .memgraph import *
 from .neo4j import *
\ No newline at end of file
@@ -0,0 +1,247 @@
+import threading
+import time
+from contextlib import contextmanager
+from itertools import chain, islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from escargot.utils import check_cancelled, run_cancellable
+
+# The pools shared by all the graph clients of the process, keyed by database kind, host and port
+_pools: Dict[Tuple[str, str, int], "ConnectionPool"] = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of gqlalchemy clients, each holding one connection to the graph database.
+
+    A connection is used by one thread at a time. Connections older than max_lifetime are replaced,
+    and connections that have been idle for more than health_check_interval seconds are checked with
+    a trivial query before being reused. Connections that raise an error are discarded.
+    Discarded connections are closed right away, rather than when their client is garbage collected.
+    """
+
+    HEALTH_CHECK_QUERY = "RETURN 1"
+
+    def __init__(
+        self,
+        connect: Callable,
+        size: int = 8,
+        max_lifetime: Optional[float] = None,
+        health_check_interval: Optional[float] = 30,
+        timeout: Optional[float] = None,
+        logger=None,
+    ) -> None:
+        """
+        Initialize the pool. Connections are only opened when they are first needed.
+
+        :param connect: Function creating a new gqlalchemy client.
+        :type connect: Callable
+        :param size: The maximum number of connections. Defaults to 8.
+        :type size: int
+        :param max_lifetime: The maximum age of a connection in seconds. Defaults to None (no limit).
+        :type max_lifetime: Optional[float]
+        :param health_check_interval: Idle time in seconds after which a connection is checked before reuse.
+                                      Defaults to 30. None disables the health check.
+        :type health_check_interval: Optional[float]
+        :param timeout: Seconds to wait for a free connection. Defaults to None (wait forever).
+        :type timeout: Optional[float]
+        :param logger: The logger. Defaults to None.
+        :type logger: logging.Logger
+        """
+        self.connect = connect
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        # Idle connections as (client, created, last_used), most recently used last
+        self.idle: List[Tuple[object, float, float]] = []
+
+    def acquire(self) -> Tuple[object, float]:
+        """
+        Take a connection out of the pool, opening a new one if no healthy idle connection is available.
+
+        :return: The gqlalchemy client and its creation time.
+        :rtype: Tuple[object, float]
+        :raise TimeoutError: If no connection becomes free within the timeout.
+        """
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        # wait in short slices, so that a cancelled question stops waiting for a connection
+        while not self.slots.acquire(timeout=0.1 if deadline is None else max(0.0, min(0.1, deadline - time.time()))):
+            check_cancelled()
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError(f"No free graph database connection after {self.timeout} seconds")
+        try:
+            while True:
+                with self.lock:
+                    if self.idle == []:
+                        break
+                    client, created, last_used = self.idle.pop()
+                now = time.time()
+                if self.max_lifetime is not None and now - created > self.max_lifetime:
+                    close_client(client)
+                    continue
+                if self.health_check_interval is not None and now - last_used > self.health_check_interval:
+                    try:
+                        list(client.execute_and_fetch(self.HEALTH_CHECK_QUERY))
+                    except Exception as e:
+                        if self.logger is not None:
+                            self.logger.warning(f"Discarding unhealthy graph database connection: {e}")
+                        close_client(client)
+                        continue
+                return client, created
+            return self.connect(), time.time()
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, client, created: float, healthy: bool = True) -> None:
+        """
+        Return a connection to the pool. Connections that cannot be reused, or are too old, are closed.
+
+        :param client: The gqlalchemy client.
+        :param created: The creation time of the connection.
+        :type created: float
+        :param healthy: Whether the connection can be reused. Defaults to True.
+        :type healthy: bool
+        """
+        now = time.time()
+        if healthy and (self.max_lifetime is None or now - created <= self.max_lifetime):
+            with self.lock:
+                self.idle.append((client, created, now))
+        else:
+            close_client(client)
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager lending a connection of the pool to the current thread.
+        The connection is discarded if the body raises an error.
+        """
+        client, created = self.acquire()
+        try:
+            yield client
+        except BaseException:
+            self.release(client, created, healthy=False)
+            raise
+        self.release(client, created)
+
+    def stream(self, query: str) -> Iterator[Dict]:
+        """
+        Run a Cypher query on a pooled connection and yield its rows as they are fetched.
+        The connection is held until the generator is exhausted or closed. If the generator is closed
+        before the end of the results, the connection is discarded, since unread rows may be pending on it.
+
+        :param query: The Cypher query.
+        :type query: str
+        :return: The result rows.
+        :rtype: Iterator[Dict]
+        """
+        with self.connection() as client:
+            rows = iter(client.execute_and_fetch(query))
+            # the query runs when its first row is fetched, and closing the connection of a cancelled query aborts it
+            first = run_cancellable(lambda: list(islice(rows, 1)), on_cancel=lambda: close_client(client))
+            for row in chain(first, rows):
+                check_cancelled()
+                yield row
+
+    def execute_and_fetch(self, query: str) -> List[Dict]:
+        """
+        Run a Cypher query on a pooled connection and fetch all its rows.
+        This has the same name as the gqlalchemy method, so the pool can be used in place of a client.
+
+        :param query: The Cypher query.
+        :type query: str
+        :return: The result rows.
+        :rtype: List[Dict]
+        """
+        with self.connection() as client:
+            # closing the connection of a cancelled query makes the database abort it
+            return run_cancellable(lambda: list(client.execute_and_fetch(query)), on_cancel=lambda: close_client(client))
+
+    def execute(self, query: str) -> List[Dict]:
+        """
+        Run a Cypher query on a pooled connection and fetch all its rows.
+
+        :param query: The Cypher query.
+        :type query: str
+        :return: The result rows.
+        :rtype: List[Dict]
+        """
+        return self.execute_and_fetch(query)
+
+    def close(self) -> None:
+        """
+        Drop the idle connections. Connections in use are dropped when they are returned.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for client, created, last_used in idle:
+            close_client(client)
+
+
+def close_client(client) -> None:
+    """
+    Close the connection of a gqlalchemy client, if it has one.
+
+    :param client: The gqlalchemy client.
+    """
+    connection = getattr(client, "_cached_connection", None)
+    if connection is not None and hasattr(connection, "close"):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(kind: str, host: str, port: int, connect: Callable, config: Dict = None, logger=None) -> ConnectionPool:
+    """
+    Get the connection pool shared by all the clients of a graph database, creating it on first use.
+    The keys read from the configuration are "pool_size", "pool_max_lifetime",
+    "pool_health_check_interval" and "pool_timeout". They are only used when the pool is created.
+
+    :param kind: The kind of database, e.g. "memgraph" or "neo4j".
+    :type kind: str
+    :param host: The host of the database.
+    :type host: str
+    :param port: The port of the database.
+    :type port: int
+    :param connect: Function creating a new gqlalchemy client.
+    :type connect: Callable
+    :param config: The database configuration. Defaults to None.
+    :type config: Dict
+    :param logger: The logger. Defaults to None.
+    :type logger: logging.Logger
+    :return: The connection pool.
+    :rtype: ConnectionPool
+    """
+    config = config or {}
+    key = (kind, host, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                connect,
+                size=config.get("pool_size", 8),
+                max_lifetime=config.get("pool_max_lifetime", None),
+                health_check_interval=config.get("pool_health_check_interval", 30),
+                timeout=config.get("pool_timeout", None),
+                logger=logger,
+            )
+            _pools[key] = pool
+        return pool
+
+
+def close_pools() -> None:
+    """
+    Close and forget all the shared connection pools.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
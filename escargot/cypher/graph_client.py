@@ -0,0 +1,416 @@
+from abc import ABC, abstractmethod
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import re
+import threading
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from escargot.cache import build_cache, make_key
+from escargot.cypher.connection_pool import get_pool
+from escargot.utils import OperationCancelled, bind_cancellation, check_cancelled, get_cancellation_event, reset_cancellation_event, set_cancellation_event
+from escargot.metrics import record, timed
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Normalize a knowledge request so that requests differing only in case or whitespace share their Cypher query.
+
+    :param statement: The knowledge request.
+    :type statement: str
+    :return: The normalized knowledge request.
+    :rtype: str
+    """
+    return " ".join(str(statement).lower().split())
+
+
+def inject_limit(cypher: str, limit: int) -> str:
+    """
+    Add a LIMIT clause to a Cypher query that returns rows and does not end with one,
+    so that the database stops producing rows once the limit is reached.
+
+    :param cypher: The Cypher query.
+    :type cypher: str
+    :param limit: The maximum number of rows.
+    :type limit: int
+    :return: The Cypher query with a LIMIT clause.
+    :rtype: str
+    """
+    cypher = cypher.strip().rstrip(";").strip()
+    if re.search(r"\bRETURN\b", cypher, re.IGNORECASE) is None:
+        return cypher
+    if re.search(r"\bLIMIT\s+\S+$", cypher, re.IGNORECASE) is not None:
+        return cypher
+    return f"{cypher} LIMIT {limit}"
+
+
+class GraphClient(ABC):
+    """
+    Abstract base class of the clients of Cypher graph databases.
+
+    Generated Cypher queries are cached per normalized knowledge request, and result rows per Cypher query.
+    Both caches are keyed on a fingerprint of the schema and of the "schema_version" configuration,
+    so that entries are invalidated when the knowledge graph changes.
+
+    The "validation" configuration selects how the candidate Cypher queries generated by the language model are tried:
+    "sequential" (default) runs them one after another until one returns rows, "first" runs them concurrently
+    and keeps the first non-empty result, and "merge" runs them concurrently and merges the non-empty results
+    in the order of the candidates' ranks.
+
+    If "max_rows" is configured, a LIMIT clause is added to the generated Cypher queries and at most max_rows rows
+    are fetched per query, the rest of the results being dropped without being read.
+
+    Queries run on a connection pool shared by all the clients of the same database in the process,
+    so concurrent steps, questions and Escargot instances neither serialize on one connection nor reconnect.
+    """
+
+    # The key of the database configuration in the config file
+    config_key: str = None
+
+    def __init__(self, config_path, logger):
+        self.logger = logger
+        self.config: Dict = None
+        if type(config_path) == dict:
+            self.config = config_path
+        else:
+            self.load_config(config_path)
+        if self.config_key not in self.config:
+            self.pool = None
+            self.client = None
+        else:
+            self.config: Dict = self.config[self.config_key]
+            self.host = self.config["host"]
+            self.port = self.config["port"]
+            self.pool = get_pool(self.config_key, self.host, self.port, self.connect, self.config, logger)
+            # The pool has the execute_and_fetch method of gqlalchemy clients
+            self.client = self.pool
+            self.num_responses = 7
+            # Generated Cypher query per knowledge request
+            self.cache = build_cache(self.config, "cypher_cache")
+            # Result rows per Cypher query
+            self.result_cache = build_cache(self.config, "result_cache")
+            # Bump to invalidate the caches when the data changes but the schema does not
+            self.schema_version = self.config.get("schema_version", "")
+            self.schema = None
+            self.validation = self.config.get("validation", "sequential")
+            # Maximum number of candidate queries run at the same time, and seconds to wait for each of them
+            self.max_concurrent_queries = self.config.get("max_concurrent_queries", 4)
+            self.query_timeout = self.config.get("query_timeout", 30)
+            # Maximum number of rows fetched per query, None for no limit
+            self.max_rows = self.config.get("max_rows", None)
+
+    @abstractmethod
+    def connect(self):
+        """
+        Create a new client of the graph database. Clients are created by the connection pool.
+
+        :return: The gqlalchemy client.
+        """
+        pass
+
+    @abstractmethod
+    def get_schema(self) -> Tuple[str, str]:
+        """
+        Retrieve the schema of the graph database and store its description in self.schema.
+
+        :return: The node types and the relationship types.
+        :rtype: Tuple[str, str]
+        """
+        pass
+
+    def load_config(self, path: str) -> None:
+        """
+        Load configuration from a specified path.
+
+        :param path: Path to the config file. If an empty path provided,
+                     default is `config.json` in the current directory.
+        :type path: str
+        """
+        if path == "":
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            path = os.path.join(current_dir, "config.json")
+
+        with open(path, "r") as f:
+            self.config = json.load(f)
+
+    def clear_cache(self) -> None:
+        """
+        Clear the Cypher query and result caches.
+        """
+        self.cache.clear()
+        self.result_cache.clear()
+
+    def schema_fingerprint(self) -> str:
+        """
+        Get the fingerprint of the current schema, used to key the caches.
+
+        :return: The fingerprint.
+        :rtype: str
+        """
+        return make_key(self.schema, self.schema_version)
+
+    def clean_response(self, response: str) -> str:
+        """
+        Extract the Cypher query from a response of the language model.
+
+        :param response: The response of the language model.
+        :type response: str
+        :return: The Cypher query, or "" if there is none.
+        :rtype: str
+        """
+        if response is None:
+            return ""
+        # Remove "Answer:" from the response
+        if response.startswith("Answer:"):
+            response= response[8:].strip()
+        #remove ```cypher from the response
+        response = response.replace("```cypher", "")
+
+        #remove ``` from anywhere in the response
+        response = response.replace("```", "")
+
+        #remove \n from the response
+        response = response.replace("\n", " ")
+
+        #TODO: tweak if necessary. Get rid of directionality in the response
+        response = response.replace("<-", "-")
+        response = response.replace("->", "-")
+        return response.strip()
+
+    def stream(self, cypher: str, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """
+        Run a Cypher query and yield its rows in chunks as they are fetched, without caching them.
+        At most max_rows rows are yielded if it is configured. Stop iterating to end the query early.
+
+        :param cypher: The Cypher query.
+        :type cypher: str
+        :param chunk_size: The number of rows per chunk. Defaults to 1000.
+        :type chunk_size: int
+        :return: The chunks of result rows.
+        :rtype: Iterator[List[Dict]]
+        """
+        if self.max_rows is not None:
+            cypher = inject_limit(cypher, self.max_rows)
+        stream = self.pool.stream(cypher)
+        rows = stream
+        if self.max_rows is not None:
+            rows = islice(stream, self.max_rows)
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if chunk == []:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+
+    def fetch(self, cypher: str) -> List[Dict]:
+        """
+        Run a Cypher query and fetch its rows, at most max_rows if it is configured.
+        The query and its wall time are recorded in the metrics of the current knowledge request.
+
+        :param cypher: The Cypher query.
+        :type cypher: str
+        :return: The result rows.
+        :rtype: List[Dict]
+        """
+        record("cypher_queries")
+        with timed("cypher_seconds"):
+            if self.max_rows is None:
+                return self.pool.execute(cypher)
+            rows = self.pool.stream(inject_limit(cypher, self.max_rows))
+            try:
+                client_results = list(islice(rows, self.max_rows))
+                if next(rows, None) is not None:
+                    self.logger.warning(f"Cypher query results truncated to {self.max_rows} rows: {cypher}")
+            finally:
+                rows.close()
+            return client_results
+
+    def run_query(self, cypher: str, fingerprint: str) -> List[Dict]:
+        """
+        Run a Cypher query, returning the cached rows if the query was already run against the same schema.
+        Empty results are not cached so that they can be retried.
+
+        :param cypher: The Cypher query.
+        :type cypher: str
+        :param fingerprint: The schema fingerprint.
+        :type fingerprint: str
+        :return: The result rows.
+        :rtype: List[Dict]
+        """
+        result_key = make_key(fingerprint, cypher, self.max_rows)
+        client_results = self.result_cache.get(result_key)
+        if client_results is not None:
+            self.logger.info(f"Using cached results for Cypher query: {cypher}")
+            record("result_cache_hits")
+            return client_results
+        client_results = self.fetch(cypher)
+        if client_results != []:
+            self.result_cache[result_key] = client_results
+        return client_results
+
+    def rank_candidates(self, responses: List[str]) -> List[str]:
+        """
+        Clean and deduplicate the candidate Cypher queries, ranking them by the number of responses that produced them.
+
+        :param responses: The responses of the language model.
+        :type responses: List[str]
+        :return: The distinct Cypher queries, most frequent first.
+        :rtype: List[str]
+        """
+        counts = {}
+        for response in responses:
+            cypher = self.clean_response(response)
+            if cypher != "":
+                counts[cypher] = counts.get(cypher, 0) + 1
+        # sorted is stable, so ties keep the order of the responses
+        return sorted(counts, key=lambda cypher: -counts[cypher])
+
+    def validate_concurrently(self, candidates: List[str], fingerprint: str, statement: str) -> Tuple[List[Dict], str]:
+        """
+        Run the candidate Cypher queries concurrently, each on its own pooled connection.
+        Each candidate gets query_timeout seconds from the moment it starts, after which it is cancelled
+        and its connection closed.
+        In "first" mode the first non-empty result is returned and the remaining candidates are cancelled.
+        In "merge" mode the distinct rows of all non-empty results are returned, in the order of the candidates' ranks.
+
+        :param candidates: The ranked candidate Cypher queries.
+        :type candidates: List[str]
+        :param fingerprint: The schema fingerprint.
+        :type fingerprint: str
+        :param statement: The knowledge request, for logging.
+        :type statement: str
+        :return: The result rows and the Cypher query that produced them (the best ranked one when merging).
+        :rtype: Tuple[List[Dict], str]
+        """
+        if candidates == []:
+            return [], ""
+        max_workers = max(1, min(self.max_concurrent_queries, len(candidates)))
+        # Each candidate runs under its own cancellation event, set when its query times out, when another
+        # candidate wins or when the question is cancelled. The pool then closes the candidate's connection,
+        # which makes the database abort the query.
+        events = [threading.Event() for cypher in candidates]
+        question_event = get_cancellation_event()
+
+        def run_candidate(rank, cypher):
+            event = events[rank]
+            if event.is_set():
+                raise OperationCancelled()
+            timer = None
+            if self.query_timeout:
+                def expire():
+                    self.logger.error(f"Candidate Cypher query timed out after {self.query_timeout} seconds for statement: {statement}, response: {cypher}")
+                    event.set()
+
+                timer = threading.Timer(self.query_timeout, expire)
+                timer.daemon = True
+                timer.start()
+            token = set_cancellation_event(event)
+            try:
+                self.logger.info(f"Executing client for statement: {statement}, response: {cypher}")
+                return self.run_query(cypher, fingerprint)
+            finally:
+                reset_cancellation_event(token)
+                if timer is not None:
+                    timer.cancel()
+
+        results = [[] for cypher in candidates]
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {executor.submit(bind_cancellation(run_candidate), rank, cypher): rank for rank, cypher in enumerate(candidates)}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                if question_event is not None and question_event.is_set():
+                    raise OperationCancelled()
+                for future in done:
+                    rank = futures[future]
+                    try:
+                        results[rank] = future.result()
+                    except OperationCancelled:
+                        continue
+                    except Exception as e:
+                        self.logger.error(f"Error in client_results: {e}, for candidate {rank}")
+                        continue
+                    if self.validation == "first" and results[rank] != []:
+                        return results[rank], candidates[rank]
+        finally:
+            # cancel the candidates still queued or running, closing their connections
+            for event in events:
+                event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        client_results = []
+        response = ""
+        seen = set()
+        for rank, rows in enumerate(results):
+            if rows == []:
+                continue
+            if response == "":
+                response = candidates[rank]
+            for row in rows:
+                if repr(row) not in seen:
+                    seen.add(repr(row))
+                    client_results.append(row)
+        return client_results, response
+
+    def execute(self, lm, query, statement):
+        check_cancelled()
+        fingerprint = self.schema_fingerprint()
+        statement_key = make_key(fingerprint, normalize_statement(statement))
+        cached_response = self.cache.get(statement_key)
+        if cached_response is not None:
+            try:
+                client_results = self.run_query(cached_response, fingerprint)
+                if client_results != []:
+                    self.logger.info(f"Graph Client results from cached Cypher query for statement: {statement}, response: {cached_response}")
+                    record("cypher_cache_hits")
+                    record("rows", len(client_results))
+                    return client_results, cached_response
+            except Exception as e:
+                self.logger.error(f"Error in cached Cypher query: {e}")
+
+        num_responses = self.num_responses
+        response = ''
+        responses_hash = set()
+        client_results = []
+        iter = 0
+        responses = lm.get_response_texts(
+            lm.query(query, num_responses=num_responses)
+        )
+        if self.validation in ("first", "merge"):
+            client_results, response = self.validate_concurrently(self.rank_candidates(responses), fingerprint, statement)
+            if client_results != []:
+                self.cache[statement_key] = response
+            self.logger.info(f"Graph Client results: {client_results}")
+            record("rows", len(client_results))
+            return client_results, response
+
+        empty_responses = True
+        while iter < num_responses and empty_responses:
+            try:
+                response = responses[iter]
+                iter += 1
+                # Check if the response is in the hash set
+                if response in responses_hash:
+                    continue
+                responses_hash.add(response)
+                response = self.clean_response(response)
+                if response == "":
+                    continue
+
+                self.logger.info(f"Executing client for statement: {statement}, response: {response}")
+                client_results = self.run_query(response, fingerprint)
+                if client_results != []:
+                    empty_responses = False
+                    self.cache[statement_key] = response
+
+            except Exception as e:
+                self.logger.error(f"Error in client_results: {e}, trying again {iter}")
+        self.logger.info(f"Graph Client results: {client_results}")
+        record("rows", len(client_results))
+
+        return client_results, response
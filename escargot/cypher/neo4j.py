@@ -1,27 +1,13 @@
 from gqlalchemy import Neo4j
-import os
-from typing import Dict
-import json
 import logging
 
-class Neo4jClient:
-    def __init__(self, config_path, logger):
-        self.logger = logger
-        self.config: Dict = None
-        if type(config_path) == dict:
-            self.config = config_path
-        else:
-            self.load_config(config_path)
-        if "neo4j" not in self.config:
-            self.client = None
-        else:
-            self.config: Dict = self.config["neo4j"]
-            self.host = self.config["host"]
-            self.port = self.config["port"]
-            self.client = Neo4j(host=self.host, port=self.port)
-            self.num_responses = 7
-            self.cache = {}
-            self.schema = None
+from escargot.cypher.graph_client import GraphClient
+
+class Neo4jClient(GraphClient):
+    config_key = "neo4j"
+
+    def connect(self):
+        return Neo4j(host=self.host, port=self.port)
 
     def get_schema(self):
         SCHEMA_QUERY = """
@@ -65,89 +51,3 @@ class Neo4jClient:
             ]
         )
         return (", ").join(node_names), ("\n").join(relationship_names)
-
-    def load_config(self, path: str) -> None:
-        """
-        Load configuration from a specified path.
-
-        :param path: Path to the config file. If an empty path provided,
-                     default is `config.json` in the current directory.
-        :type path: str
-        """
-        if path == "":
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            path = os.path.join(current_dir, "config.json")
-
-        with open(path, "r") as f:
-            self.config = json.load(f)
-
-    def clear_cache(self) -> None:
-        """
-        Clear the response cache.
-        """
-        self.cache = {}
-
-    def execute(self, lm, query, statement):
-        # if statement in self.cache:
-        #     results = self.cache[statement][1]
-        # else:
-            num_responses = self.num_responses
-            response = ''
-            responses_hash = set()
-            client_results = []
-            iter = 0
-            responses = lm.get_response_texts(
-                lm.query(query, num_responses=num_responses)
-            )
-            empty_responses = True
-            while iter < num_responses and empty_responses:
-                try:
-                    response = responses[iter]
-                    iter += 1
-                    # Check if the response is in the hash set
-                    if response in responses_hash:
-                        continue
-                    responses_hash.add(response)
-                    # Remove "Answer:" from the response
-                    if response.startswith("Answer:"):
-                        response= response[8:].strip()
-                    
-                    if response == "" or response == None:
-                        continue
-                    #remove ```cypher from the response
-                    response = response.replace("```cypher", "")
-
-                    #remove ``` from anywhere in the response
-                    response = response.replace("```", "")
-
-                    #remove \n from the response
-                    response = response.replace("\n", " ")
-
-                    #TODO: tweak if necessary. Get rid of directionality in the response
-                    response = response.replace("<-", "-")
-                    response = response.replace("->", "-")
-                    
-                    self.logger.info(f"Executing client for statement: {statement}, response: {response}")
-                    client_results = self.client.execute_and_fetch(response)
-                    client_results = list(client_results)
-                    if client_results != []:
-                        empty_responses = False
-                        
-                except Exception as e:
-                    self.logger.error(f"Error in client_results: {e}, trying again {iter}")
-            self.logger.info(f"Graph Client results: {client_results}")
-            # results = []
-            # # get the value in the dictionary x in memgraph_results
-            # for value in memgraph_results:
-            #     for key, val in value.items():
-            #         if val != [] and val != None and val != "":
-            #             if type(val) == list:
-            #                 for v in val:
-            #                     results.append(v)
-            #             else:
-            #                 results.append(val)
-            # #get unique values
-            # results = list(set(results))
-            # self.cache[statement] = [response,results]
-
-            return client_results, response
\ No newline at end of file
@@ -2,14 +2,18 @@ import os
 import escargot.language_models as language_models
 import logging
 import io
+import asyncio
+import copy
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from escargot import operations
 import escargot.controller as controller
 import escargot.memory as memory
 
 #vectorized knowledge
 from escargot.vector_db.weaviate import WeaviateClient
+from escargot.vector_db.local import LocalVectorClient
 
 from escargot.parser import ESCARGOTParser
 from escargot.prompter import ESCARGOTPrompter
@@ -19,21 +23,52 @@ from escargot.coder import Coder
 import escargot.cypher.memgraph as memgraph
 import escargot.cypher.neo4j as neo4j
 
+from escargot.cache import PlanCache, build_cache
+from escargot.metrics import MetricsRecorder, JSONLSink, PrometheusSink
+from escargot.utils import bind_cancellation
+
 import dill as pickle
-from typing import Optional
+from typing import Dict, Iterator, List, Optional
 
 class Escargot:
 
-    def __init__(self, config: str, node_types:str = "", relationship_types:str = "", model_name: str = "azuregpt35-16k"):
+    def __init__(self, config: str, node_types:str = "", relationship_types:str = "", model_name: str = "azuregpt35-16k", write_behind: bool = True, aask_workers: int = 32):
         logger = logging.getLogger(__name__)
         self.logger = logger
         self.log = ""
+        # Summarize and store the answers in memory in the background instead of before returning them
+        self.write_behind = write_behind
+        # Threads running the blocking operations of the questions awaited with aask, started on first use
+        self.aask_workers = aask_workers
+        self.aask_executor = None
+        self.aask_executor_lock = threading.Lock()
+        # Knowledge extracted per knowledge request, shared by all the questions
+        knowledge_cache_config = config.get("knowledge_cache", {}) if type(config) == dict else {}
+        self.knowledge_cache = None
+        if knowledge_cache_config.get("enabled", True):
+            self.knowledge_cache = build_cache(knowledge_cache_config, "cache")
+        # Steps of answered questions per question shape, shared by all the questions
+        plan_cache_config = config.get("plan_cache", {}) if type(config) == dict else {}
+        self.plan_cache = None
+        if plan_cache_config.get("enabled", True):
+            self.plan_cache = PlanCache(build_cache(plan_cache_config, "cache"))
+        # Sinks the metrics of every question are emitted to, besides the summary attached to its result
+        metrics_config = config.get("metrics", {}) if type(config) == dict else {}
+        self.metrics_sinks = []
+        if metrics_config.get("jsonl_path"):
+            self.metrics_sinks.append(JSONLSink(metrics_config["jsonl_path"]))
+        if metrics_config.get("prometheus_path"):
+            self.metrics_sinks.append(PrometheusSink(metrics_config["prometheus_path"], metrics_config.get("prometheus_prefix", "escargot")))
+        self.last_metrics = None
         if 'ollama' in config:
             self.lm = language_models.Ollama(config, model_name=model_name, logger=logger)
         if 'azuregpt' in config:
             self.lm = language_models.AzureGPT(config, model_name=model_name, logger=logger)
-        self.vdb = WeaviateClient(config, self.logger)
-        self.memory = memory.Memory(self.lm)
+        if "local_vector" in config:
+            self.vdb = LocalVectorClient(config, self.logger)
+        else:
+            self.vdb = WeaviateClient(config, self.logger)
+        self.memory = memory.get_memory(self.lm)
         self.node_types = ""
         self.relationship_types = ""
         self.question = ""
@@ -90,63 +125,117 @@ class Escargot:
         self.logger.removeHandler(f_handler)
         f_handler.close()
 
-    def _ask_worker(self, question, answer_type, num_strategies, memory_name, max_run_tries, result_container, exception_container, cancellation_event, max_tokens):
-        # Logger is managed by the main 'ask' function thread
+    def _create_metrics(self, question):
+        return MetricsRecorder(self.metrics_sinks, labels={"question": question})
+
+    def _finish_metrics(self, metrics):
+        """
+        Flush the sinks of the metrics of a question and summarize them.
+        """
         try:
-            # Create the Controller
-            def create_initial_graph() -> operations.GraphOfOperations:
-                operations_graph = operations.GraphOfOperations()
-                instruction_node = operations.Generate(1, 1)
-                operations_graph.append_operation(instruction_node)
-                return operations_graph
+            metrics.close()
+        except Exception as e:
+            self.logger.error(f"Failed to flush the metrics: {e}")
+        return metrics.summary()
 
-            initial_graph = create_initial_graph()
+    def _create_controller(self, question, answer_type, num_strategies, max_run_tries, cancellation_event = None, max_tokens = None, max_workers = 1, lm = None, speculative = False, method = "got", metrics = None):
+        if lm is None:
+            lm = self.lm
+        def create_initial_graph() -> operations.GraphOfOperations:
+            operations_graph = operations.GraphOfOperations()
+            instruction_node = operations.Generate(1, 1)
+            operations_graph.append_operation(instruction_node)
+            return operations_graph
 
-            self.controller = controller.Controller(
-                 self.lm,
-                 initial_graph,
-                 ESCARGOTPrompter(graph_client = self.graph_client,vector_db = self.vdb, lm=self.lm,node_types=self.node_types,relationship_types=self.relationship_types, logger = self.logger),
-                 ESCARGOTParser(self.logger),
-                 self.logger,
-                 Coder(),
-                 {
-                     "question": question,
-                     "input": "",
-                     "phase": "planning",
-                     "method" : "got",
-                     "num_branches_response": num_strategies,
-                     "answer_type": answer_type
-                 },
-                 cancellation_event=cancellation_event, # Pass the event
-                 max_tokens=max_tokens # Pass max_tokens limit
-            )
-            self.controller.max_run_tries = max_run_tries
+        initial_graph = create_initial_graph()
+
+        question_controller = controller.Controller(
+             lm,
+             initial_graph,
+             ESCARGOTPrompter(graph_client = self.graph_client,vector_db = self.vdb, lm=lm,node_types=self.node_types,relationship_types=self.relationship_types, logger = self.logger, knowledge_cache = self.knowledge_cache, plan_cache = self.plan_cache),
+             ESCARGOTParser(self.logger),
+             self.logger,
+             Coder(),
+             {
+                 "question": question,
+                 "input": "",
+                 "phase": "planning",
+                 "method" : method,
+                 # the fast method plans and writes the steps in a single response
+                 "num_branches_response": num_strategies if method == "got" else 1,
+                 # the number of plans if the fast method falls back to the got method
+                 "num_strategies": num_strategies,
+                 "answer_type": answer_type,
+                 "speculative": speculative
+             },
+             cancellation_event=cancellation_event, # Pass the event
+             max_tokens=max_tokens, # Pass max_tokens limit
+             max_workers=max_workers,
+             metrics=metrics
+        )
+        question_controller.max_run_tries = max_run_tries
+        return question_controller
+
+    def _get_output(self, question_controller, answer_type):
+        output = ""
+        if question_controller.final_thought is not None:
+            if answer_type == 'natural':
+                output = question_controller.final_thought.state['input']
+            elif answer_type == 'array':
+                # output = list(list(self.controller.coder.step_output.values())[-1].values())[-1] # Original line commented out for safety, assuming the next line is the intended one
+                output = list(question_controller.coder.step_output.values())[-1]
+        return output
+
+    def _summary_prompt(self, question, output):
+        return f"Summarize the key information derived from answering the question: '{question}' with the answer: '{str(output)[:500]}...'. If the answer seems like complex data (list, dict), describe what the data represents rather than listing it."
+
+    def _store_summary(self, question_memory, summary, output, answer_type):
+        if answer_type == 'natural':
+            question_memory.store_memory(text=summary)
+            self.logger.error(f"Stored natural language summary in memory for collection '{question_memory.collection_name}'.")
+        else: # Handles 'array' and potentially other non-natural types
+            question_memory.store_memory(text=summary, data=output)
+            self.logger.error(f"Stored summary with pickled data in memory for collection '{question_memory.collection_name}'.")
+
+    def _remember(self, question_memory, question, output, answer_type, lm = None):
+        """
+        Summarize an answer and store it in memory, in the background if write_behind is set.
+        """
+        if lm is None:
+            lm = self.lm
+        if self.write_behind:
+            data = None if answer_type == 'natural' else output
+            # the memory may be shared with other instances, so the answer carries the language model that summarizes it
+            question_memory.get_writer(self.lm, self.logger).submit(self._summary_prompt(question, output), data, lm=lm)
+            return
+        summary = lm.get_response_texts(
+            lm.query(self._summary_prompt(question, output), num_responses=1)
+        )[0]
+        self._store_summary(question_memory, summary, output, answer_type)
+
+    def flush_memory(self):
+        """
+        Wait until the answers queued for memory are stored, and save the memory graph.
+        """
+        if self.memory is not None:
+            self.memory.flush()
+
+    def _ask_worker(self, question, answer_type, num_strategies, memory_name, max_run_tries, result_container, exception_container, cancellation_event, max_tokens, max_workers, speculative = False, method = "got", metrics = None):
+        # Logger is managed by the main 'ask' function thread
+        try:
+            # Create the Controller
+            self.controller = self._create_controller(question, answer_type, num_strategies, max_run_tries, cancellation_event, max_tokens, max_workers, speculative = speculative, method = method, metrics = metrics)
             self.controller.run() # This is the potentially long-running part
 
             self.operations_graph = self.controller.graph.operations
-            output = ""
-            if self.controller.final_thought is not None:
-                if answer_type == 'natural':
-                    output = self.controller.final_thought.state['input']
-                elif answer_type == 'array':
-                    # output = list(list(self.controller.coder.step_output.values())[-1].values())[-1] # Original line commented out for safety, assuming the next line is the intended one
-                    output = list(self.controller.coder.step_output.values())[-1]
-
+            output = self._get_output(self.controller, answer_type)
 
             self.logger.warning(f"Output: {output}")
 
             # Generate and store summary in memory if output was successful
             if output:
                 try:
-                    summary_prompt = f"Summarize the key information derived from answering the question: '{question}' with the answer: '{str(output)[:500]}...'. If the answer seems like complex data (list, dict), describe what the data represents rather than listing it."
-                    summary = self.quick_chat(summary_prompt) # Use quick_chat for summarization
-
-                    if answer_type == 'natural':
-                        self.memory.store_memory(text=summary)
-                        self.logger.error(f"Stored natural language summary in memory for collection '{self.memory.collection_name}'.")
-                    else: # Handles 'array' and potentially other non-natural types
-                        self.memory.store_memory(text=summary, data=output)
-                        self.logger.error(f"Stored summary with pickled data in memory for collection '{self.memory.collection_name}'.")
+                    self._remember(self.memory, question, output, answer_type)
                 except Exception as e:
                     self.logger.error(f"Failed to generate or store summary in memory: {e}")
 
@@ -164,7 +253,7 @@ class Escargot:
     #1: output, instructions, and exceptions
     #2: output, instructions, exceptions, and debug info
     #3: output, instructions, exceptions, debug info, and LLM output
-    def ask(self, question, answer_type = 'natural', num_strategies=3, debug_level = 0, memory_name = "default", max_run_tries = 3, timeout: Optional[int] = 120, max_tokens: Optional[int] = None):
+    def ask(self, question, answer_type = 'natural', num_strategies=3, debug_level = 0, memory_name = "default", max_run_tries = 3, timeout: Optional[int] = 120, max_tokens: Optional[int] = None, max_workers: int = 1, speculative: bool = False, method: str = "got", return_metrics: bool = False):
         """
         Ask a question and get an answer with an optional timeout.
 
@@ -184,11 +273,19 @@ class Escargot:
         :type timeout: Optional[int]
         :param max_tokens: Maximum total tokens (prompt + completion) allowed. Defaults to None (no limit).
         :type max_tokens: Optional[int]
-        :return: The answer, or a message indicating timeout, token limit exceeded, or error.
-        :rtype: str or list (depending on answer_type) or str (status/error message)
+        :param max_workers: Number of threads used to execute independent steps concurrently. Defaults to 1 (sequential).
+        :type max_workers: int
+        :param speculative: Whether to convert every candidate plan to Python while the plans are assessed, trading tokens for latency. Defaults to False.
+        :type speculative: bool
+        :param method: "got" to plan with num_strategies branches that are assessed and converted step by step, or "fast" to plan and write the steps in a single prompt, falling back to "got" if the response cannot be parsed. Defaults to "got".
+        :type method: str
+        :param return_metrics: Whether to return the metrics of the question along with the answer. They are kept in last_metrics either way. Defaults to False.
+        :type return_metrics: bool
+        :return: The answer, or a message indicating timeout, token limit exceeded, or error, followed by the metrics if return_metrics is True.
+        :rtype: str or list (depending on answer_type) or str (status/error message), or a tuple of it and a Dict
         """
 
-        self.memory = memory.Memory(self.lm, collection_name = memory_name)
+        self.memory = memory.get_memory(self.lm, memory_name)
         #setup logger
         log_stream, c_handler, f_handler = self.setup_logger(debug_level)
 
@@ -196,10 +293,12 @@ class Escargot:
         result_container = []
         exception_container = []
         cancellation_event = threading.Event() # Create the event
+        metrics = self._create_metrics(question)
 
         worker_thread = threading.Thread(
-            target=self._ask_worker,
-            args=(question, answer_type, num_strategies, memory_name, max_run_tries, result_container, exception_container, cancellation_event, max_tokens), # Pass event and max_tokens to worker
+            # the worker inherits the context of the caller, e.g. a retry of the question
+            target=bind_cancellation(self._ask_worker),
+            args=(question, answer_type, num_strategies, memory_name, max_run_tries, result_container, exception_container, cancellation_event, max_tokens, max_workers, speculative, method, metrics), # Pass event and max_tokens to worker
             daemon=True # Set thread as daemon so it doesn't block program exit if main thread finishes
         )
 
@@ -215,9 +314,8 @@ class Escargot:
 
         if timed_out:
             self.logger.error(f"Timeout reached after {timeout} seconds for question: '{question}'")
-            # Note: Without a cooperative cancellation mechanism in Controller,
-            # the thread might continue running in the background even after timeout is reported.
-            # The daemon=True setting helps ensure it doesn't prevent program exit.
+            # The language model, graph and code calls in flight see the event and stop within a fraction of a second;
+            # abandoned requests end with their request timeout. The daemon=True setting ensures the thread doesn't prevent program exit.
             cancellation_event.set() # Signal the worker thread to stop
             final_output = f"Timeout occurred after {timeout} seconds."
         else:
@@ -243,14 +341,236 @@ class Escargot:
         # Finalize logger regardless of outcome
         self.finalize_logger(log_stream, c_handler, f_handler)
 
+        # On timeout, the operations finished before the cancellation are summarized
+        self.last_metrics = self._finish_metrics(metrics)
+        if return_metrics:
+            return final_output, self.last_metrics
         return final_output
     
+    async def aask(self, question, answer_type = 'natural', num_strategies=3, debug_level = 0, memory_name = "default", max_run_tries = 3, timeout: Optional[int] = 120, max_tokens: Optional[int] = None, max_workers: int = 1, executor = None, speculative: bool = False, method: str = "got", return_metrics: bool = False):
+        """
+        Asynchronously ask a question and get an answer with an optional timeout.
+        The operations of the question are blocking: they call the blocking language model API (query, get_embeddings),
+        the graph and vector databases and the generated code, so each one runs on a thread of the executor while the
+        event loop awaits it. Unlike ask, no thread is held by a question between its operations, but the number
+        of operations in flight across all the questions is bounded by the size of the executor (aask_workers).
+        Only the summary of the answer is requested with aquery, when write_behind is False.
+
+        :param question: The question to ask.
+        :type question: str
+        :param answer_type: The type of answer to expect. Defaults to 'natural'. Options are 'natural', 'array'.
+        :type answer_type: str
+        :param num_strategies: The number of strategies to generate. Defaults to 3.
+        :type num_strategies: int
+        :param debug_level: Debug level (0=Error, 1=Warning, 2=Info, 3=Debug). Defaults to 0.
+            The logger is shared, so questions awaited concurrently log at the level of the last one started.
+        :type debug_level: int
+        :param memory_name: Name of the memory collection. Defaults to "default".
+        :type memory_name: str
+        :param max_run_tries: Maximum attempts for controller runs. Defaults to 3.
+        :type max_run_tries: int
+        :param timeout: Maximum time in seconds to wait for an answer. Defaults to 120. If <= 0 or None, no timeout.
+        :type timeout: Optional[int]
+        :param max_tokens: Maximum total tokens (prompt + completion) allowed. Defaults to None (no limit).
+        :type max_tokens: Optional[int]
+        :param max_workers: Number of independent steps executed concurrently. Defaults to 1 (sequential).
+        :type max_workers: int
+        :param executor: The executor in which the blocking operations run. Defaults to None (a thread pool of aask_workers threads shared by all the questions).
+        :type executor: Optional[concurrent.futures.Executor]
+        :param speculative: Whether to convert every candidate plan to Python while the plans are assessed, trading tokens for latency. Defaults to False.
+        :type speculative: bool
+        :param method: "got" to plan with num_strategies branches that are assessed and converted step by step, or "fast" to plan and write the steps in a single prompt, falling back to "got" if the response cannot be parsed. Defaults to "got".
+        :type method: str
+        :param return_metrics: Whether to return the metrics of the question along with the answer. They are kept in last_metrics either way. Defaults to False.
+        :type return_metrics: bool
+        :return: The answer, or a message indicating timeout, token limit exceeded, or error, followed by the metrics if return_metrics is True.
+        :rtype: str or list (depending on answer_type) or str (status/error message), or a tuple of it and a Dict
+        """
+        if executor is None:
+            executor = self._get_aask_executor()
+        log_stream, c_handler, f_handler = self.setup_logger(debug_level)
+        try:
+            loop = asyncio.get_running_loop()
+            question_memory = await loop.run_in_executor(executor, memory.get_memory, self.lm, memory_name)
+            cancellation_event = threading.Event()
+            metrics = self._create_metrics(question)
+            question_controller = self._create_controller(question, answer_type, num_strategies, max_run_tries, cancellation_event, max_tokens, max_workers, speculative = speculative, method = method, metrics = metrics)
+            output = await self._arun(question, answer_type, question_controller, question_memory, cancellation_event, timeout, max_tokens, executor)
+            self.last_metrics = self._finish_metrics(metrics)
+        finally:
+            self.finalize_logger(log_stream, c_handler, f_handler)
+        if return_metrics:
+            return output, self.last_metrics
+        return output
+
+    def _get_aask_executor(self):
+        """
+        Get the thread pool running the operations of the questions awaited with aask, starting it on first use.
+        It is sized independently of the default executor of the event loop, which is smaller by default.
+        """
+        with self.aask_executor_lock:
+            if self.aask_executor is None:
+                self.aask_executor = ThreadPoolExecutor(max_workers=max(1, self.aask_workers), thread_name_prefix="escargot-aask")
+            return self.aask_executor
+
+    async def _arun(self, question, answer_type, question_controller, question_memory, cancellation_event, timeout, max_tokens, executor):
+        """
+        Run the controller of a question for aask and return its answer, or a message indicating timeout, token limit exceeded, or error.
+        """
+        effective_timeout = timeout if timeout is not None and timeout > 0 else None
+        try:
+            await asyncio.wait_for(question_controller.arun(executor), timeout=effective_timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(f"Timeout reached after {timeout} seconds for question: '{question}'")
+            cancellation_event.set() # Signal the operations still in flight to stop
+            return f"Timeout occurred after {timeout} seconds."
+        except Exception as e:
+            self.logger.error("Error executing controller: %s", e, exc_info=True)
+            return f"An error occurred during execution: {e}"
+        finally:
+            self.controller = question_controller
+            self.operations_graph = question_controller.graph.operations
+
+        if question_controller.final_thought is not None and question_controller.final_thought.state.get("phase") == "token_limit_exceeded":
+            self.logger.error(f"Token limit ({max_tokens}) exceeded.")
+            return f"Operation cancelled: Token limit ({max_tokens}) exceeded."
+
+        output = self._get_output(question_controller, answer_type)
+        self.logger.warning(f"Output: {output}")
+
+        # Generate and store summary in memory if output was successful
+        if output:
+            loop = asyncio.get_running_loop()
+            try:
+                if self.write_behind:
+                    await loop.run_in_executor(executor, self._remember, question_memory, question, output, answer_type)
+                else:
+                    summary = self.lm.get_response_texts(
+                        await self.lm.aquery(self._summary_prompt(question, output), num_responses=1)
+                    )[0]
+                    await loop.run_in_executor(executor, self._store_summary, question_memory, summary, output, answer_type)
+            except Exception as e:
+                self.logger.error(f"Failed to generate or store summary in memory: {e}")
+
+        return output
+
+    def _copy_lm(self):
+        """
+        Copy the language model with its own token counters. The copy shares the client and the caches.
+        """
+        lm = copy.copy(self.lm)
+        lm.prompt_tokens = 0
+        lm.completion_tokens = 0
+        lm.cost = 0.0
+        lm.usage_lock = threading.Lock()
+        return lm
+
+    def _ask_one(self, index, question, answer_type, num_strategies, max_run_tries, timeout, max_tokens, max_workers, speculative = False, method = "got") -> Dict:
+        """
+        Answer one question of ask_many with its own language model counters, cancelling it after the timeout.
+        """
+        lm = self._copy_lm()
+        cancellation_event = threading.Event()
+        result = {"index": index, "question": question, "output": None, "error": None}
+        timer = None
+        if timeout is not None and timeout > 0:
+            timer = threading.Timer(timeout, cancellation_event.set)
+            timer.daemon = True
+            timer.start()
+        metrics = self._create_metrics(question)
+        start_time = time.time()
+        try:
+            question_controller = self._create_controller(question, answer_type, num_strategies, max_run_tries, cancellation_event, max_tokens, max_workers, lm, speculative, method, metrics)
+            question_controller.run()
+            final_thought_phase = question_controller.final_thought.state.get("phase") if question_controller.final_thought else None
+            if final_thought_phase == "cancelled":
+                self.logger.error(f"Timeout reached after {timeout} seconds for question: '{question}'")
+                result["error"] = f"Timeout occurred after {timeout} seconds."
+            elif final_thought_phase == "token_limit_exceeded":
+                self.logger.error(f"Token limit ({max_tokens}) exceeded for question: '{question}'")
+                result["error"] = f"Operation cancelled: Token limit ({max_tokens}) exceeded."
+            else:
+                output = self._get_output(question_controller, answer_type)
+                self.logger.warning(f"Output: {output}")
+                result["output"] = output
+                if output:
+                    try:
+                        self._remember(self.memory, question, output, answer_type, lm)
+                    except Exception as e:
+                        self.logger.error(f"Failed to generate or store summary in memory: {e}")
+        except Exception as e:
+            self.logger.error("Error executing controller for question '%s': %s", question, e, exc_info=True)
+            result["error"] = f"An error occurred during execution: {e}"
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self.lm.update_usage(lm.prompt_tokens, lm.completion_tokens)
+        result["prompt_tokens"] = lm.prompt_tokens
+        result["completion_tokens"] = lm.completion_tokens
+        result["cost"] = lm.cost
+        result["time"] = time.time() - start_time
+        result["metrics"] = self._finish_metrics(metrics)
+        return result
+
+    def ask_many(self, questions: List[str], answer_type = 'natural', num_strategies=3, debug_level = 0, memory_name = "default", max_run_tries = 3, timeout: Optional[int] = 120, max_tokens: Optional[int] = None, max_workers: int = 1, concurrency: int = 4, speculative: bool = False, method: str = "got") -> Iterator[Dict]:
+        """
+        Ask several questions concurrently, yielding the result of each question as soon as it finishes.
+        The language model, graph and vector database clients and the memory are shared by all the questions.
+
+        Each result is a dictionary with the keys "index" (position of the question in questions), "question",
+        "output" (the answer, or None if the question failed), "error" (None, or a message indicating timeout,
+        token limit exceeded or error), "prompt_tokens", "completion_tokens", "cost", "time" (in seconds) and "metrics"
+        (the per-phase, per-knowledge-request and per-step metrics, as in last_metrics after ask).
+
+        :param questions: The questions to ask.
+        :type questions: List[str]
+        :param answer_type: The type of answer to expect. Defaults to 'natural'. Options are 'natural', 'array'.
+        :type answer_type: str
+        :param num_strategies: The number of strategies to generate. Defaults to 3.
+        :type num_strategies: int
+        :param debug_level: Debug level (0=Error, 1=Warning, 2=Info, 3=Debug). Defaults to 0.
+        :type debug_level: int
+        :param memory_name: Name of the memory collection. Defaults to "default".
+        :type memory_name: str
+        :param max_run_tries: Maximum attempts for controller runs. Defaults to 3.
+        :type max_run_tries: int
+        :param timeout: Maximum time in seconds to answer each question. Defaults to 120. If <= 0 or None, no timeout.
+        :type timeout: Optional[int]
+        :param max_tokens: Maximum total tokens (prompt + completion) allowed per question. Defaults to None (no limit).
+        :type max_tokens: Optional[int]
+        :param max_workers: Number of threads used to execute independent steps of a question concurrently. Defaults to 1.
+        :type max_workers: int
+        :param concurrency: Number of questions answered concurrently. Defaults to 4.
+        :type concurrency: int
+        :param speculative: Whether to convert every candidate plan to Python while the plans are assessed, trading tokens for latency. Defaults to False.
+        :type speculative: bool
+        :param method: "got" to plan with num_strategies branches that are assessed and converted step by step, or "fast" to plan and write the steps in a single prompt, falling back to "got" if the response cannot be parsed. Defaults to "got".
+        :type method: str
+        :return: The results, in the order in which the questions finish.
+        :rtype: Iterator[Dict]
+        """
+        self.memory = memory.get_memory(self.lm, memory_name)
+        log_stream, c_handler, f_handler = self.setup_logger(debug_level)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        try:
+            futures = [
+                executor.submit(bind_cancellation(self._ask_one), index, question, answer_type, num_strategies, max_run_tries, timeout, max_tokens, max_workers, speculative, method)
+                for index, question in enumerate(questions)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Questions not started yet are dropped if the caller stops iterating
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.finalize_logger(log_stream, c_handler, f_handler)
+
     def initialize_controller(self, question, answer_type = 'natural', num_strategies=3, debug_level = 0, memory_name = "default", max_run_tries = 3):
         if self.controller is not None:
             del self.controller
             self.controller = None
 
-        self.memory = memory.Memory(self.lm, collection_name = memory_name)
+        self.memory = memory.get_memory(self.lm, memory_name)
 
         #setup logger
         log_stream, c_handler, f_handler = self.setup_logger(debug_level)
@@ -269,7 +589,7 @@ class Escargot:
             self.controller = controller.Controller(
                 self.lm, 
                 got, 
-                ESCARGOTPrompter(graph_client = self.graph_client,vector_db = self.vdb, lm=self.lm,node_types=self.node_types,relationship_types=self.relationship_types, logger = self.logger),
+                ESCARGOTPrompter(graph_client = self.graph_client,vector_db = self.vdb, lm=self.lm,node_types=self.node_types,relationship_types=self.relationship_types, logger = self.logger, knowledge_cache = self.knowledge_cache, plan_cache = self.plan_cache),
                 ESCARGOTParser(self.logger),
                 self.logger,
                 Coder(),
@@ -314,16 +634,20 @@ class Escargot:
         else:
             return "No language model available."
         
-    def query_memory(self, query: str, max_results: int = 10, metadata: dict = None):
+    def query_memory(self, query, max_results: int = 10, metadata: dict = None, mode: str = "dense", time_window: Optional[tuple] = None):
         """
         Query the persistent memory collection.
 
-        :param query: The query string to search for in the memory.
-        :type query: str
+        :param query: The query string to search for in the memory, or a list of query strings.
+        :type query: Union[str, List[str]]
         :param max_results: The maximum number of results to return. Defaults to 10.
         :type max_results: int
         :param metadata: Optional metadata dictionary to filter results. Defaults to None.
         :type metadata: dict
+        :param mode: "dense" (embedding similarity), "keyword" (BM25) or "hybrid" (both, fused). Defaults to "dense".
+        :type mode: str
+        :param time_window: Optional (start, end) memory graph timestamps to restrict the results to. Defaults to None.
+        :type time_window: Optional[tuple]
         :return: The query results from the memory collection.
         :rtype: dict
         """
@@ -332,7 +656,9 @@ class Escargot:
             return None # Or return an empty dict: {"ids": [], "distances": []}
         
         try:
-            results = self.memory.query_collection(query, max_results=max_results, metadata=metadata)
+            # Include the answers still queued for memory
+            self.flush_memory()
+            results = self.memory.query_collection(query, max_results=max_results, metadata=metadata, mode=mode, time_window=time_window)
             self.logger.info(f"Queried memory collection '{self.memory.collection_name}' with '{query}'. Found {len(results.get('ids', [[]])[0])} results.")
             return results
         except Exception as e:
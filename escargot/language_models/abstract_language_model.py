@@ -8,9 +8,15 @@
 
 from abc import ABC, abstractmethod
 from typing import List, Dict, Union, Any
+import hashlib
 import json
 import os
 import logging
+import asyncio
+import threading
+from escargot.cache import build_cache, make_key, EmbeddingCache
+from escargot.utils import run_cancellable, is_retrying
+from escargot.metrics import record
 
 
 class AbstractLanguageModel(ABC):
@@ -29,21 +35,34 @@ class AbstractLanguageModel(ABC):
         :param model_name: Name of the language model. Defaults to "".
         :type model_name: str
         :param cache: Flag to determine whether to cache responses. Defaults to False.
+            Caching can also be enabled with the "cache" key of the model configuration, which can also set
+            "cache_size" (maximum number of entries), "cache_ttl" (seconds) and "cache_path" (SQLite file to persist the cache).
         :type cache: bool
         """
         self.logger = logger
         self.config: Dict = None
         self.model_name: str = model_name
-        self.cache = cache
-        if self.cache:
-            self.response_cache: Dict[str, List[Any]] = {}
         if type(config_path) == dict:
             self.config = config_path
         else:
             self.load_config(config_path)
+        model_config = self.config.get(model_name, {})
+        self.cache = cache or model_config.get("cache", False)
+        self.response_cache = build_cache(model_config) if self.cache else None
+        # Embeddings are deterministic, so they are always cached in memory.
+        # "embedding_cache_path" additionally persists them in a SQLite file.
+        self.embedding_cache = EmbeddingCache(
+            max_size=model_config.get("embedding_cache_size", 10000),
+            path=model_config.get("embedding_cache_path", None),
+        )
+        # The maximum number of texts sent in one embedding request.
+        self.embedding_batch_size: int = model_config.get("embedding_batch_size", 256)
+        # Seconds after which a request to the model is abandoned. Defaults to the timeout of the client library.
+        self.request_timeout: float = model_config.get("request_timeout", None)
         self.prompt_tokens: int = 0
         self.completion_tokens: int = 0
         self.cost: float = 0.0
+        self.usage_lock = threading.Lock()
 
     def load_config(self, path: str) -> None:
         """
@@ -62,11 +81,89 @@ class AbstractLanguageModel(ABC):
 
         self.logger.debug(f"Loaded config from {path} for {self.model_name}")
 
+    def update_usage(self, prompt_tokens: int, completion_tokens: int) -> None:
+        """
+        Add the tokens of a response to the token counts and update the cost.
+        Language models can be queried from several threads, so the counts are updated under a lock.
+        The call, its tokens and its cost are also recorded in the metrics of the current operation.
+
+        :param prompt_tokens: The number of prompt tokens of the response.
+        :type prompt_tokens: int
+        :param completion_tokens: The number of completion tokens of the response.
+        :type completion_tokens: int
+        """
+        with self.usage_lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            prompt_tokens_k = float(self.prompt_tokens) / 1000.0
+            completion_tokens_k = float(self.completion_tokens) / 1000.0
+            self.cost = (
+                self.prompt_token_cost * prompt_tokens_k
+                + self.response_token_cost * completion_tokens_k
+            )
+        record("llm_calls")
+        record("prompt_tokens", prompt_tokens)
+        record("completion_tokens", completion_tokens)
+        record("cost", (self.prompt_token_cost * prompt_tokens + self.response_token_cost * completion_tokens) / 1000.0)
+
     def clear_cache(self) -> None:
         """
         Clear the response cache.
         """
-        self.response_cache.clear()
+        if self.response_cache is not None:
+            self.response_cache.clear()
+
+    def get_cache_key(self, query: str, num_responses: int) -> str:
+        """
+        Get the key of a query in the response cache.
+        The key depends on the model, the temperature and the number of responses, as well as the query.
+
+        :param query: The query posed to the language model.
+        :type query: str
+        :param num_responses: The number of desired responses.
+        :type num_responses: int
+        :return: The cache key.
+        :rtype: str
+        """
+        return make_key(
+            getattr(self, "model_id", self.model_name),
+            getattr(self, "temperature", None),
+            num_responses,
+            hashlib.sha256(query.encode("utf-8")).hexdigest(),
+        )
+
+    def get_cached_response(self, query: str, num_responses: int) -> Any:
+        """
+        Get the cached response(s) to a query. Nothing is served to retries, which would otherwise get back
+        the response that failed; their new responses replace the cached ones.
+
+        :param query: The query posed to the language model.
+        :type query: str
+        :param num_responses: The number of desired responses.
+        :type num_responses: int
+        :return: The cached response(s), or None if caching is disabled, the current work is a retry or the query is not cached.
+        :rtype: Any
+        """
+        if not self.cache or is_retrying():
+            return None
+        response = self.response_cache.get(self.get_cache_key(query, num_responses))
+        if response is not None:
+            record("llm_cache_hits")
+        return response
+
+    def set_cached_response(self, query: str, num_responses: int, response: Any) -> None:
+        """
+        Cache the response(s) to a query if caching is enabled.
+
+        :param query: The query posed to the language model.
+        :type query: str
+        :param num_responses: The number of desired responses.
+        :type num_responses: int
+        :param response: The response(s) of the language model.
+        :type response: Any
+        """
+        if self.cache:
+            self.response_cache[self.get_cache_key(query, num_responses)] = response
 
     @abstractmethod
     def query(self, query: str, num_responses: int = 1) -> Any:
@@ -93,3 +190,139 @@ class AbstractLanguageModel(ABC):
         :rtype: List[str]
         """
         pass
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Abstract method to embed a batch of texts in one request, without caching.
+        It backs get_embeddings, which the memory and the vector databases use.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        pass
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Asynchronously embed a batch of texts in one request, without caching.
+        The default implementation runs embed in a worker thread.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        return await asyncio.to_thread(self.embed, texts)
+
+    def get_embedding_key(self, text: str) -> str:
+        """
+        Get the key of a text in the embedding cache.
+
+        :param text: The text to embed.
+        :type text: str
+        :return: The cache key.
+        :rtype: str
+        """
+        return make_key(getattr(self, "embedding_id", self.model_name), text)
+
+    def split_cached_embeddings(self, texts: List[str]):
+        """
+        Look up texts in the embedding cache.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings, with None for texts that are not cached, and the
+            distinct texts that are not cached mapped to their positions.
+        :rtype: Tuple[List[Optional[List[float]]], Dict[str, List[int]]]
+        """
+        embeddings = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            embedding = self.embedding_cache.get(self.get_embedding_key(text))
+            if embedding is None:
+                missing.setdefault(text, []).append(index)
+            else:
+                embeddings[index] = embedding
+        record("embedding_cache_hits", len(texts) - sum(len(indices) for indices in missing.values()))
+        return embeddings, missing
+
+    def fill_embeddings(self, embeddings: List, missing: Dict[str, List[int]], batch: List[str], batch_embeddings: List[List[float]]) -> None:
+        """
+        Cache the embeddings of a batch of texts and put them at the positions of the texts.
+        """
+        for text, embedding in zip(batch, batch_embeddings):
+            self.embedding_cache.set(self.get_embedding_key(text), embedding)
+            for index in missing[text]:
+                embeddings[index] = embedding
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, sending the texts that are not cached in batches of embedding_batch_size.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        embeddings, missing = self.split_cached_embeddings(texts)
+        missing_texts = list(missing)
+        for start in range(0, len(missing_texts), self.embedding_batch_size):
+            batch = missing_texts[start:start + self.embedding_batch_size]
+            self.fill_embeddings(embeddings, missing, batch, run_cancellable(self.embed, batch))
+        return embeddings
+
+    def get_embedding(self, text_to_embed: str) -> List[float]:
+        """
+        Embed a text, using the embedding cache.
+
+        :param text_to_embed: The text to embed.
+        :type text_to_embed: str
+        :return: The embedding of the text.
+        :rtype: List[float]
+        """
+        return self.get_embeddings([text_to_embed])[0]
+
+    async def aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Asynchronous counterpart of get_embeddings.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        embeddings, missing = self.split_cached_embeddings(texts)
+        missing_texts = list(missing)
+        for start in range(0, len(missing_texts), self.embedding_batch_size):
+            batch = missing_texts[start:start + self.embedding_batch_size]
+            self.fill_embeddings(embeddings, missing, batch, await self.aembed(batch))
+        return embeddings
+
+    async def aquery(self, query: str, num_responses: int = 1) -> Any:
+        """
+        Asynchronously query the language model.
+
+        The default implementation runs the blocking query in a worker thread.
+        Language models with an asynchronous client override it.
+
+        :param query: The query to be posed to the language model.
+        :type query: str
+        :param num_responses: The number of desired responses.
+        :type num_responses: int
+        :return: The language model's response(s).
+        :rtype: Any
+        """
+        return await asyncio.to_thread(self.query, query, num_responses)
+
+    async def aget_embedding(self, text_to_embed: str) -> List[float]:
+        """
+        Asynchronously embed a text, using the embedding cache.
+
+        :param text_to_embed: The text to embed.
+        :type text_to_embed: str
+        :return: The embedding of the text.
+        :rtype: List[float]
+        """
+        return (await self.aget_embeddings([text_to_embed]))[0]
@@ -4,11 +4,12 @@ import random
 import time
 from typing import List, Dict, Union
 import openai
-from openai import AzureOpenAI, OpenAIError
+from openai import AzureOpenAI, AsyncAzureOpenAI, OpenAIError
 from openai.types.chat.chat_completion import ChatCompletion
 import logging
 
 from .abstract_language_model import AbstractLanguageModel
+from escargot.utils import run_cancellable
 
 
 class AzureGPT(AbstractLanguageModel):
@@ -55,9 +56,10 @@ class AzureGPT(AbstractLanguageModel):
         self.api_key: str = os.getenv("AZURE_API_KEY", self.config["api_key"])
         if self.api_key == "":
             raise ValueError("AZURE_API_KEY is not set")
-        self.response_cache: Dict[str, List[ChatCompletion]] = {}
         # Initialize the OpenAI Client
-        self.client = AzureOpenAI(api_key=self.api_key,azure_endpoint=self.api_base,api_version=self.api_version)
+        timeout = {"timeout": self.request_timeout} if self.request_timeout else {}
+        self.client = AzureOpenAI(api_key=self.api_key,azure_endpoint=self.api_base,api_version=self.api_version, **timeout)
+        self.async_client = AsyncAzureOpenAI(api_key=self.api_key,azure_endpoint=self.api_base,api_version=self.api_version, **timeout)
 
     def query(
         self, query: str, num_responses: int = 1
@@ -72,14 +74,15 @@ class AzureGPT(AbstractLanguageModel):
         :return: Response(s) from the OpenAI model.
         :rtype: Dict
         """
-        if self.cache and query in self.response_cache:
-            return self.response_cache[query]
+        response = self.get_cached_response(query, num_responses)
+        if response is not None:
+            return response
 
         response = []
-        response = self.chat([{"role": "system", "content": query}], num_responses)
+        # the request is abandoned as soon as the question is cancelled
+        response = run_cancellable(self.chat, [{"role": "system", "content": query}], num_responses)
         
-        if self.cache:
-            self.response_cache[query] = response
+        self.set_cached_response(query, num_responses, response)
         return response
 
     @backoff.on_exception(backoff.expo, OpenAIError, max_time=10, max_tries=6)
@@ -106,14 +109,54 @@ class AzureGPT(AbstractLanguageModel):
             # stop=self.stop,
         )
 
-        self.prompt_tokens += response.usage.prompt_tokens
-        self.completion_tokens += response.usage.completion_tokens
-        prompt_tokens_k = float(self.prompt_tokens) / 1000.0
-        completion_tokens_k = float(self.completion_tokens) / 1000.0
-        self.cost = (
-            self.prompt_token_cost * prompt_tokens_k
-            + self.response_token_cost * completion_tokens_k
+        self.update_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response
+
+    async def aquery(
+        self, query: str, num_responses: int = 1
+    ) -> Union[List[ChatCompletion], ChatCompletion]:
+        """
+        Asynchronously query the OpenAI model for responses.
+
+        :param query: The query to be posed to the language model.
+        :type query: str
+        :param num_responses: Number of desired responses, default is 1.
+        :type num_responses: int
+        :return: Response(s) from the OpenAI model.
+        :rtype: Dict
+        """
+        response = self.get_cached_response(query, num_responses)
+        if response is not None:
+            return response
+
+        response = await self.achat([{"role": "system", "content": query}], num_responses)
+
+        self.set_cached_response(query, num_responses, response)
+        return response
+
+    @backoff.on_exception(backoff.expo, OpenAIError, max_time=10, max_tries=6)
+    async def achat(self, messages: List[Dict], num_responses: int = 1) -> ChatCompletion:
+        """
+        Asynchronously send chat messages to the OpenAI model and retrieve the model's response.
+        Implements backoff on OpenAI error.
+
+        :param messages: A list of message dictionaries for the chat.
+        :type messages: List[Dict]
+        :param num_responses: Number of desired responses, default is 1.
+        :type num_responses: int
+        :return: The OpenAI model's response.
+        :rtype: ChatCompletion
+        """
+        response = await self.async_client.chat.completions.create(
+            model=self.model_id,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            n=num_responses,
+            # stop=self.stop,
         )
+
+        self.update_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
         return response
 
     def get_response_texts(
@@ -135,11 +178,34 @@ class AzureGPT(AbstractLanguageModel):
             for choice in response.choices
         ]
     
-    def get_embedding(self, text_to_embed):
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts in one request.
 
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
         response = self.client.embeddings.create(
             model=self.embedding_id,
-            input=text_to_embed
+            input=texts
+        )
+
+        return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Asynchronously embed a batch of texts in one request.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        response = await self.async_client.embeddings.create(
+            model=self.embedding_id,
+            input=texts
         )
 
-        return response.data[0].embedding
+        return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
@@ -6,15 +6,18 @@
 #
 # main author: Nils Blach
 
+import asyncio
 import backoff
 import os
 import random
 import time
 from typing import List, Dict, Union
-from openai import OpenAI, OpenAIError
+from openai import OpenAI, AsyncOpenAI, OpenAIError
 from openai.types.chat.chat_completion import ChatCompletion
+import logging
 
 from .abstract_language_model import AbstractLanguageModel
+from escargot.utils import run_cancellable
 
 
 class ChatGPT(AbstractLanguageModel):
@@ -25,7 +28,7 @@ class ChatGPT(AbstractLanguageModel):
     """
 
     def __init__(
-        self, config_path: str = "", model_name: str = "chatgpt", cache: bool = False
+        self, config_path: str = "", model_name: str = "chatgpt", cache: bool = False, logger: logging.Logger = None
     ) -> None:
         """
         Initialize the ChatGPT instance with configuration, model details, and caching options.
@@ -37,7 +40,7 @@ class ChatGPT(AbstractLanguageModel):
         :param cache: Flag to determine whether to cache responses. Defaults to False.
         :type cache: bool
         """
-        super().__init__(config_path, model_name, cache)
+        super().__init__(config_path, model_name, cache, logger)
         self.config: Dict = self.config[model_name]
         # The model_id is the id of the model that is used for chatgpt, i.e. gpt-4, gpt-3.5-turbo, etc.
         self.model_id: str = self.config["model_id"]
@@ -50,6 +53,8 @@ class ChatGPT(AbstractLanguageModel):
         self.max_tokens: int = self.config["max_tokens"]
         # The stop sequence is a sequence of tokens that the model will stop generating at (it will not generate the stop sequence).
         self.stop: Union[str, List[str]] = self.config["stop"]
+        # The embedding_id is the id of the embedding model that is used
+        self.embedding_id: str = self.config.get("embedding_id", "text-embedding-3-small")
         # The account organization is the organization that is used for chatgpt.
         self.organization: str = self.config["organization"]
         if self.organization == "":
@@ -58,7 +63,9 @@ class ChatGPT(AbstractLanguageModel):
         if self.api_key == "":
             raise ValueError("OPENAI_API_KEY is not set")
         # Initialize the OpenAI Client
-        self.client = OpenAI(api_key=self.api_key, organization=self.organization)
+        timeout = {"timeout": self.request_timeout} if self.request_timeout else {}
+        self.client = OpenAI(api_key=self.api_key, organization=self.organization, **timeout)
+        self.async_client = AsyncOpenAI(api_key=self.api_key, organization=self.organization, **timeout)
 
     def query(
         self, query: str, num_responses: int = 1
@@ -73,11 +80,14 @@ class ChatGPT(AbstractLanguageModel):
         :return: Response(s) from the OpenAI model.
         :rtype: Dict
         """
-        if self.cache and query in self.respone_cache:
-            return self.respone_cache[query]
+        response = self.get_cached_response(query, num_responses)
+        if response is not None:
+            return response
+        requested_responses = num_responses
 
+        # the requests are abandoned as soon as the question is cancelled
         if num_responses == 1:
-            response = self.chat([{"role": "user", "content": query}], num_responses)
+            response = run_cancellable(self.chat, [{"role": "user", "content": query}], num_responses)
         else:
             response = []
             next_try = num_responses
@@ -85,7 +95,7 @@ class ChatGPT(AbstractLanguageModel):
             while num_responses > 0 and total_num_attempts > 0:
                 try:
                     assert next_try > 0
-                    res = self.chat([{"role": "user", "content": query}], next_try)
+                    res = run_cancellable(self.chat, [{"role": "user", "content": query}], next_try)
                     response.append(res)
                     num_responses -= next_try
                     next_try = min(num_responses, next_try)
@@ -97,8 +107,7 @@ class ChatGPT(AbstractLanguageModel):
                     time.sleep(random.randint(1, 3))
                     total_num_attempts -= 1
 
-        if self.cache:
-            self.respone_cache[query] = response
+        self.set_cached_response(query, requested_responses, response)
         return response
 
     @backoff.on_exception(backoff.expo, OpenAIError, max_time=10, max_tries=6)
@@ -123,14 +132,74 @@ class ChatGPT(AbstractLanguageModel):
             stop=self.stop,
         )
 
-        self.prompt_tokens += response.usage.prompt_tokens
-        self.completion_tokens += response.usage.completion_tokens
-        prompt_tokens_k = float(self.prompt_tokens) / 1000.0
-        completion_tokens_k = float(self.completion_tokens) / 1000.0
-        self.cost = (
-            self.prompt_token_cost * prompt_tokens_k
-            + self.response_token_cost * completion_tokens_k
+        self.update_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response
+
+    async def aquery(
+        self, query: str, num_responses: int = 1
+    ) -> Union[List[ChatCompletion], ChatCompletion]:
+        """
+        Asynchronously query the OpenAI model for responses.
+
+        :param query: The query to be posed to the language model.
+        :type query: str
+        :param num_responses: Number of desired responses, default is 1.
+        :type num_responses: int
+        :return: Response(s) from the OpenAI model.
+        :rtype: Dict
+        """
+        response = self.get_cached_response(query, num_responses)
+        if response is not None:
+            return response
+        requested_responses = num_responses
+
+        if num_responses == 1:
+            response = await self.achat([{"role": "user", "content": query}], num_responses)
+        else:
+            response = []
+            next_try = num_responses
+            total_num_attempts = num_responses
+            while num_responses > 0 and total_num_attempts > 0:
+                try:
+                    assert next_try > 0
+                    res = await self.achat([{"role": "user", "content": query}], next_try)
+                    response.append(res)
+                    num_responses -= next_try
+                    next_try = min(num_responses, next_try)
+                except Exception as e:
+                    next_try = (next_try + 1) // 2
+                    self.logger.warning(
+                        f"Error in chatgpt: {e}, trying again with {next_try} samples"
+                    )
+                    await asyncio.sleep(random.randint(1, 3))
+                    total_num_attempts -= 1
+
+        self.set_cached_response(query, requested_responses, response)
+        return response
+
+    @backoff.on_exception(backoff.expo, OpenAIError, max_time=10, max_tries=6)
+    async def achat(self, messages: List[Dict], num_responses: int = 1) -> ChatCompletion:
+        """
+        Asynchronously send chat messages to the OpenAI model and retrieve the model's response.
+        Implements backoff on OpenAI error.
+
+        :param messages: A list of message dictionaries for the chat.
+        :type messages: List[Dict]
+        :param num_responses: Number of desired responses, default is 1.
+        :type num_responses: int
+        :return: The OpenAI model's response.
+        :rtype: ChatCompletion
+        """
+        response = await self.async_client.chat.completions.create(
+            model=self.model_id,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            n=num_responses,
+            stop=self.stop,
         )
+
+        self.update_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
         return response
 
     def get_response_texts(
@@ -151,3 +220,35 @@ class ChatGPT(AbstractLanguageModel):
             for response in query_response
             for choice in response.choices
         ]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts in one request.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        response = self.client.embeddings.create(
+            model=self.embedding_id,
+            input=texts
+        )
+
+        return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Asynchronously embed a batch of texts in one request.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        response = await self.async_client.embeddings.create(
+            model=self.embedding_id,
+            input=texts
+        )
+
+        return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
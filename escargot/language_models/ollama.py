@@ -1,12 +1,15 @@
+import asyncio
 import backoff
 import os
 import random
 import time
 from typing import List, Dict, Union
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import ollama
-from ollama import Client
+from ollama import Client, AsyncClient
 from .abstract_language_model import AbstractLanguageModel
+from escargot.utils import bind_cancellation, run_cancellable
 
 
 class Ollama(AbstractLanguageModel):
@@ -44,12 +47,19 @@ class Ollama(AbstractLanguageModel):
         self.max_tokens: int = self.config["max_tokens"]
         # The stop sequence is a sequence of tokens that the model will stop generating at (it will not generate the stop sequence).
         self.stop: Union[str, List[str]] = self.config["stop"]
+        # The maximum number of completions requested concurrently from the Ollama server.
+        # The server only processes them in parallel up to its OLLAMA_NUM_PARALLEL setting.
+        self.max_concurrency: int = self.config.get("max_concurrency", 4)
 
-        self.response_cache: Dict[str, List[str]] = {}
-        
+        timeout = {"timeout": self.request_timeout} if self.request_timeout else {}
         self.client = Client(
             host='http://localhost:11434',
             # headers={'x-some-header': 'some-value'}
+            **timeout
+        )
+        self.async_client = AsyncClient(
+            host='http://localhost:11434',
+            **timeout
         )
 
 
@@ -58,30 +68,84 @@ class Ollama(AbstractLanguageModel):
         self, query: str, num_responses: int = 1
     ) -> Union[List[str], str]:
         """
-        Query the OpenAI model for responses.
+        Query the Ollama model for responses.
+        The responses are requested concurrently, with at most max_concurrency requests in flight.
 
         :param query: The query to be posed to the language model.
         :type query: str
         :param num_responses: Number of desired responses, default is 1.
         :type num_responses: int
-        :return: Response(s) from the OpenAI model.
+        :return: Response(s) from the Ollama model.
         :rtype: Dict
         """
-        if self.cache and query in self.response_cache:
-            return self.response_cache[query]
+        response = self.get_cached_response(query, num_responses)
+        if response is not None:
+            return response
 
-        response = []
-        for i in range(num_responses):
-            res = self.client.chat(model=self.model_id, messages=[
+        messages = [
             {
                 'role': 'user',
                 'content': query,
             },
-            ])
-            response.append(res)
+        ]
+        if num_responses == 1 or self.max_concurrency <= 1:
+            response = [self.chat(messages) for i in range(num_responses)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, num_responses)) as executor:
+                response = list(executor.map(bind_cancellation(lambda i: self.chat(messages)), range(num_responses)))
         
-        if self.cache:
-            self.response_cache[query] = response
+        self.set_cached_response(query, num_responses, response)
+        return response
+
+    def chat(self, messages: List[Dict]):
+        """
+        Send chat messages to the Ollama model and retrieve one response.
+
+        :param messages: A list of message dictionaries for the chat.
+        :type messages: List[Dict]
+        :return: The Ollama model's response.
+        :rtype: ollama.ChatResponse
+        """
+        # the request is abandoned as soon as the question is cancelled
+        response = run_cancellable(self.client.chat, model=self.model_id, messages=messages)
+        self.update_usage(getattr(response, "prompt_eval_count", None) or 0, getattr(response, "eval_count", None) or 0)
+        return response
+
+    async def aquery(
+        self, query: str, num_responses: int = 1
+    ) -> Union[List[str], str]:
+        """
+        Asynchronously query the Ollama model for responses.
+        The responses are requested concurrently, with at most max_concurrency requests in flight.
+
+        :param query: The query to be posed to the language model.
+        :type query: str
+        :param num_responses: Number of desired responses, default is 1.
+        :type num_responses: int
+        :return: Response(s) from the Ollama model.
+        :rtype: Dict
+        """
+        response = self.get_cached_response(query, num_responses)
+        if response is not None:
+            return response
+
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+        messages = [
+            {
+                'role': 'user',
+                'content': query,
+            },
+        ]
+
+        async def achat():
+            async with semaphore:
+                response = await self.async_client.chat(model=self.model_id, messages=messages)
+            self.update_usage(getattr(response, "prompt_eval_count", None) or 0, getattr(response, "eval_count", None) or 0)
+            return response
+
+        response = list(await asyncio.gather(*[achat() for i in range(num_responses)]))
+
+        self.set_cached_response(query, num_responses, response)
         return response
 
     # @backoff.on_exception(backoff.expo, OpenAIError, max_time=10, max_tries=6)
@@ -136,7 +200,28 @@ class Ollama(AbstractLanguageModel):
             for response in query_response
         ]
     
-    def get_embedding(self, text_to_embed):
-        response = ollama.embed(model=self.model_id, input=text_to_embed)
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts in one request.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        response = self.client.embed(model=self.embedding_id, input=texts)
+
+        return list(response.embeddings)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Asynchronously embed a batch of texts in one request.
+
+        :param texts: The texts to embed.
+        :type texts: List[str]
+        :return: The embeddings of the texts, in the same order.
+        :rtype: List[List[float]]
+        """
+        response = await self.async_client.embed(model=self.embedding_id, input=texts)
 
-        return response.data[0].embedding
+        return list(response.embeddings)
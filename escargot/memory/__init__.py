@@ -1 +1,4 @@
-from escargot.memory.memory import Memory
\ No newline at end of file
+from escargot.memory.retrieval import BM25Index, fuse_rankings
+from escargot.memory.data_store import DataStore
+from escargot.memory.writer import MemoryWriter
+from escargot.memory.memory import Memory, get_memory, flush_memories, close_memories
\ No newline at end of file
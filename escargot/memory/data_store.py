@@ -0,0 +1,184 @@
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+class DataStore:
+    """
+    Storage of the data attached to memories, in the folder of a memory collection.
+
+    Data is stored in the format that suits it, so that it can be previewed without being loaded fully:
+    - "npy": NumPy arrays, as .npy files opened as memory maps.
+    - "list": lists of numbers or strings, as .list.npy files opened as memory maps.
+    - "feather": pandas DataFrames, as Feather files memory-mapped with pyarrow (if pyarrow is installed).
+    - "blob": other small objects, pickled into one SQLite file instead of one file each.
+    - "pkl": other objects, as one pickle file each. Data stored before the other formats existed is also read from these.
+    """
+
+    FORMATS = ("npy", "list", "feather", "blob", "pkl")
+
+    def __init__(self, directory: str, blob_max_size: int = 65536) -> None:
+        """
+        Initialize the store.
+
+        :param directory: The folder of the memory collection.
+        :type directory: str
+        :param blob_max_size: The maximum size in bytes of a pickled object stored in the blob store. Defaults to 65536.
+        :type blob_max_size: int
+        """
+        self.directory = directory
+        self.blob_max_size = blob_max_size
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def path(self, key: str, format: str) -> str:
+        extension = {"npy": ".npy", "list": ".list.npy", "feather": ".feather", "pkl": ".pkl"}[format]
+        return os.path.join(self.directory, key + extension)
+
+    def get_connection(self) -> sqlite3.Connection:
+        with self.lock:
+            if self.connection is None:
+                self.connection = sqlite3.connect(os.path.join(self.directory, "blobs.sqlite"), check_same_thread=False)
+                with self.connection:
+                    self.connection.execute("CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, value BLOB)")
+            return self.connection
+
+    def put(self, key: str, data: Any) -> str:
+        """
+        Store data under a key.
+
+        :param key: The key, usually the memory id.
+        :type key: str
+        :param data: The data.
+        :return: The format in which the data was stored.
+        :rtype: str
+        """
+        if isinstance(data, np.ndarray) and data.dtype != object:
+            np.save(self.path(key, "npy"), data)
+            return "npy"
+        if isinstance(data, list) and len(data) > 0:
+            # only lists of one type, so that loading them gives back the same values
+            types = set(type(item) for item in data)
+            array = np.asarray(data) if len(types) == 1 and types.pop() in (bool, int, float, str) else None
+            if array is not None and array.ndim == 1 and array.dtype.kind in "biufU":
+                np.save(self.path(key, "list"), array)
+                return "list"
+        if isinstance(data, pd.DataFrame) and feather is not None:
+            try:
+                feather.write_feather(data, self.path(key, "feather"))
+                return "feather"
+            except Exception:
+                # e.g. columns of mixed types, which Arrow cannot represent
+                if os.path.exists(self.path(key, "feather")):
+                    os.remove(self.path(key, "feather"))
+        blob = pickle.dumps(data)
+        if len(blob) <= self.blob_max_size:
+            connection = self.get_connection()
+            with self.lock, connection:
+                connection.execute("INSERT OR REPLACE INTO blobs (key, value) VALUES (?, ?)", (key, blob))
+            return "blob"
+        with open(self.path(key, "pkl"), "wb") as f:
+            f.write(blob)
+        return "pkl"
+
+    def locate(self, key: str) -> Optional[str]:
+        """
+        Find the format in which the data of a key is stored.
+
+        :param key: The key.
+        :type key: str
+        :return: The format, or None if there is no data for the key.
+        :rtype: Optional[str]
+        """
+        for format in ("npy", "list", "feather", "pkl"):
+            if os.path.exists(self.path(key, format)):
+                return format
+        if os.path.exists(os.path.join(self.directory, "blobs.sqlite")):
+            connection = self.get_connection()
+            with self.lock:
+                row = connection.execute("SELECT 1 FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                return "blob"
+        return None
+
+    def get(self, key: str, format: Optional[str] = None) -> Any:
+        """
+        Load the data of a key.
+
+        :param key: The key.
+        :type key: str
+        :param format: The format of the data. Defaults to None (looked up).
+        :type format: Optional[str]
+        :return: The data.
+        :raise KeyError: If there is no data for the key.
+        """
+        if format is None:
+            format = self.locate(key)
+        if format == "npy":
+            return np.load(self.path(key, "npy"))
+        if format == "list":
+            return np.load(self.path(key, "list")).tolist()
+        if format == "feather":
+            return feather.read_feather(self.path(key, "feather"))
+        if format == "blob":
+            connection = self.get_connection()
+            with self.lock:
+                row = connection.execute("SELECT value FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                return pickle.loads(row[0])
+        if format == "pkl":
+            with open(self.path(key, "pkl"), "rb") as f:
+                return pickle.load(f)
+        raise KeyError(key)
+
+    def preview(self, key: str, start: int = 0, stop: int = 10, format: Optional[str] = None) -> Any:
+        """
+        Load a slice of the data of a key. Arrays, lists and DataFrames are sliced on their first axis
+        without being loaded fully; other objects are loaded and sliced if they support it.
+
+        :param key: The key.
+        :type key: str
+        :param start: The first index of the slice. Defaults to 0.
+        :type start: int
+        :param stop: The index after the end of the slice. Defaults to 10.
+        :type stop: int
+        :param format: The format of the data. Defaults to None (looked up).
+        :type format: Optional[str]
+        :return: The slice of the data.
+        :raise KeyError: If there is no data for the key.
+        """
+        if format is None:
+            format = self.locate(key)
+        if format == "npy":
+            return np.array(np.load(self.path(key, "npy"), mmap_mode="r")[start:stop])
+        if format == "list":
+            return np.load(self.path(key, "list"), mmap_mode="r")[start:stop].tolist()
+        if format == "feather":
+            table = feather.read_table(self.path(key, "feather"), memory_map=True)
+            start = min(start, table.num_rows)
+            return table.slice(start, max(0, min(stop, table.num_rows) - start)).to_pandas()
+        data = self.get(key, format)
+        if isinstance(data, pd.DataFrame):
+            return data.iloc[start:stop]
+        if isinstance(data, dict):
+            return dict(list(data.items())[start:stop])
+        try:
+            return data[start:stop]
+        except TypeError:
+            return data
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -8,8 +8,97 @@ import os
 from raphtory import Graph
 from raphtory import algorithms as algo
 import shutil
+import json
+import threading
+import atexit
+import logging
+import time
+from escargot.memory.writer import MemoryWriter
+from escargot.memory.data_store import DataStore
+from escargot.memory.retrieval import BM25Index, fuse_rankings
+
+# The open memories of the process, keyed by collection name
+_memories = {}
+_memories_lock = threading.Lock()
+# Seconds the queued writes are waited for when the interpreter exits, so that a stalled language model call cannot hang it
+EXIT_FLUSH_TIMEOUT = 30
+
+
+def get_memory(lm, collection_name="default"):
+    """
+    Get the open memory of a collection, opening it on first use.
+    Opening a memory connects to ChromaDB and loads the graph, so the handle is kept and shared
+    for the lifetime of the process, or until close_memories is called.
+
+    :param lm: The language model used to embed the memories. Only used when the memory is opened.
+    :param collection_name: The name of the memory collection. Defaults to "default".
+    :type collection_name: str
+    :return: The memory.
+    :rtype: Memory
+    """
+    with _memories_lock:
+        memory = _memories.get(collection_name)
+        if memory is None:
+            memory = Memory(lm, collection_name=collection_name)
+            _memories[collection_name] = memory
+        return memory
+
+
+def flush_memories(timeout=None):
+    """
+    Write the pending changes of all the open memories.
+
+    :param timeout: Seconds to wait for the queued writes of all the memories. Defaults to None (wait until they are written).
+    :type timeout: float
+    :return: True if all the queued writes were written, False if the timeout expired first.
+    :rtype: bool
+    """
+    with _memories_lock:
+        memories = list(_memories.values())
+    deadline = None if timeout is None else time.monotonic() + timeout
+    flushed = True
+    for memory in memories:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        flushed = memory.flush(remaining) and flushed
+    return flushed
+
+
+def flush_memories_at_exit():
+    if not flush_memories(EXIT_FLUSH_TIMEOUT):
+        logging.getLogger(__name__).warning(f"Exiting with memory writes still queued after {EXIT_FLUSH_TIMEOUT} seconds.")
+
+
+def close_memories(collection_name=None):
+    """
+    Flush and close an open memory, or all of them.
+
+    :param collection_name: The name of the memory collection. Defaults to None (all the memories).
+    :type collection_name: str
+    """
+    with _memories_lock:
+        if collection_name is None:
+            memories = list(_memories.values())
+            _memories.clear()
+        else:
+            memory = _memories.pop(collection_name, None)
+            memories = [memory] if memory is not None else []
+    for memory in memories:
+        memory.close()
+
+
+atexit.register(flush_memories_at_exit)
+
+
 class Memory:
-    def __init__(self, lm, collection_name="default"):
+    """
+    Long-term memory of the answers, stored as vectors in a ChromaDB collection and as nodes of a raphtory graph.
+
+    The graph is persisted as a snapshot plus an append-only log of the nodes added since the snapshot.
+    Nodes reference their vector in the collection (its id, the text) instead of holding a copy of it.
+    Storing a memory only appends to the log; the log is compacted into a new snapshot once it holds
+    compact_every entries.
+    """
+    def __init__(self, lm, collection_name="default", compact_every=1000):
         # Initialize ChromaDB client and specify the collection for storing vectors
         #create the collection folder if it doesn't exist
         if not os.path.exists(f"./escargot_memory"):
@@ -17,16 +106,29 @@ class Memory:
         self.client = chromadb.PersistentClient(path=f"./escargot_memory/{collection_name}", settings=Settings(allow_reset=True))
         self.collection_name = collection_name
         self.lm = lm
+        self.logger = logging.getLogger(__name__)
         self.collection = self.client.get_or_create_collection(collection_name)
+        self.lock = threading.RLock()
+        #data attached to the memories
+        self.data_store = DataStore(f"./escargot_memory/{collection_name}")
+        #write-behind queue, started by get_writer
+        self.writer = None
+        #keyword index of the texts, built by get_keyword_index
+        self.keyword_index = None
+        #append-only log of the nodes added since the last snapshot of the graph
+        self.log_path = f"./escargot_memory/{collection_name}/graph.log"
+        self.log_file = None
+        self.log_entries = 0
+        self.compact_every = compact_every
         #if graph exists load it
         if os.path.exists(f"./escargot_memory/{collection_name}/graph"):
-            self.graph = Graph.load_from_file(f"./escargot_memory/{collection_name}/graph")
+            self.load_graph()
         else:
             self.graph = Graph()
             self.save_graph()
 
-        #history of when nodes were inserted
-        self.graph_timestamp = 1
+        #history of when nodes were inserted, continuing after the nodes already in the graph
+        self.graph_timestamp = (self.graph.latest_time or 0) + 1
             
 
     def reset_collection(self, collection_name = None):
@@ -34,6 +136,10 @@ class Memory:
             collection_name = self.collection_name
         
         self.client.delete_collection(name=collection_name)
+        with self.lock:
+            self.close_log()
+            self.data_store.close()
+            self.keyword_index = None
 
         self.client.reset()
         self.client.clear_system_cache() # very important
@@ -46,42 +152,258 @@ class Memory:
        # delete you persist_directory and create persist_directory againt
         self.client = chromadb.PersistentClient(path=f"./escargot_memory/{collection_name}", settings=Settings(allow_reset=True))
         self.collection = self.client.get_or_create_collection(collection_name)
-        self.graph = Graph()
-        self.save_graph()
+        with self.lock:
+            self.graph = Graph()
+            self.graph_timestamp = 1
+            self.save_graph()
 
     def store_memory(self, text, metadata={}, data = None):
-        # Embed the text using the lm's embed function
-        vector = self.lm.get_embedding(text)
-        memory_id = str(uuid.uuid4())
-        metadata["memory_id"] = memory_id
-        # If data is not None, create a uuid name and a pkl file. the metadata will contain the file name within the collection folder
-        if data is not None:
-            with open(f"./escargot_memory/{self.collection_name}/{memory_id}.pkl", "wb") as f:
-                pickle.dump(data, f)
-            metadata["file"] = memory_id
-
-        # Add the embedded vector to the collection
-        collection = self.client.get_collection(self.collection_name)
-        collection.add(ids=text, embeddings=[vector], metadatas=metadata)
+        self.store_memories([text], metadatas=[metadata], datas=[data])
 
+    def store_memories(self, texts, metadatas = None, datas = None):
+        """
+        Store several memories at once, with one embedding request and one ChromaDB insertion.
+
+        :param texts: The texts of the memories. They are also their ids in the collection.
+        :type texts: List[str]
+        :param metadatas: The metadata of each memory. Defaults to None (no metadata).
+        :type metadatas: List[dict]
+        :param datas: The data stored with each memory, or None. Defaults to None (no data).
+        :type datas: List
+        """
+        if metadatas is None:
+            metadatas = [{} for text in texts]
+        if datas is None:
+            datas = [None for text in texts]
+        # The texts are the ids in the collection, so each text is only stored once
+        memories = {}
+        for text, metadata, data in zip(texts, metadatas, datas):
+            if text not in memories:
+                memories[text] = (metadata, data)
+        texts = list(memories)
+        if texts == []:
+            return
+        # Embed the texts using the lm's embed function
+        vectors = self.lm.get_embeddings(texts)
+        memory_ids = []
+        metadatas = []
+        for text in texts:
+            metadata, data = memories[text]
+            metadata = dict(metadata)
+            memory_id = str(uuid.uuid4())
+            metadata["memory_id"] = memory_id
+            # If data is not None, store it under the uuid. the metadata will contain the key and the format within the collection folder
+            if data is not None:
+                metadata["format"] = self.data_store.put(memory_id, data)
+                metadata["file"] = memory_id
+            memory_ids.append(memory_id)
+            metadatas.append(metadata)
+
+        # Add the embedded vectors to the collection
+        with self.lock:
+            self.collection.add(ids=texts, embeddings=vectors, metadatas=metadatas)
+            if self.keyword_index is not None:
+                self.keyword_index.add_many((text, text) for text in texts)
+
+            entries = []
+            for text, memory_id in zip(texts, memory_ids):
+                # the vector is in the collection, under the text as id
+                entry = {"timestamp": self.graph_timestamp, "id": memory_id, "text": text, "vector_ref": text}
+                self.add_graph_node(entry)
+                entries.append(entry)
+                self.graph_timestamp += 1
+            self.append_log(entries)
+            if self.log_entries >= self.compact_every:
+                self.save_graph()
+
+    def add_graph_node(self, entry):
         self.graph.add_node(
-            timestamp=self.graph_timestamp,
-            id=memory_id,
-            properties={"text":text, "vector":vector},
+            timestamp=entry["timestamp"],
+            id=entry["id"],
+            properties={"text":entry["text"], "vector_ref":entry["vector_ref"]},
         )
-        self.graph_timestamp += 1
 
-    def query_collection(self,query, max_results=10, metadata = None):
-        collection = self.client.get_collection(self.collection_name)
-        query_embeddings = self.lm.get_embedding(query)
-        if metadata is not None:
-            results = collection.query(
+    def append_log(self, entries):
+        """
+        Append nodes to the log of the graph.
+
+        :param entries: The nodes, as dictionaries with the keys "timestamp", "id", "text" and "vector_ref".
+        :type entries: List[dict]
+        """
+        with self.lock:
+            if self.log_file is None:
+                self.log_file = open(self.log_path, "a")
+            for entry in entries:
+                self.log_file.write(json.dumps(entry) + "\n")
+            self.log_file.flush()
+            self.log_entries += len(entries)
+
+    def replay_log(self):
+        """
+        Add the nodes of the log to the graph.
+
+        :return: The number of nodes in the log.
+        :rtype: int
+        """
+        if not os.path.exists(self.log_path):
+            return 0
+        entries = 0
+        with open(self.log_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by a crash while it was written
+                    continue
+                self.add_graph_node(entry)
+                entries += 1
+        return entries
+
+    def close_log(self):
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+    def get_vector(self, vector_ref):
+        """
+        Get the vector referenced by a node of the graph.
+
+        :param vector_ref: The "vector_ref" property of the node.
+        :type vector_ref: str
+        :return: The vector, or None if it is not in the collection.
+        :rtype: List[float]
+        """
+        results = self.collection.get(ids=[vector_ref], include=["embeddings"])
+        if len(results["ids"]) == 0:
+            return None
+        return list(results["embeddings"][0])
+
+    def get_writer(self, lm = None, logger = None, **kwargs):
+        """
+        Get the write-behind queue of the memory, starting it on first use.
+
+        :param lm: The language model used to summarize the answers submitted without one. Defaults to None (the memory's language model).
+        :type lm: AbstractLanguageModel
+        :param logger: The logger. Defaults to None.
+        :type logger: logging.Logger
+        :param kwargs: Additional arguments of MemoryWriter, used when the writer is started.
+        :return: The writer.
+        :rtype: MemoryWriter
+        """
+        with self.lock:
+            if self.writer is None:
+                self.writer = MemoryWriter(self, lm if lm is not None else self.lm, logger=logger, **kwargs)
+            return self.writer
+
+    def get_keyword_index(self):
+        """
+        Get the BM25 index of the texts of the memories, building it from the collection on first use.
+
+        :return: The index, in which the ids of the documents are the texts.
+        :rtype: BM25Index
+        """
+        with self.lock:
+            if self.keyword_index is None:
+                keyword_index = BM25Index()
+                texts = self.collection.get(include=[])["ids"]
+                keyword_index.add_many((text, text) for text in texts)
+                self.keyword_index = keyword_index
+            return self.keyword_index
+
+    def window_memory_ids(self, start, end):
+        """
+        Get the ids of the memories inserted in a window of graph timestamps.
+
+        :param start: The first timestamp of the window.
+        :type start: int
+        :param end: The timestamp after the end of the window.
+        :type end: int
+        :return: The memory ids.
+        :rtype: List[str]
+        """
+        with self.lock:
+            return [str(node.name) for node in self.graph.window(start, end).nodes]
+
+    def query_collection(self, query, max_results=10, metadata = None, mode = "dense", time_window = None, dense_weight = 1.0, keyword_weight = 1.0):
+        """
+        Query the collection with one query or a batch of queries.
+
+        Modes:
+            "dense": nearest neighbours of the embedding of each query (ChromaDB).
+            "keyword": BM25 ranking of the texts of the memories.
+            "hybrid": both rankings, fused with weighted reciprocal rank fusion.
+        The embeddings of all the queries are requested at once and cached by the language model.
+
+        Args:
+            query (str or List[str]): The query, or a list of queries.
+            max_results (int): The maximum number of results per query. Defaults to 10.
+            metadata (dict): ChromaDB where filter on the metadata. Defaults to None.
+            mode (str): "dense", "keyword" or "hybrid". Defaults to "dense".
+            time_window (tuple): (start, end) graph timestamps; only memories inserted in the window are returned. Defaults to None.
+            dense_weight (float): The weight of the dense ranking in hybrid mode. Defaults to 1.0.
+            keyword_weight (float): The weight of the keyword ranking in hybrid mode. Defaults to 1.0.
+
+        Returns:
+            The results in the ChromaDB format, with one list per query under "ids", "distances" and "metadatas".
+            In keyword and hybrid modes, "scores" holds the scores of the results, and "distances" is None
+            for the results that are not among the dense neighbours.
+        """
+        collection = self.collection
+        queries = [query] if isinstance(query, str) else list(query)
+        where = metadata
+        if time_window is not None:
+            memory_ids = self.window_memory_ids(*time_window)
+            if memory_ids == []:
+                return {"ids": [[] for q in queries], "distances": [[] for q in queries], "metadatas": [[] for q in queries]}
+            time_filter = {"memory_id": {"$in": memory_ids}}
+            where = time_filter if where is None else {"$and": [where, time_filter]}
+
+        if mode == "dense":
+            return self.dense_query(queries, max_results, where)
+
+        # more candidates than results, so that the fusion can reorder them
+        num_candidates = max(4 * max_results, 20)
+        dense_results = None
+        if mode == "hybrid":
+            dense_results = self.dense_query(queries, num_candidates, where)
+        keyword_index = self.get_keyword_index()
+        results = {"ids": [], "distances": [], "metadatas": [], "scores": []}
+        for i, q in enumerate(queries):
+            keyword_ids = [text for text, score in keyword_index.search(q, num_candidates)]
+            if where is not None and keyword_ids != []:
+                allowed = set(collection.get(ids=keyword_ids, where=where, include=[])["ids"])
+                keyword_ids = [text for text in keyword_ids if text in allowed]
+            distances = {}
+            metadatas = {}
+            if dense_results is not None:
+                for text, distance, result_metadata in zip(dense_results["ids"][i], dense_results["distances"][i], dense_results["metadatas"][i]):
+                    distances[text] = distance
+                    metadatas[text] = result_metadata
+                fused = fuse_rankings([dense_results["ids"][i], keyword_ids], [dense_weight, keyword_weight])
+            else:
+                fused = fuse_rankings([keyword_ids], [keyword_weight])
+            fused = fused[:max_results]
+            missing = [text for text, score in fused if text not in metadatas]
+            if missing != []:
+                fetched = collection.get(ids=missing, include=["metadatas"])
+                metadatas.update(zip(fetched["ids"], fetched["metadatas"]))
+            results["ids"].append([text for text, score in fused])
+            results["scores"].append([score for text, score in fused])
+            results["distances"].append([distances.get(text) for text, score in fused])
+            results["metadatas"].append([metadatas.get(text) for text, score in fused])
+        return results
+
+    def dense_query(self, queries, max_results, where = None):
+        query_embeddings = self.lm.get_embeddings(queries)
+        if where is not None:
+            results = self.collection.query(
                 query_embeddings=query_embeddings,
                 n_results=max_results,
-                where=metadata
+                where=where
             )
         else:
-            results = collection.query(
+            results = self.collection.query(
                 query_embeddings=query_embeddings,
                 n_results=max_results
             )
@@ -94,41 +416,99 @@ class Memory:
     def delete_vector(self, text):
         # Delete a vector by id (text)
         self.collection.delete(ids=text)
+        if self.keyword_index is not None:
+            self.keyword_index.remove(text)
 
-    def get_pkl_data(self, memory_id):
+    def get_pkl_data(self, memory_id, format = None):
         """
-        Retrieves the data stored in a pickle file associated with a given memory_id.
+        Retrieves the data stored with a given memory_id.
 
         Args:
-            memory_id (str): The UUID string used as the filename (without extension) for the pickle file.
+            memory_id (str): The UUID string used as the key of the data (the "file" metadata).
+            format (str): The "format" metadata of the memory, if known. It is looked up otherwise.
 
         Returns:
-            The deserialized data from the pickle file, or None if the file does not exist.
-        """
-        file_path = f"./escargot_memory/{self.collection_name}/{memory_id}.pkl"
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, "rb") as f:
-                    data = pickle.load(f)
-                return data
-            except Exception as e:
-                print(f"Error loading pickle file {file_path}: {e}")
-                return None
-        else:
-            print(f"Pickle file not found: {file_path}")
+            The data, or None if there is no data for the memory.
+        """
+        try:
+            return self.data_store.get(memory_id, format)
+        except KeyError:
+            self.logger.warning(f"Data not found: {memory_id}")
             return None
-        
+        except Exception as e:
+            self.logger.error(f"Error loading data {memory_id}: {e}")
+            return None
+
+    def preview_data(self, memory_id, start = 0, stop = 10, format = None):
+        """
+        Retrieves a slice of the data stored with a given memory_id, without loading arrays, lists and tables fully.
+
+        Args:
+            memory_id (str): The UUID string used as the key of the data (the "file" metadata).
+            start (int): The first index of the slice. Defaults to 0.
+            stop (int): The index after the end of the slice. Defaults to 10.
+            format (str): The "format" metadata of the memory, if known. It is looked up otherwise.
+
+        Returns:
+            The slice of the data, or None if there is no data for the memory.
+        """
+        try:
+            return self.data_store.preview(memory_id, start, stop, format)
+        except KeyError:
+            self.logger.warning(f"Data not found: {memory_id}")
+            return None
+
+    def flush(self, timeout = None):
+        """
+        Wait for the queued writes and make sure they are written to the log of the graph.
+
+        :param timeout: Seconds to wait for the queued writes. Defaults to None (wait until they are written).
+        :type timeout: float
+        :return: True if all the queued writes were written, False if the timeout expired first.
+        :rtype: bool
+        """
+        flushed = True
+        if self.writer is not None:
+            flushed = self.writer.flush(timeout)
+        with self.lock:
+            if self.log_file is not None:
+                os.fsync(self.log_file.fileno())
+        return flushed
+
+    def close(self):
+        """
+        Store the queued writes, stop the writer, close the log of the graph and release the ChromaDB client.
+        """
+        if self.writer is not None:
+            self.writer.close()
+        self.flush()
+        with self.lock:
+            self.close_log()
+            self.data_store.close()
+            self.collection = None
+            self.client = None
 
     def save_graph(self, collection_name = None):
         if collection_name is None:
-            self.graph.save_to_file(f"./escargot_memory/{self.collection_name}/graph")
+            # write a new snapshot and compact the log into it
+            path = f"./escargot_memory/{self.collection_name}/graph"
+            with self.lock:
+                # the snapshot replaces the old one only once fully written, and the log is kept until then,
+                # so that a crash while saving leaves the previous snapshot and its log to load
+                self.graph.save_to_file(f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+                self.close_log()
+                open(self.log_path, "w").close()
+                self.log_entries = 0
         else:
             if os.path.exists(f"./escargot_memory/{collection_name}/graph"):
                 self.graph.save_to_file(f"./escargot_memory/{collection_name}/graph")
 
     def load_graph(self, collection_name = None):
         if collection_name is None:
-            self.graph = Graph.load_from_file(f"./escargot_memory/{self.collection_name}/graph")
+            with self.lock:
+                self.graph = Graph.load_from_file(f"./escargot_memory/{self.collection_name}/graph")
+                self.log_entries = self.replay_log()
         else:
             if os.path.exists(f"./escargot_memory/{collection_name}/graph"):
                 self.graph = Graph.load_from_file(f"./escargot_memory/{collection_name}/graph")
@@ -0,0 +1,128 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase word tokens.
+
+    :param text: The text.
+    :type text: str
+    :return: The tokens.
+    :rtype: List[str]
+    """
+    return re.findall(r"\w+", str(text).lower())
+
+
+class BM25Index:
+    """
+    Thread-safe in-memory inverted index ranking documents with Okapi BM25.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        """
+        Initialize an empty index.
+
+        :param k1: The term frequency saturation. Defaults to 1.5.
+        :type k1: float
+        :param b: The document length normalization. Defaults to 0.75.
+        :type b: float
+        """
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        # term -> {document id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        # document id -> its terms, to remove it without scanning the postings
+        self.terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: str, text: str) -> None:
+        """
+        Index a document. A document already indexed under the same id is replaced.
+
+        :param doc_id: The id of the document.
+        :type doc_id: str
+        :param text: The text of the document.
+        :type text: str
+        """
+        counts = Counter(tokenize(text))
+        with self.lock:
+            self.remove_locked(doc_id)
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            self.terms[doc_id] = list(counts)
+            self.lengths[doc_id] = sum(counts.values())
+            self.total_length += self.lengths[doc_id]
+
+    def add_many(self, documents: Iterable[Tuple[str, str]]) -> None:
+        for doc_id, text in documents:
+            self.add(doc_id, text)
+
+    def remove(self, doc_id: str) -> None:
+        with self.lock:
+            self.remove_locked(doc_id)
+
+    def remove_locked(self, doc_id: str) -> None:
+        if doc_id not in self.lengths:
+            return
+        for term in self.terms.pop(doc_id):
+            postings = self.postings[term]
+            del postings[doc_id]
+            if postings == {}:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+    def search(self, query: str, max_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        Rank the documents containing at least one term of the query.
+
+        :param query: The query.
+        :type query: str
+        :param max_results: The maximum number of documents returned. Defaults to 10.
+        :type max_results: int
+        :return: The ids and scores of the best documents, best first.
+        :rtype: List[Tuple[str, float]]
+        """
+        scores: Dict[str, float] = {}
+        with self.lock:
+            num_documents = len(self.lengths)
+            if num_documents == 0:
+                return []
+            average_length = self.total_length / num_documents
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (num_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:max_results]
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+
+def fuse_rankings(rankings: List[List[str]], weights: List[float], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse rankings with weighted reciprocal rank fusion, which does not depend on the scales of the scores.
+
+    :param rankings: The rankings, as lists of ids, best first.
+    :type rankings: List[List[str]]
+    :param weights: The weight of each ranking.
+    :type weights: List[float]
+    :param k: The rank offset, damping the weight of the top ranks. Defaults to 60.
+    :type k: int
+    :return: The ids and fused scores, best first.
+    :rtype: List[Tuple[str, float]]
+    """
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,147 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+
+class MemoryWriter:
+    """
+    Write-behind queue of a memory. Answers are summarized, embedded and stored by a background thread,
+    so that storing them is not on the critical path of the questions.
+
+    The queue is bounded: submit blocks when max_queue_size answers are waiting, which slows down producers
+    instead of letting the backlog grow without limit. Answers are stored in batches of at most batch_size,
+    with one embedding request per batch.
+    """
+
+    def __init__(self, memory, lm, max_queue_size: int = 256, batch_size: int = 16, logger: logging.Logger = None) -> None:
+        """
+        Initialize the writer and start its background thread.
+
+        :param memory: The memory to write to.
+        :type memory: Memory
+        :param lm: The language model used to summarize the answers submitted without one.
+        :type lm: AbstractLanguageModel
+        :param max_queue_size: The maximum number of answers waiting to be stored. Defaults to 256.
+        :type max_queue_size: int
+        :param batch_size: The maximum number of answers stored at once. Defaults to 16.
+        :type batch_size: int
+        :param logger: The logger. Defaults to None.
+        :type logger: logging.Logger
+        """
+        self.memory = memory
+        self.lm = lm
+        self.batch_size = batch_size
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, summary_prompt: str, data: Any = None, timeout: Optional[float] = None, lm=None) -> None:
+        """
+        Queue an answer to be summarized and stored. Blocks while the queue is full.
+        A memory is shared by all the Escargot instances using its collection, so each answer is summarized
+        with the language model of the instance that submitted it.
+
+        :param summary_prompt: The prompt asking the language model to summarize the answer.
+        :type summary_prompt: str
+        :param data: The data stored with the summary, or None to only store the summary. Defaults to None.
+        :param timeout: Seconds to wait for room in the queue. Defaults to None (wait forever).
+        :type timeout: Optional[float]
+        :param lm: The language model used to summarize the answer. Defaults to None (the language model of the writer).
+        :type lm: AbstractLanguageModel
+        :raise queue.Full: If the queue is still full after the timeout.
+        :raise RuntimeError: If the writer is closed.
+        """
+        if self.closed:
+            raise RuntimeError("The memory writer is closed.")
+        self.queue.put((summary_prompt, data, lm if lm is not None else self.lm), timeout=timeout)
+
+    def next_batch(self) -> List[Optional[Tuple[str, Any, Any]]]:
+        """
+        Wait for an answer, then take the answers already queued behind it, up to batch_size.
+        """
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> None:
+        """
+        Store the queued answers until the writer is closed.
+        """
+        while True:
+            batch = self.next_batch()
+            items = [item for item in batch if item is not None]
+            try:
+                if items != []:
+                    self.write(items)
+            except Exception as e:
+                self.logger.error(f"Failed to store {len(items)} summaries in memory '{self.memory.collection_name}': {e}")
+            finally:
+                for item in batch:
+                    self.queue.task_done()
+            if len(items) < len(batch):
+                # None is the stop sentinel
+                return
+
+    def write(self, items: List[Tuple[str, Any, Any]]) -> None:
+        """
+        Summarize a batch of answers and store the summaries in the memory.
+
+        :param items: The summary prompts, data and language models of the answers.
+        :type items: List[Tuple[str, Any, AbstractLanguageModel]]
+        """
+        texts = []
+        datas = []
+        for summary_prompt, data, lm in items:
+            try:
+                summary = lm.get_response_texts(
+                    lm.query(summary_prompt, num_responses=1)
+                )[0]
+            except Exception as e:
+                self.logger.error(f"Failed to generate summary for memory: {e}")
+                continue
+            texts.append(summary)
+            datas.append(data)
+        if texts != []:
+            self.memory.store_memories(texts, datas=datas)
+            self.logger.info(f"Stored {len(texts)} summaries in memory '{self.memory.collection_name}'.")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all the queued answers are stored.
+
+        :param timeout: Seconds to wait. Defaults to None (wait until they are stored).
+        :type timeout: Optional[float]
+        :return: True if all the queued answers were stored, False if the timeout expired first.
+        :rtype: bool
+        """
+        if not self.thread.is_alive():
+            return True
+        if timeout is None:
+            self.queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        """
+        Store the queued answers and stop the background thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,2 @@
+from escargot.metrics.recorder import MetricsRecorder, span, record, timed
+from escargot.metrics.sinks import InMemorySink, JSONLSink, PrometheusSink
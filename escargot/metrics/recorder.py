@@ -0,0 +1,158 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# The recorder of the question the current thread works for, and the spans it is inside, innermost last
+_recorder: ContextVar[Optional["MetricsRecorder"]] = ContextVar("metrics_recorder", default=None)
+_spans: ContextVar[Tuple[Dict, ...]] = ContextVar("metrics_spans", default=())
+
+# Fields of a record that are not counters
+ATTRIBUTES = ("kind", "phase", "operation", "step", "request", "question", "time")
+
+
+class MetricsRecorder:
+    """
+    Records the metrics of one question as spans: one per operation of the Graph of Operations (kind "phase")
+    and one per knowledge request (kind "knowledge"). Each span has its wall time, its attributes and the counters
+    recorded while it was open, such as LLM calls, tokens, cost, retries, cache hits, Cypher time and rows,
+    vector hits and code execution time. Counters recorded in a nested span are added to the enclosing spans too.
+
+    Finished spans are flattened into records, kept by the recorder and emitted to its sinks.
+    """
+
+    def __init__(self, sinks: Optional[List] = None, labels: Optional[Dict] = None) -> None:
+        """
+        Initialize the recorder.
+
+        :param sinks: The sinks the records are emitted to. Defaults to None.
+        :type sinks: Optional[List]
+        :param labels: Attributes added to every record, e.g. the question. Defaults to None.
+        :type labels: Optional[Dict]
+        """
+        self.sinks = list(sinks or [])
+        self.labels = dict(labels or {})
+        self.records: List[Dict] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, kind: str, **attributes) -> Iterator[Dict]:
+        """
+        Open a span in the current thread, making this recorder the current one.
+
+        :param kind: The kind of span, "phase" or "knowledge".
+        :type kind: str
+        :param attributes: The attributes of the span, e.g. its phase.
+        :return: The span, whose attributes can be updated until it is closed.
+        :rtype: Iterator[Dict]
+        """
+        span = {"kind": kind, **attributes, "counters": {}}
+        recorder_token = _recorder.set(self)
+        spans_token = _spans.set(_spans.get() + (span,))
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span["time"] = time.perf_counter() - start
+            _spans.reset(spans_token)
+            _recorder.reset(recorder_token)
+            with self.lock:
+                counters = span.pop("counters")
+            self.emit({**self.labels, **span, **counters})
+
+    def add(self, name: str, value: float) -> None:
+        with self.lock:
+            for span in _spans.get():
+                # work left running after its span closed, such as a speculative conversion, is not counted
+                if "counters" in span:
+                    span["counters"][name] = span["counters"].get(name, 0) + value
+
+    def emit(self, record: Dict) -> None:
+        with self.lock:
+            self.records.append(record)
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def close(self) -> None:
+        """
+        Flush the sinks at the end of the question.
+        """
+        for sink in self.sinks:
+            sink.flush()
+
+    def summary(self) -> Dict:
+        """
+        Summarize the records of the question.
+
+        :return: A dictionary with "phases" (the totals of each phase), "knowledge" (the record of each knowledge request),
+                 "steps" (the record of each executed step) and "total" (the totals of all the operations).
+        :rtype: Dict
+        """
+        with self.lock:
+            records = list(self.records)
+        phases: Dict[str, Dict] = {}
+        total: Dict[str, float] = {"time": 0.0, "operations": 0}
+        for record in records:
+            if record["kind"] != "phase":
+                continue
+            phase = phases.setdefault(record.get("phase"), {"time": 0.0, "operations": 0})
+            for totals in (phase, total):
+                totals["operations"] += 1
+                for name, value in record.items():
+                    if name == "time" or (name not in ATTRIBUTES and isinstance(value, (int, float))):
+                        totals[name] = totals.get(name, 0) + value
+        return {
+            "phases": phases,
+            "knowledge": [record for record in records if record["kind"] == "knowledge"],
+            "steps": [record for record in records if record["kind"] == "phase" and record.get("step") is not None],
+            "total": total,
+        }
+
+
+@contextmanager
+def span(kind: str, **attributes) -> Iterator[Optional[Dict]]:
+    """
+    Open a span in the recorder of the current thread. Nothing is recorded if there is none.
+
+    :param kind: The kind of span.
+    :type kind: str
+    :param attributes: The attributes of the span.
+    :return: The span, or None if there is no recorder.
+    :rtype: Iterator[Optional[Dict]]
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        yield None
+        return
+    with recorder.span(kind, **attributes) as current:
+        yield current
+
+
+def record(name: str, value: float = 1) -> None:
+    """
+    Add a value to a counter of the open spans of the current thread. Nothing is recorded outside of a span.
+
+    :param name: The name of the counter, e.g. "llm_calls".
+    :type name: str
+    :param value: The value added. Defaults to 1.
+    :type value: float
+    """
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.add(name, value)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """
+    Add the wall time of a block to a counter of the open spans of the current thread.
+
+    :param name: The name of the counter, e.g. "cypher_seconds".
+    :type name: str
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+from typing import Dict, List, Tuple
+
+from escargot.metrics.recorder import ATTRIBUTES
+
+
+class InMemorySink:
+    """
+    Keeps the records in memory, e.g. to inspect them in a notebook.
+    """
+
+    def __init__(self, max_records: int = 100000) -> None:
+        """
+        Initialize the sink.
+
+        :param max_records: The maximum number of records kept, the oldest being dropped first. Defaults to 100000.
+        :type max_records: int
+        """
+        self.max_records = max_records
+        self.records: List[Dict] = []
+        self.lock = threading.Lock()
+
+    def emit(self, record: Dict) -> None:
+        with self.lock:
+            self.records.append(record)
+            if len(self.records) > self.max_records:
+                del self.records[: len(self.records) - self.max_records]
+
+    def flush(self) -> None:
+        pass
+
+    def clear(self) -> None:
+        with self.lock:
+            self.records = []
+
+
+class JSONLSink:
+    """
+    Appends the records to a file, one JSON object per line.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the sink.
+
+        :param path: The path to the file.
+        :type path: str
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory != "" and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file = open(path, "a")
+
+    def emit(self, record: Dict) -> None:
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def flush(self) -> None:
+        with self.lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+def escape_label(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text format: backslashes, double quotes and line feeds.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusSink:
+    """
+    Aggregates the records into Prometheus metrics, rendered in the Prometheus text format.
+    The time and counters of the operations are labeled by phase, those of the knowledge requests are not labeled,
+    so that the number of series stays bounded. If a path is given, the metrics are written to it at the end of
+    each question, e.g. for the textfile collector of the node exporter.
+    """
+
+    def __init__(self, path: str = None, prefix: str = "escargot") -> None:
+        """
+        Initialize the sink.
+
+        :param path: The path to the file the metrics are written to. Defaults to None (not written).
+        :type path: str
+        :param prefix: The prefix of the metric names. Defaults to "escargot".
+        :type prefix: str
+        """
+        self.path = path
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # (metric name, labels) -> value
+        self.values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.types: Dict[str, str] = {}
+
+    def add(self, name: str, labels: Dict, value: float, type: str = "counter") -> None:
+        key = (f"{self.prefix}_{name}", tuple(sorted(labels.items())))
+        self.types[key[0]] = type
+        self.values[key] = self.values.get(key, 0) + value
+
+    def emit(self, record: Dict) -> None:
+        kind = record["kind"]
+        labels = {"phase": str(record.get("phase"))} if kind == "phase" else {}
+        with self.lock:
+            self.add(f"{kind}_seconds_sum", labels, record["time"], "summary")
+            self.add(f"{kind}_seconds_count", labels, 1, "summary")
+            for name, value in record.items():
+                if name not in ATTRIBUTES and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.add(f"{kind}_{name}_total", labels, value)
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text format.
+
+        :return: The metrics.
+        :rtype: str
+        """
+        with self.lock:
+            values = sorted(self.values.items())
+            types = dict(self.types)
+        lines = []
+        declared = set()
+        for (name, labels), value in values:
+            family = name[: -len("_sum")] if name.endswith("_sum") else name[: -len("_count")] if name.endswith("_count") else name
+            if family not in declared:
+                declared.add(family)
+                lines.append(f"# TYPE {family} {types[name]}")
+            label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> None:
+        if self.path is None:
+            return
+        text = self.render()
+        # written to a temporary file first, so that the metrics are never read half written
+        with open(self.path + ".tmp", "w") as f:
+            f.write(text)
+        os.replace(self.path + ".tmp", self.path)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 import logging
 from enum import Enum
-from typing import List, Iterator, Dict, Callable, Union
+from typing import List, Iterator, Dict, Callable, Union, Optional
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor, Future
 import itertools
 import copy
 import re
@@ -13,6 +14,9 @@ from escargot.language_models import AbstractLanguageModel
 from escargot.prompter import ESCARGOTPrompter
 from escargot.parser import ESCARGOTParser
 from escargot.coder import Coder
+from escargot.metrics import record
+from escargot.utils import bind_cancellation, check_cancelled, retrying
+from escargot.vector_db.utils import count_tokens
 
 class OperationType(Enum):
     """
@@ -41,6 +45,12 @@ class Operation(ABC):
         self.successors: List[Operation] = []
         self.executed: bool = False
         self.coder = None
+        # Token limit of the run, set by the controller
+        self.max_tokens: Optional[int] = None
+        # Executor of the speculative work of the run, set by the controller
+        self.speculation_executor: Optional[Executor] = None
+        # Whether the operation is executed again after a failed try, set by the controller
+        self.is_retry: bool = False
 
     def can_be_executed(self) -> bool:
         """
@@ -177,6 +187,7 @@ class Generate(Operation):
     def generate_from_single_thought(
         self, lm: AbstractLanguageModel, prompter: ESCARGOTPrompter, parser: ESCARGOTParser, base_state: Dict
     ):
+        check_cancelled()
         prompts = []
         responses = []
         new_states = []
@@ -197,7 +208,22 @@ class Generate(Operation):
             
             return prompts, responses, new_states
         else:
+            if base_state["phase"] == "planning" and not base_state["input"]:
+                # a question of the same shape was already answered: skip planning and go to its steps
+                cached_plan = prompter.get_cached_plan(
+                    base_state["question"], base_state.get("answer_type", "natural"), base_state.get("method", "got")
+                )
+                new_state = parser.parse_cached_plan(base_state, cached_plan) if cached_plan is not None else None
+                if new_state is not None:
+                    self.logger.info("Using cached plan for question: %s", base_state["question"])
+                    record("plan_cache_hits")
+                    return prompts, responses, [new_state]
             prompts.append(prompter.generate_prompt( **base_state))
+        speculations = None
+        if base_state["phase"] == "plan_assessment" and base_state.get("speculative", False) and not self.is_retry:
+            speculations = self.speculate_conversions(lm, prompter, base_state, parser.num_conversions)
+        # Conversions already generated while the plans were being assessed
+        speculative_responses = base_state.pop("speculative_responses", None)
         for prompt in prompts:
             if prompt is None or prompt == "":
                 self.logger.warning("Prompt for LM is empty")
@@ -206,12 +232,19 @@ class Generate(Operation):
             
             tries = 0
             while tries < 3:
+                check_cancelled()
                 try:
                     new_states = []
                     responses = []
-                    lm_responses =lm.get_response_texts(
-                        lm.query(prompt, num_responses=self.num_branches_response)
-                    )
+                    if speculative_responses is not None:
+                        lm_responses = speculative_responses
+                        # if they cannot be parsed, the next try queries the LM
+                        speculative_responses = None
+                    else:
+                        with retrying(tries > 0):
+                            lm_responses =lm.get_response_texts(
+                                lm.query(prompt, num_responses=self.num_branches_response)
+                            )
                     for response in lm_responses:
                         responses.append(response)
                         if len(self.thoughts) > 0 and self.thoughts[-1].state["phase"] == "output":
@@ -240,10 +273,79 @@ class Generate(Operation):
                 new_states[0]["full_plan"] = new_states[0]["input"]
                 self.logger.warning("Strategy:\n%s", new_states[0]["input"])
             new_states[0].pop("select_highest_score")
-            
+            if speculations is not None and highest_score_index in speculations:
+                self.cancel_speculations(speculations, keep=highest_score_index)
+                try:
+                    new_states[0]["speculative_responses"] = speculations[highest_score_index].result()
+                except Exception as e:
+                    self.logger.warning("Error in speculative Python conversion: %s", e)
+        if speculations is not None:
+            self.cancel_speculations(speculations)
         
         return prompts, responses, new_states
 
+    def cancel_speculations(self, speculations: Dict[int, Future], keep: Optional[int] = None) -> None:
+        """
+        Cancel the speculative conversions that have not started yet, except the one of the selected plan.
+
+        :param speculations: The conversions of each plan by index.
+        :type speculations: Dict[int, Future]
+        :param keep: The index of the selected plan. Defaults to None.
+        :type keep: Optional[int]
+        """
+        cancelled = sum(1 for index, future in speculations.items() if index != keep and future.cancel())
+        if cancelled > 0:
+            self.logger.info("Cancelled %d speculative Python conversions", cancelled)
+
+    def speculate_conversions(
+        self, lm: AbstractLanguageModel, prompter: ESCARGOTPrompter, base_state: Dict, num_responses: int = 3
+    ) -> Optional[Dict[int, Future]]:
+        """
+        Start the Python conversion of every candidate plan on the speculation executor of the run, while the plans are assessed.
+        Only the conversions of the selected plan are kept, and those of the other plans are cancelled if they have not started;
+        the others are spent tokens traded for latency, so nothing is started if the estimated cost would exceed the tokens left in the run.
+
+        :param lm: The language model to be used.
+        :type lm: AbstractLanguageModel
+        :param prompter: The prompter for crafting prompts.
+        :type prompter: ESCARGOTPrompter
+        :param base_state: The state of the plan assessment, whose input is the list of candidate plans.
+        :type base_state: Dict
+        :param num_responses: The number of conversions of each plan, as in the python_conversion phase. Defaults to 3.
+        :type num_responses: int
+        :return: The conversions of each plan by index, or None if the speculation was not started.
+        :rtype: Optional[Dict[int, Future]]
+        """
+        plans = base_state["input"]
+        if self.speculation_executor is None or not isinstance(plans, list) or len(plans) < 2:
+            return None
+        prompts = [
+            prompter.generate_prompt(**{**base_state, "phase": "python_conversion", "input": plan}) for plan in plans
+        ]
+        # each conversion is about as long as the prompt that describes it
+        estimates = [count_tokens(prompt) * (1 + num_responses) for prompt in prompts]
+        if self.max_tokens is not None:
+            used = lm.prompt_tokens + lm.completion_tokens
+            if used + sum(estimates) > self.max_tokens:
+                self.logger.info("Skipping speculative Python conversion: about %d tokens needed, %d left", sum(estimates), self.max_tokens - used)
+                return None
+
+        def convert(prompt: str, estimate: int) -> List[str]:
+            response = lm.query(prompt, num_responses=num_responses)
+            # the usage reported by the language model, to check the estimate against
+            usages = [getattr(item, "usage", None) for item in (response if isinstance(response, list) else [response])]
+            if usages != [] and all(usage is not None for usage in usages):
+                used = sum(usage.prompt_tokens + usage.completion_tokens for usage in usages)
+                self.logger.debug("Speculative Python conversion reported %d tokens, %d estimated", used, estimate)
+            return lm.get_response_texts(response)
+
+        speculations = {
+            index: self.speculation_executor.submit(bind_cancellation(convert), prompt, estimate)
+            for index, (prompt, estimate) in enumerate(zip(prompts, estimates))
+        }
+        self.logger.info("Started speculative Python conversion of %d plans", len(prompts))
+        return speculations
+
     def _execute(
         self, lm: AbstractLanguageModel, prompter: ESCARGOTPrompter, parser: ESCARGOTParser, got_steps: Dict, **kwargs
     ) -> None:
@@ -1,7 +1,8 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 import logging
+import re
 from .utils import strip_answer_helper, strip_answer_helper_all, parse_xml
 
 
@@ -19,6 +20,8 @@ class ESCARGOTParser:
         """
         self.cache = {}
         self.logger = logger
+        # Number of Python conversions generated for the selected plan
+        self.num_conversions = 3
 
     def parse_generate_answer(self, state: Dict, texts: List[str]) -> List[Dict]:
         """
@@ -38,7 +41,9 @@ class ESCARGOTParser:
             texts = [texts]
         for text in texts:
             self.logger.debug(f"Got response: {text}")
-            if state["method"] == "got":
+            if state["method"] == "fast" and state["phase"] == "planning":
+                new_state = self.parse_fast_answer(state, text)
+            elif state["method"] == "got" or state["method"] == "fast":
                 try:
                     if state["phase"] == "planning":
                         new_state = state.copy()
@@ -62,7 +67,7 @@ class ESCARGOTParser:
                         # new_state["phase"] = "xml_conversion"
                         new_state["previous_phase"] = "plan_assessment"
                         new_state["phase"] = "python_conversion"
-                        new_state["num_branches_response"] = 3
+                        new_state["num_branches_response"] = self.num_conversions
                         new_state["select_highest_score"] = 1
                         new_state["generate_successors"] = 1
                     elif state["phase"] == "python_conversion":
@@ -129,3 +134,67 @@ class ESCARGOTParser:
                     )
             
         return new_state
+
+    def parse_fast_answer(self, state: Dict, text: str) -> Dict:
+        """
+        Parse the single response of the fast method, which contains the plan and the XML steps.
+        If the steps cannot be parsed, the new state falls back to planning with the "got" method,
+        generating num_strategies plans as a question asked with the "got" method does.
+
+        :param state: The thought state used to generate the prompt.
+        :type state: Dict
+        :param text: The response to the prompt from the language model.
+        :type text: str
+        :return: The new thought state.
+        :rtype: Dict
+        """
+        new_state = state.copy()
+        new_state["previous_phase"] = "planning"
+        try:
+            plan = strip_answer_helper(text, "Plan") if "<Plan>" in text else ""
+            instructions, edges = parse_xml(re.sub(r"<Plan>.*?</Plan>", "", text, flags=re.DOTALL), self.logger)
+            if not instructions or any(instruction is None or instruction["Code"] == [] for instruction in instructions):
+                raise ValueError("no steps with code")
+        except Exception as e:
+            self.logger.warning(f"Could not parse the fast answer: {text}. Encountered exception: {e}. Falling back to the got method.")
+            new_state["method"] = "got"
+            new_state["input"] = ""
+            new_state["phase"] = "planning"
+            new_state["num_branches_response"] = state.get("num_strategies", 3)
+            new_state["generate_successors"] = 1
+            return new_state
+        new_state["input"] = text
+        new_state["full_plan"] = plan
+        new_state["full_code"] = "\n".join(code for instruction in instructions for code in instruction["Code"] if code)
+        new_state["phase"] = "steps"
+        new_state["instructions"] = instructions
+        new_state["edges"] = edges
+        self.logger.info("Got instructions: \n%s", instructions)
+        self.logger.info("Got edges: \n%s", edges)
+        return new_state
+
+    def parse_cached_plan(self, state: Dict, plan: Dict) -> Optional[Dict]:
+        """
+        Parse the steps of a cached plan into the state of the steps phase.
+
+        :param state: The thought state of the planning phase.
+        :type state: Dict
+        :param plan: The cached plan, with the keys "xml", "full_plan" and "full_code".
+        :type plan: Dict
+        :return: The new thought state, or None if the steps cannot be parsed.
+        :rtype: Optional[Dict]
+        """
+        instructions, edges = parse_xml(re.sub(r"<Plan>.*?</Plan>", "", plan["xml"], flags=re.DOTALL), self.logger)
+        if not instructions:
+            return None
+        new_state = state.copy()
+        new_state["input"] = plan["xml"]
+        new_state["full_plan"] = plan["full_plan"]
+        new_state["full_code"] = plan["full_code"]
+        new_state["previous_phase"] = "plan_cache"
+        new_state["phase"] = "steps"
+        new_state["instructions"] = instructions
+        new_state["edges"] = edges
+        new_state["cached_plan"] = True
+        self.logger.info("Got cached instructions: \n%s", instructions)
+        return new_state
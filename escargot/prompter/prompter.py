@@ -2,7 +2,42 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import Dict, List
 import re
+import copy
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from escargot.cache import make_key
+from escargot.cypher.graph_client import normalize_statement
+from escargot.prompter.utils import get_variable_name, convert_rows
+from escargot.utils import bind_cancellation, check_cancelled, retrying
+from escargot.metrics import span, record
+
+
+def preview(knowledge, max_length: int) -> str:
+    """
+    Get the beginning of the string representation of knowledge, without stringifying all of it
+    when it is a large list of rows.
+
+    :param knowledge: The knowledge, usually a list of rows.
+    :param max_length: The maximum length of the preview, before the trailing "...".
+    :type max_length: int
+    :return: The preview.
+    :rtype: str
+    """
+    if isinstance(knowledge, list):
+        parts = []
+        length = 0
+        for item in knowledge:
+            parts.append(repr(item))
+            length += len(parts[-1]) + 2
+            if length > max_length:
+                break
+        text = "[" + ", ".join(parts) + ("]" if len(parts) == len(knowledge) else "")
+    else:
+        text = str(knowledge)
+    if len(text) > max_length:
+        return text[:max_length] + "..."
+    return text
 
 
 class ESCARGOTPrompter:
@@ -193,6 +228,70 @@ Here is an example XML:
 Here are the instructions you must convert:
 {instructions}"""
 
+    fast_prompt = """You are a brilliant strategic thinker and Python expert with access to a knowledge graph. You will receive a question that will require the knowledge graph to answer. You will plan the steps that answer the question and convert them into Python code, in a single response.
+
+The knowledge graph contains the following generic node types: {node_types}.
+The knowledge graph contains the following relationships: {relationship_types}.
+
+Rules for the plan:
+1. Be succinct, clear, and efficient in the number of steps by avoiding redundant knowledge extractions.
+2. If a step pulls knowledge from the knowledge graph, it must name the relationship and the specific node, not a generic node type. No step should ask for a generic node type, such as "List all drugs" or "Find all diseases".
+3. If the question is a multiple choice question, the steps must include the specific options.
+4. The last step must answer the question.
+
+Rules for the code:
+1. Do not define new functions. Only use default Python packages and numpy. Do not include print statements.
+2. If the code within a step requires a request from the knowledge graph, you must use the knowledge_extract(x) function where x is the specific knowledge you are requesting. For instance, if you need to find the genes over-expressed in the brain, you would use knowledge_extract("GENE OVEREXPRESSED IN BODYPART-Brain"). This function will return a list.
+3. Do not use placeholder values, such as ['gene1', 'gene2', 'gene3'].
+
+Format your response in XML. Put the plan within <Plan> tags. Put the steps within <Instructions> tags. Each step will be within <Step> tags and will have an incremental <StepID> value within it. The full description of the step will be put in the <Instruction> tags within the <Step>. Following the <Instruction>, you must put in the code corresponding to the step within <Code> tags.
+Outside of the <Instructions> tag, add an edge list in <EdgeList>, where information from one step to another will be listed. Each edge will be within <Edge> tags, and the edge would be in the format StepID1-StepID2 which describes that StepID1 directs to StepID2.
+Do not include any other tags other than the ones mentioned above.
+
+Here is an example:
+Question: Which of the following under-expresses the genes CLTA and MARK4 ? 1. bronchus 2. sciatic nerve 3. immune system 4. internal capsule of telencephalon 5. uterus
+<Plan>
+Step 1: Find the body parts that under-express the gene CLTA. (BODYPART UNDEREXPRESSES GENE-CLTA)
+Step 2: Find the body parts that under-express the gene MARK4. (BODYPART UNDEREXPRESSES GENE-MARK4)
+Step 3: Check which of the options are in the intersect of the body parts of steps 1 and 2.
+</Plan>
+<Instructions>
+    <Step>
+        <StepID>1</StepID>
+        <Instruction>
+            Find the body parts that under-express the gene CLTA
+        </Instruction>
+        <Code>
+            bodyparts_clta = knowledge_extract("BODYPART UNDEREXPRESSES GENE-CLTA")
+        </Code>
+    </Step>
+    <Step>
+        <StepID>2</StepID>
+        <Instruction>
+            Find the body parts that under-express the gene MARK4
+        </Instruction>
+        <Code>
+            bodyparts_mark4 = knowledge_extract("BODYPART UNDEREXPRESSES GENE-MARK4")
+        </Code>
+    </Step>
+    <Step>
+        <StepID>3</StepID>
+        <Instruction>
+            Check which of the options are in the intersect of the body parts
+        </Instruction>
+        <Code>
+            answer = [option for option in ["bronchus", "sciatic nerve", "immune system", "internal capsule of telencephalon", "uterus"] if option in bodyparts_clta and option in bodyparts_mark4]
+        </Code>
+    </Step>
+</Instructions>
+<EdgeList>
+    <Edge>1-3</Edge>
+    <Edge>2-3</Edge>
+</EdgeList>
+
+Here is your question:
+{question}"""
+
     knowledge_request_adjustment_prompt = """You will be given a potential request extracting information from a knowledge graph, and you must convert the request into a specific format with the following rules:
 1. There are specific node names, generic node types, and relationships that must be used in the query. 
 2. The format of the query should be in the form of Node Name-Relationship-Node Name, where the node names can be specific nodes or generic node types.
@@ -380,7 +479,7 @@ Describe the thought process above, and then answer the question. Do not include
 
 Question:
 {question}"""
-    def __init__(self,vector_db = None, lm = None, graph_client = None, node_types = "", relationship_types = "", relationship_scores = "", logger: logging.Logger = None):
+    def __init__(self,vector_db = None, lm = None, graph_client = None, node_types = "", relationship_types = "", relationship_scores = "", logger: logging.Logger = None, knowledge_cache = None, plan_cache = None):
         self.vector_db = vector_db
         self.lm = lm
         self.graph_client = graph_client
@@ -388,6 +487,12 @@ Question:
         self.relationship_types = relationship_types
         self.relationship_scores = relationship_scores
         self.logger = logger
+        # Extracted knowledge per knowledge request and instruction, shared by the prompters of an Escargot instance
+        self.knowledge_cache = knowledge_cache
+        # Steps of answered questions per question shape, shared by the prompters of an Escargot instance
+        self.plan_cache = plan_cache
+        # Convert common shapes of Cypher results without asking the language model
+        self.rule_based_conversion = True
         pass
      
     def generate_prompt(
@@ -406,7 +511,7 @@ Question:
         :type question: str
         :param question_type: The type of the question.
         :type question_type: str
-        :param method: The method used to generate the prompt.
+        :param method: The method used to generate the prompt: "got", or "fast" to plan and write the steps in a single prompt.
         :type method: str
         :param input: The intermediate solution.
         :type input: str
@@ -416,7 +521,9 @@ Question:
         :raise AssertionError: If method is not implemented yet.
         """
         assert question is not None, "Question should not be None."
-        if method == "got":
+        if method == "fast" and kwargs["phase"] == "planning":
+            return self.fast_prompt.format(question=question, node_types=self.node_types, relationship_types=self.relationship_types)
+        if method == "got" or method == "fast":
             if (input is None or input == "") and kwargs["phase"] == "planning":
                 return self.planning_prompt.format(question=question, node_types=self.node_types, relationship_types=self.relationship_types, relationship_scores=self.relationship_scores)
             elif kwargs["phase"] == "plan_assessment":
@@ -444,10 +551,115 @@ Question:
                     return self.output_prompt.format(question=question, steps=steps)
         else:
             raise AssertionError(f"Method {method} is not implemented yet.")
+    def get_plan_fingerprint(self) -> str:
+        """
+        Get the fingerprint of the schema the plans are made against: the node and relationship types given
+        to the language model, and the schema of the graph client.
+        """
+        fingerprint = self.graph_client.schema_fingerprint() if self.graph_client is not None else None
+        return make_key(fingerprint, self.node_types, self.relationship_types)
+
+    def get_cached_plan(self, question: str, answer_type: str = "natural", method: str = "got"):
+        """
+        Get the cached steps of a question of the same shape, answer type and method, with the entities of the question substituted.
+
+        :param question: The question.
+        :type question: str
+        :param answer_type: The answer type of the question. Defaults to "natural".
+        :type answer_type: str
+        :param method: The method the question is answered with. Defaults to "got".
+        :type method: str
+        :return: The plan, with the keys "xml", "full_plan" and "full_code", or None if no plan is cached.
+        :rtype: Optional[Dict]
+        """
+        if self.plan_cache is None:
+            return None
+        return self.plan_cache.get(question, self.node_types, self.get_plan_fingerprint(), answer_type, method)
+
+    def cache_plan(self, state: Dict) -> bool:
+        """
+        Store the steps of an answered question in the plan cache.
+
+        :param state: The state of the steps, whose input is their XML.
+        :type state: Dict
+        :return: True if the steps were stored, False otherwise.
+        :rtype: bool
+        """
+        if self.plan_cache is None:
+            return False
+        plan = {"xml": state["input"], "full_plan": state.get("full_plan", ""), "full_code": state.get("full_code", "")}
+        return self.plan_cache.set(
+            state["question"], self.node_types, self.get_plan_fingerprint(), plan, state.get("answer_type", "natural"), state.get("method", "got")
+        )
+
+    def get_knowledge_key(self, knowledge_request, instruction):
+        """
+        Get the cache key of a knowledge request. It includes the schema fingerprint of the graph client,
+        so that entries are invalidated when the knowledge graph changes.
+        The entries are the knowledge before its conversion, which depends on the code making the request.
+        """
+        fingerprint = self.graph_client.schema_fingerprint() if self.graph_client is not None else None
+        return make_key("knowledge_rows", normalize_statement(knowledge_request), normalize_statement(instruction), fingerprint)
+
     def get_knowledge(self,knowledge_request,instruction, code = "", full_code = ""):
+        """
+        Extract the knowledge of a request, as a Python object. The Cypher rows of a request are cached
+        per request and instruction, and converted for the code of the step on every call.
+        The request is recorded as a "knowledge" span of the metrics of the question.
+
+        :param knowledge_request: The knowledge request.
+        :type knowledge_request: str
+        :param instruction: The instruction of the step making the request.
+        :type instruction: str
+        :param code: The line of code making the request. Defaults to "".
+        :type code: str
+        :param full_code: The code of the step. Defaults to "".
+        :type full_code: str
+        :return: The knowledge.
+        """
+        with span("knowledge", request=knowledge_request):
+            if self.knowledge_cache is None or self.graph_client is None or knowledge_request == "" or knowledge_request is None:
+                return self.extract_knowledge(knowledge_request, instruction, code, full_code)
+            key = self.get_knowledge_key(knowledge_request, instruction)
+            entry = self.knowledge_cache.get(key)
+            if entry is not None:
+                self.logger.info(f"Using cached knowledge for {knowledge_request}")
+                record("knowledge_cache_hits")
+                knowledge, is_rows = entry
+                # the conversion and the generated code may modify the object they get
+                knowledge = copy.deepcopy(knowledge)
+            else:
+                knowledge, is_rows = self.fetch_knowledge(knowledge_request, instruction)
+                if knowledge is not None and not (hasattr(knowledge, "__len__") and len(knowledge) == 0):
+                    self.knowledge_cache[key] = (copy.deepcopy(knowledge), is_rows)
+            if is_rows:
+                return self.convert_knowledge(knowledge, knowledge_request, code, full_code)
+            return knowledge
+
+    def extract_knowledge(self,knowledge_request,instruction, code = "", full_code = ""):
+        """
+        Extract the knowledge of a request, converting the Cypher rows for the code of the step.
+        """
+        knowledge, is_rows = self.fetch_knowledge(knowledge_request, instruction)
+        if is_rows:
+            return self.convert_knowledge(knowledge, knowledge_request, code, full_code)
+        return knowledge
+
+    def fetch_knowledge(self, knowledge_request, instruction):
+        """
+        Fetch the knowledge of a request from the knowledge graph, or from the vector database if the graph has none.
+
+        :param knowledge_request: The knowledge request.
+        :type knowledge_request: str
+        :param instruction: The instruction of the step making the request.
+        :type instruction: str
+        :return: The knowledge, and whether it is Cypher rows that still have to be converted for the code of the step.
+        :rtype: Tuple[Any, bool]
+        """
+        check_cancelled()
         statement_to_embed = knowledge_request
         if statement_to_embed == "" or statement_to_embed is None:
-            return []
+            return [], False
         # statement_to_embed = self.lm.get_response_texts(
         #     self.lm.query(self.knowledge_request_adjustment_prompt.format(node_types=self.node_types,relationship_types=self.relationship_types, statement_to_embed=statement_to_embed), num_responses=1)
         # )
@@ -455,9 +667,9 @@ Question:
         statement_to_embed_cleaned = statement_to_embed.replace("!","")
         # If it's a cypher query, then execute the query and return the results directly
         if self.graph_client is not None:
-            knowledge_array = self.graph_client.execute(self.lm, self.memgraph_prompt_1.format(schema=self.graph_client.schema) + str(self.memgraph_prompt_2) + str(self.memgraph_prompt_3.format(instruction=str(instruction),cypher=str(statement_to_embed))),str(statement_to_embed))
+            knowledge_array, cypher = self.graph_client.execute(self.lm, self.memgraph_prompt_1.format(schema=self.graph_client.schema) + str(self.memgraph_prompt_2) + str(self.memgraph_prompt_3.format(instruction=str(instruction),cypher=str(statement_to_embed))),str(statement_to_embed))
             
-            self.logger.info(f"Cypher knowledge for {statement_to_embed}: {str(knowledge_array)}")
+            self.logger.info(f"Cypher knowledge for {statement_to_embed} ({len(knowledge_array)} rows): {preview(knowledge_array, 1024)}")
 
             #backup if the memgraph client fails or doesn't provide any knowledge
             if knowledge_array == [] and self.vector_db is not None:
@@ -470,66 +682,115 @@ Question:
                     #if there is only once specific node and nothing else, then return the knowledge
                     embedded_question = self.lm.get_embedding(statement_to_embed_cleaned)
                     node_filters = re.findall(r'!(.*?)!', statement_to_embed)
-                    knowledge_arrays = []
-                    for node_filter in node_filters:
-                        knowledge_array,distances = self.vector_db.get_knowledge(embedded_question, keyword_filter = node_filter)
-                        if len(node_filters) > 1:
-                            for node_filter in node_filters:
-                                knowledge_array = [knowledge for knowledge in knowledge_array if node_filter in knowledge]
-                        knowledge_arrays.append(knowledge_array)
-                    knowledge_array = list(set().union(*knowledge_arrays))
+                    knowledge_array = self.get_filtered_knowledge(embedded_question, node_filters)
                 else:
                     embedded_question = self.lm.get_embedding(statement_to_embed)
                     knowledge_array,distances = self.vector_db.get_knowledge(embedded_question)
+                record("vector_hits", len(knowledge_array))
                 tries = 0
                 while tries < 3:
                     tries += 1
                     try:
-                        knowledge_array = self.lm.get_response_texts(
-                            self.lm.query(self.clean_up_vector_db_prompt.format(knowledge="\n".join(knowledge_array), instruction=instruction), num_responses=1)
-                        )
+                        with retrying(tries > 1):
+                            knowledge_array = self.lm.get_response_texts(
+                                self.lm.query(self.clean_up_vector_db_prompt.format(knowledge="\n".join(knowledge_array), instruction=instruction), num_responses=1)
+                            )
                         knowledge_array = knowledge_array[0]
                         knowledge_array = eval(knowledge_array)
                         break
                     except Exception as e:
                         self.logger.error(f"Error in vector db: {e}, trying again {tries}")
                 self.logger.info(f"Vector DB knowledge for {statement_to_embed}: {knowledge_array}")
-            elif knowledge_array != []:
+                return knowledge_array, False
+            return knowledge_array, knowledge_array != []
+        return "knowledge", False
 
+    def convert_knowledge(self, knowledge_array, statement_to_embed, code = "", full_code = ""):
+        """
+        Convert the Cypher rows of a knowledge request into the data structure the code of the step expects,
+        without the language model for the common shapes of rows.
+
+        :param knowledge_array: The Cypher rows.
+        :type knowledge_array: List[Dict]
+        :param statement_to_embed: The knowledge request.
+        :type statement_to_embed: str
+        :param code: The line of code making the request. Defaults to "".
+        :type code: str
+        :param full_code: The code of the step. Defaults to "".
+        :type full_code: str
+        :return: The converted knowledge, or the rows if no conversion succeeded.
+        """
+        # Common result shapes are converted without the language model
+        variable_name = get_variable_name(code)
+        converted = None
+        if self.rule_based_conversion and variable_name is not None:
+            converted = convert_rows(knowledge_array, variable_name, full_code)
+        if converted is not None:
+            self.logger.info(f"Converted knowledge for {statement_to_embed} without the language model: {preview(converted, 256)}")
+            knowledge_array = converted
+        else:
+            if variable_name is None:
                 variable_name = self.lm.get_response_texts(
                     self.lm.query(self.determine_variable_name_prompt.format(code=code), num_responses=1)
                 )
                 variable_name = variable_name[0]
 
-                knowledge_array_string = str(knowledge_array)[0:128]+"..."  
-                conversion_codes = self.lm.get_response_texts(
-                        self.lm.query(self.convert_datastructure_prompt.format(variable=variable_name, knowledge_array=knowledge_array_string, code=full_code), num_responses=3)
-                    )
-                i = 0
-                while i < 3:
-                    try:
-                        conversion_code = conversion_codes[i]
-                        i += 1
-                        #find code in ```python tags
-                        if "```python" in conversion_code:
-                            conversion_code = re.findall(r'```python(.*?)```', conversion_code, re.DOTALL)[0]
-                        elif "```" in conversion_code:
-                            conversion_code = re.findall(r'```(.*?)```', conversion_code, re.DOTALL)[0]
-                        else:
-                            conversion_code = ""
-
-                        if conversion_code != "":
-                            conversion_code = variable_name + " = " + str(knowledge_array) + "\n" + conversion_code
-                            #execute the code
-                            exec(conversion_code)
-                            knowledge_array = eval(variable_name)
-                        break
-                    except Exception as e:
-                        
-                        self.logger.error(f"Error in converting data structure: {e}, trying again {i}")
-                
-            return knowledge_array
-        return "knowledge"
+            knowledge_array_string = preview(knowledge_array, 128)
+            conversion_codes = self.lm.get_response_texts(
+                    self.lm.query(self.convert_datastructure_prompt.format(variable=variable_name, knowledge_array=knowledge_array_string, code=full_code), num_responses=3)
+                )
+            i = 0
+            while i < 3:
+                try:
+                    conversion_code = conversion_codes[i]
+                    i += 1
+                    #find code in ```python tags
+                    if "```python" in conversion_code:
+                        conversion_code = re.findall(r'```python(.*?)```', conversion_code, re.DOTALL)[0]
+                    elif "```" in conversion_code:
+                        conversion_code = re.findall(r'```(.*?)```', conversion_code, re.DOTALL)[0]
+                    else:
+                        conversion_code = ""
+
+                    if conversion_code != "":
+                        #execute the code on the rows themselves rather than on their string representation,
+                        #so that large results are neither stringified nor parsed again
+                        namespace = {variable_name: knowledge_array}
+                        exec(conversion_code, namespace)
+                        knowledge_array = namespace[variable_name]
+                    break
+                except Exception as e:
+
+                    self.logger.error(f"Error in converting data structure: {e}, trying again {i}")
+
+        return knowledge_array
+
+    def get_filtered_knowledge(self, embedded_question, node_filters):
+        """
+        Retrieve the knowledge mentioning every node of a request from the vector database.
+        The hybrid queries of the nodes are issued concurrently, and only the knowledge containing all the nodes is kept.
+
+        :param embedded_question: The embedding of the knowledge request.
+        :type embedded_question: List[float]
+        :param node_filters: The nodes of the request.
+        :type node_filters: List[str]
+        :return: The knowledge, without duplicates.
+        :rtype: List[str]
+        """
+        node_filters = list(dict.fromkeys(node_filters))
+        if len(node_filters) <= 1:
+            results = [self.vector_db.get_knowledge(embedded_question, keyword_filter = node_filter) for node_filter in node_filters]
+        else:
+            with ThreadPoolExecutor(max_workers=len(node_filters)) as executor:
+                results = list(executor.map(bind_cancellation(lambda node_filter: self.vector_db.get_knowledge(embedded_question, keyword_filter = node_filter)), node_filters))
+        # dict keys keep the first occurrence of each knowledge, in order
+        knowledge_set = {}
+        for knowledge_array, distances in results:
+            knowledge_set.update(dict.fromkeys(knowledge_array))
+        if len(node_filters) > 1:
+            return [knowledge for knowledge in knowledge_set if all(node_filter in knowledge for node_filter in node_filters)]
+        return list(knowledge_set)
+
     def generate_debug_code_prompt(self, code, instruction, e):
         prompt = self.debug_code_prompt.format(instruction=instruction, code=code, error=e)
         return prompt
@@ -0,0 +1,125 @@
+import re
+from typing import Any, Dict, List, Optional
+
+
+def get_variable_name(code: str) -> Optional[str]:
+    """
+    Find the variable a line of code assigns the result of a knowledge request to.
+
+    :param code: The line of code making the knowledge request.
+    :type code: str
+    :return: The variable name, or None if the line is not a plain assignment of a knowledge request.
+    :rtype: Optional[str]
+    """
+    match = re.search(r"^\s*([A-Za-z_]\w*)\s*=\s*knowledge_(?:extract|request)\(", str(code), re.MULTILINE)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def is_path(value: Any) -> bool:
+    return hasattr(value, "_relationships") and hasattr(value, "_nodes")
+
+
+def is_relationship(value: Any) -> bool:
+    return hasattr(value, "_start_node_id") and hasattr(value, "_end_node_id")
+
+
+def node_name(node: Any) -> Any:
+    """
+    Get a readable name of a graph node: its common name or name property, or its id.
+    """
+    properties = getattr(node, "_properties", {}) or {}
+    for key in ("commonName", "name", "geneSymbol"):
+        if key in properties:
+            return properties[key]
+    return getattr(node, "_id", node)
+
+
+def to_edges(value: Any, nodes: Dict[Any, Any]) -> List[tuple]:
+    """
+    Convert a path or a relationship into a list of (start, relationship type, end) edges.
+    """
+    if is_path(value):
+        for node in value._nodes:
+            nodes[getattr(node, "_id", None)] = node
+        relationships = value._relationships
+    else:
+        relationships = [value]
+    edges = []
+    for relationship in relationships:
+        start = nodes.get(relationship._start_node_id, relationship._start_node_id)
+        end = nodes.get(relationship._end_node_id, relationship._end_node_id)
+        edges.append((node_name(start), getattr(relationship, "_type", ""), node_name(end)))
+    return edges
+
+
+def uses_as_dict(variable_name: str, code: str) -> bool:
+    """
+    Check whether code uses a variable as a dictionary: calls its items, keys, values or get methods, or subscripts it with a string.
+    """
+    variable = re.escape(variable_name)
+    return re.search(rf"\b{variable}\s*(\.\s*(items|keys|values|get)\s*\(|\[\s*f?['\"])", code) is not None
+
+
+def convert_rows(rows: List[Dict], variable_name: str, code: str) -> Optional[Any]:
+    """
+    Convert the rows of a Cypher query into the data structure the code of a step most likely expects,
+    for the common shapes of results:
+    - rows whose column names are used in the code are kept as they are;
+    - paths and relationships become a list of (start, relationship type, end) edges;
+    - a single column becomes a list of its values;
+    - two columns become a dictionary if the code uses the variable as one (the values of repeated keys
+      are gathered in lists), and a list of pairs otherwise.
+
+    :param rows: The rows of the Cypher query.
+    :type rows: List[Dict]
+    :param variable_name: The variable the code assigns the knowledge to.
+    :type variable_name: str
+    :param code: The code of the step.
+    :type code: str
+    :return: The converted knowledge, or None if the shape of the rows is not one of the common ones.
+    :rtype: Optional[Any]
+    """
+    if not isinstance(rows, list) or rows == [] or not all(isinstance(row, dict) for row in rows):
+        return None
+    columns = list(rows[0].keys())
+    if any(list(row.keys()) != columns for row in rows):
+        return None
+    code = str(code)
+    if any(f"'{column}'" in code or f'"{column}"' in code for column in columns):
+        return rows
+
+    values = [row[column] for row in rows for column in columns]
+    if any(is_path(value) or is_relationship(value) for value in values):
+        if not all(is_path(value) or is_relationship(value) for value in values):
+            return None
+        nodes = {}
+        edges = []
+        for value in values:
+            for edge in to_edges(value, nodes):
+                if edge not in edges:
+                    edges.append(edge)
+        return edges
+
+    if len(columns) == 1:
+        return [row[columns[0]] for row in rows]
+
+    if len(columns) == 2:
+        key_column, value_column = columns
+        if not uses_as_dict(variable_name, code):
+            return [(row[key_column], row[value_column]) for row in rows]
+        keys = [row[key_column] for row in rows]
+        try:
+            unique_keys = len(set(keys)) == len(keys)
+        except TypeError:
+            # unhashable keys cannot be dictionary keys
+            return None
+        if unique_keys:
+            return {row[key_column]: row[value_column] for row in rows}
+        knowledge = {}
+        for row in rows:
+            knowledge.setdefault(row[key_column], []).append(row[value_column])
+        return knowledge
+
+    return None
@@ -1,5 +1,141 @@
-
 import json
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Optional
+
+
+class OperationCancelled(BaseException):
+    """
+    Raised in the work of a question that was cancelled, e.g. after its timeout.
+    Like asyncio.CancelledError, it is not an Exception, so that the retry loops catching
+    Exception let it through instead of retrying the cancelled work.
+    """
+
+
+# The cancellation event of the question the current thread works for, set by the controller
+_cancellation_event: ContextVar[Optional[threading.Event]] = ContextVar("cancellation_event", default=None)
+
+
+def set_cancellation_event(event: Optional[threading.Event]):
+    """
+    Set the cancellation event of the current thread.
+
+    :param event: The cancellation event, or None.
+    :type event: Optional[threading.Event]
+    :return: The token to reset the previous event with reset_cancellation_event.
+    """
+    return _cancellation_event.set(event)
+
+
+def reset_cancellation_event(token) -> None:
+    _cancellation_event.reset(token)
+
+
+def get_cancellation_event() -> Optional[threading.Event]:
+    return _cancellation_event.get()
+
+
+def check_cancelled() -> None:
+    """
+    Raise OperationCancelled if the question the current thread works for was cancelled.
+
+    :raise OperationCancelled: If the cancellation event of the current thread is set.
+    """
+    event = _cancellation_event.get()
+    if event is not None and event.is_set():
+        raise OperationCancelled()
+
+
+# Whether the current thread retries failed work, so that the cached responses of the failed try are not served again
+_retrying: ContextVar[bool] = ContextVar("retrying", default=False)
+
+
+@contextmanager
+def retrying(enabled: bool = True):
+    """
+    Mark the work of the current thread as a retry while the context is entered. Language models do not serve
+    cached responses to a retry, since the same prompt would get back the response that failed, and cache the new
+    responses instead. Threads started with bind_cancellation inherit the mark.
+
+    :param enabled: Whether the work is a retry, e.g. tries > 0. Defaults to True.
+    :type enabled: bool
+    """
+    token = _retrying.set(_retrying.get() or enabled)
+    try:
+        yield
+    finally:
+        _retrying.reset(token)
+
+
+def is_retrying() -> bool:
+    return _retrying.get()
+
+
+def bind_cancellation(function: Callable) -> Callable:
+    """
+    Wrap a function so that it sees the cancellation event of the calling thread when it runs on another thread,
+    e.g. in a thread pool, along with the other context variables of the calling thread such as its metrics spans.
+
+    :param function: The function.
+    :type function: Callable
+    :return: The wrapped function.
+    :rtype: Callable
+    """
+    context = copy_context()
+
+    def wrapper(*args, **kwargs):
+        # a context cannot be entered by two threads at once, so each call runs in its own copy
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
+
+
+def run_cancellable(function: Callable, *args, on_cancel: Optional[Callable] = None, poll_interval: float = 0.1, **kwargs) -> Any:
+    """
+    Run a blocking call, such as a request to a language model or a database, so that the caller is released
+    within poll_interval seconds of a cancellation. The call then runs on a daemon thread, which is abandoned
+    on cancellation after on_cancel is called to abort it (e.g. by closing its connection); it otherwise ends
+    with the timeout of its request. Without a cancellation event, the call is made directly.
+
+    :param function: The blocking function.
+    :type function: Callable
+    :param on_cancel: Function aborting the call on cancellation. Defaults to None.
+    :type on_cancel: Optional[Callable]
+    :param poll_interval: Seconds between two checks of the cancellation event. Defaults to 0.1.
+    :type poll_interval: float
+    :return: The result of the call.
+    :raise OperationCancelled: If the cancellation event is set before the call returns.
+    """
+    event = _cancellation_event.get()
+    if event is None:
+        return function(*args, **kwargs)
+    check_cancelled()
+    outcome = {}
+    done = threading.Event()
+    bound = bind_cancellation(function)
+
+    def target():
+        try:
+            outcome["result"] = bound(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=target, daemon=True).start()
+    while not done.wait(poll_interval):
+        if event.is_set():
+            if on_cancel is not None:
+                try:
+                    on_cancel()
+                except Exception:
+                    pass
+            raise OperationCancelled()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
 
 def output_controller(operations_graph):
 
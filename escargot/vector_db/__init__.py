@@ -1,2 +1,3 @@
 from escargot.vector_db.azure_embedding import *
 from escargot.vector_db.weaviate import *
+from escargot.vector_db.local import *
\ No newline at end of file
@@ -0,0 +1,285 @@
+import os
+import re
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from escargot.vector_db.utils import count_tokens
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", str(text).lower())
+
+
+class LocalVectorClient:
+    """
+    In-process vector database with the same get_knowledge interface as WeaviateClient.
+
+    The knowledge is stored in a folder as a float32 matrix of normalized vectors (vectors.f32, memory-mapped)
+    and the matching texts (knowledge.jsonl). Searches are exact ("flat" index, NumPy over the memory map, or FAISS
+    if it is installed) or approximate ("hnsw" index, which requires FAISS). Distances are cosine distances,
+    like those of Weaviate. An inverted index of the words of the texts is built when they are loaded, so that
+    keyword filtered requests only search the rows containing every word of the keyword.
+    """
+
+    def __init__(self, config_path, logger):
+        self.config: Dict = None
+        self.logger = logger
+        if type(config_path) == dict:
+            self.config = config_path
+        else:
+            self.load_config(config_path)
+        if "local_vector" not in self.config:
+            self.client = None
+        else:
+            self.config: Dict = self.config["local_vector"]
+            self.path = self.config["path"]
+            self.limit = self.config.get("limit", 200)
+            self.index_type = self.config.get("index", "flat")
+            # Number of rows multiplied at once when searching the memory map without FAISS
+            self.chunk_size = self.config.get("chunk_size", 65536)
+            # Tokenizer used to count the tokens of the knowledge
+            self.encoding = self.config.get("encoding", "cl100k_base")
+            # Cosine distance threshold of keyword filtered requests, looser than max_distance because the rows
+            # already mention the keyword
+            self.keyword_max_distance = self.config.get("keyword_max_distance", 0.5)
+            self.lock = threading.Lock()
+            self.dimension = None
+            self.vectors = None
+            self.texts: List[str] = []
+            self.index = None
+            # word -> rows of the texts containing it
+            self.keyword_index: Dict[str, np.ndarray] = {}
+            self.open()
+            if self.config.get("dump") and len(self.texts) == 0:
+                self.bulk_load(self.config["dump"])
+            self.client = self
+
+    def load_config(self, path: str) -> None:
+        """
+        Load configuration from a specified path.
+
+        :param path: Path to the config file. If an empty path provided,
+                     default is `config.json` in the current directory.
+        :type path: str
+        """
+        if path == "":
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            path = os.path.join(current_dir, "config.json")
+
+        with open(path, "r") as f:
+            self.config = json.load(f)
+
+    def open(self) -> None:
+        """
+        Open the vectors and texts stored in the folder, and build the index.
+        """
+        with self.lock:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            self.texts = []
+            self.vectors = None
+            self.index = None
+            self.keyword_index = {}
+            meta_path = os.path.join(self.path, "meta.json")
+            if not os.path.exists(meta_path):
+                return
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            self.dimension = meta["dimension"]
+            with open(os.path.join(self.path, "knowledge.jsonl"), "r") as f:
+                self.texts = [json.loads(line) for line in f]
+            if len(self.texts) == 0:
+                return
+            self.vectors = np.memmap(
+                os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r", shape=(len(self.texts), self.dimension)
+            )
+            self.build_index()
+            self.build_keyword_index()
+
+    def build_keyword_index(self) -> None:
+        postings: Dict[str, List[int]] = {}
+        for row, text in enumerate(self.texts):
+            for word in set(tokenize(text)):
+                postings.setdefault(word, []).append(row)
+        self.keyword_index = {word: np.array(rows, dtype=np.int64) for word, rows in postings.items()}
+
+    def keyword_rows(self, keyword: str) -> np.ndarray:
+        """
+        Find the rows whose text contains a keyword, from the inverted index.
+
+        :param keyword: The keyword, possibly of several words.
+        :type keyword: str
+        :return: The rows, in increasing order.
+        :rtype: np.ndarray
+        """
+        words = tokenize(keyword)
+        if words == []:
+            return np.empty(0, dtype=np.int64)
+        rows = None
+        # rarest words first, so that the intersection shrinks quickly
+        for word in sorted(set(words), key=lambda word: len(self.keyword_index.get(word, ()))):
+            postings = self.keyword_index.get(word)
+            if postings is None:
+                return np.empty(0, dtype=np.int64)
+            rows = postings if rows is None else np.intersect1d(rows, postings, assume_unique=True)
+            if len(rows) == 0:
+                return rows
+        keyword = keyword.lower()
+        # the words may be in another order or separated by other words in the candidates
+        return np.array([row for row in rows if keyword in self.texts[row].lower()], dtype=np.int64)
+
+    def build_index(self) -> None:
+        if faiss is None:
+            if self.index_type == "hnsw":
+                self.logger.warning("FAISS is not installed, using an exact flat index instead of HNSW.")
+            return
+        if self.index_type == "hnsw":
+            self.index = faiss.IndexHNSWFlat(self.dimension, self.config.get("hnsw_m", 32), faiss.METRIC_INNER_PRODUCT)
+        else:
+            self.index = faiss.IndexFlatIP(self.dimension)
+        for start in range(0, len(self.texts), self.chunk_size):
+            self.index.add(np.ascontiguousarray(self.vectors[start:start + self.chunk_size]))
+
+    def bulk_load(self, dump_path: str, embed: Optional[Callable[[List[str]], List[List[float]]]] = None, batch_size: int = 1024) -> int:
+        """
+        Append the knowledge of a JSONL dump to the database and rebuild the index.
+        Each line is an object with a "knowledge" text and its "vector". Lines without a vector
+        are embedded with embed, e.g. the get_embeddings method of a language model.
+
+        :param dump_path: The path to the dump.
+        :type dump_path: str
+        :param embed: Function embedding a batch of texts. Defaults to None.
+        :type embed: Optional[Callable[[List[str]], List[List[float]]]]
+        :param batch_size: The number of lines written at once. Defaults to 1024.
+        :type batch_size: int
+        :return: The number of texts loaded.
+        :rtype: int
+        """
+        loaded = 0
+        with open(dump_path, "r") as dump:
+            batch = []
+            for line in dump:
+                if line.strip() == "":
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    loaded += self.append(batch, embed)
+                    batch = []
+            if batch != []:
+                loaded += self.append(batch, embed)
+        self.open()
+        self.logger.info(f"Loaded {loaded} texts from {dump_path} into the local vector database {self.path}.")
+        return loaded
+
+    def append(self, records: List[Dict], embed: Optional[Callable] = None) -> int:
+        texts = [record["knowledge"] for record in records]
+        missing = [i for i, record in enumerate(records) if record.get("vector") is None]
+        vectors = [record.get("vector") for record in records]
+        if missing != []:
+            if embed is None:
+                raise ValueError("Records without a vector need an embed function.")
+            for i, vector in zip(missing, embed([texts[i] for i in missing])):
+                vectors[i] = vector
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # Normalized, so that the inner product is the cosine similarity
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self.lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                with open(os.path.join(self.path, "meta.json"), "w") as f:
+                    json.dump({"dimension": self.dimension}, f)
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Vectors of dimension {vectors.shape[1]} cannot be added to a database of dimension {self.dimension}.")
+            with open(os.path.join(self.path, "vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(os.path.join(self.path, "knowledge.jsonl"), "a") as f:
+                for text in texts:
+                    f.write(json.dumps(text) + "\n")
+        return len(texts)
+
+    def search(self, embedded_question: List[float], limit: int, rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Find the rows most similar to a vector.
+
+        :param embedded_question: The vector.
+        :type embedded_question: List[float]
+        :param limit: The maximum number of rows returned.
+        :type limit: int
+        :param rows: The rows to search in. Defaults to None (all the rows).
+        :type rows: Optional[np.ndarray]
+        :return: The rows and their cosine similarities, most similar first.
+        :rtype: List[Tuple[int, float]]
+        """
+        if self.vectors is None or limit <= 0:
+            return []
+        query = np.asarray(embedded_question, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        if rows is None and self.index is not None:
+            similarities, found = self.index.search(query.reshape(1, -1), min(limit, len(self.texts)))
+            return [(int(row), float(similarity)) for row, similarity in zip(found[0], similarities[0]) if row >= 0]
+        total = len(self.texts) if rows is None else len(rows)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_similarities = np.empty(0, dtype=np.float32)
+        for start in range(0, total, self.chunk_size):
+            if rows is None:
+                # contiguous slices are read straight from the memory map
+                chunk = np.arange(start, min(start + self.chunk_size, total))
+                similarities = self.vectors[start:start + self.chunk_size] @ query
+            else:
+                chunk = rows[start:start + self.chunk_size]
+                similarities = self.vectors[chunk] @ query
+            best_rows = np.concatenate([best_rows, chunk])
+            best_similarities = np.concatenate([best_similarities, similarities])
+            if len(best_rows) > limit:
+                top = np.argpartition(-best_similarities, limit - 1)[:limit]
+                best_rows = best_rows[top]
+                best_similarities = best_similarities[top]
+        order = np.argsort(-best_similarities)
+        return [(int(best_rows[i]), float(best_similarities[i])) for i in order]
+
+    def get_knowledge(self, embedded_question, max_tokens=4000, max_distance = 0.3, min_score = 0.003, keyword_filter=''):
+        """
+        Retrieve the knowledge nearest to an embedded question, within a token budget.
+        Keyword filtered requests keep the rows containing the keyword within keyword_max_distance;
+        min_score is a threshold on the hybrid scores of Weaviate and does not apply to cosine similarities.
+
+        :return: The knowledge and its cosine distances, or its cosine similarities for keyword filtered requests.
+        :rtype: Tuple[List[str], List[float]]
+        """
+        if keyword_filter != '':
+            rows = self.keyword_rows(keyword_filter)
+            knowledge_array = self.search(embedded_question, self.limit, rows) if len(rows) > 0 else []
+            max_distance = self.keyword_max_distance
+        else:
+            knowledge_array = self.search(embedded_question, self.limit)
+        in_context = []
+        distances = []
+        cur_tokens = 0
+        for row, similarity in knowledge_array:
+            knowledge = self.texts[row]
+            if 1 - similarity > max_distance:
+                break
+
+            cur_tokens += count_tokens(knowledge, self.encoding)
+            if cur_tokens > max_tokens:
+                break
+            in_context.append(knowledge)
+
+            if keyword_filter == '' :
+                distances.append(1 - similarity)
+            else:
+                distances.append(similarity)
+
+        return in_context, distances
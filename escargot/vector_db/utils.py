@@ -0,0 +1,42 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base"):
+    """
+    Get a tiktoken encoding, loading it once.
+
+    :param encoding_name: The name of the encoding. Defaults to "cl100k_base".
+    :type encoding_name: str
+    :return: The encoding, or None if tiktoken is not installed or the encoding cannot be loaded.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """
+    Count the tokens of a text with tiktoken, or estimate them by counting words if tiktoken is not available.
+    Counts are cached, since the same knowledge is counted again for every request it is retrieved for.
+
+    :param text: The text.
+    :type text: str
+    :param encoding_name: The name of the encoding. Defaults to "cl100k_base".
+    :type encoding_name: str
+    :return: The number of tokens.
+    :rtype: int
+    """
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return len(text.split(" "))
+    return len(encoding.encode(text, disallowed_special=()))
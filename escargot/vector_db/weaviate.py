@@ -1,11 +1,14 @@
 import weaviate
 import os
+import re
 from openai import AzureOpenAI
 import numpy as np
 from typing import Dict
 import json
 import logging
 
+from escargot.vector_db.utils import count_tokens
+
 weaviate_client = None
 
 class WeaviateClient:
@@ -24,6 +27,10 @@ class WeaviateClient:
             self.api_key = self.config["api_key"]
             self.db = self.config["db"]
             self.limit = self.config["limit"]
+            # Cut the nearest neighbours after this many jumps in distance, None to disable
+            self.autocut = self.config.get("autocut", None)
+            # Tokenizer used to count the tokens of the knowledge
+            self.encoding = self.config.get("encoding", "cl100k_base")
             self.client = self.get_client()
         
     def load_config(self, path: str) -> None:
@@ -92,15 +99,33 @@ class WeaviateClient:
             .do()
         )
     
-    def query_with_hybrid(self, properties=["knowledge"], near_vector=[],  near_text='', additional="score", autocut=5):
-        return ((self.client.query
-            .get(self.db, properties))
+    def query_with_hybrid(self, properties=["knowledge"], near_vector=[],  near_text='', additional="score", autocut=5, where=None):
+        query = (self.client.query
+            .get(self.db, properties)
             .with_hybrid(query = near_text, vector = near_vector, alpha = 0.8)
             # .with_limit(limit)
             .with_autocut(autocut)
-            .with_additional(additional)
-            .do()
-        )
+            .with_additional(additional))
+        if where is not None:
+            query = query.with_where(where)
+        return query.do()
+
+    def query_near_vector_filtered(self, properties=["knowledge"], near_vector={}, additional="distance", limit=3, max_distance=None, autocut=None):
+        """
+        Query the nearest neighbours of a vector, letting Weaviate drop the objects farther than max_distance
+        and cut the results with autocut, so that only the objects kept are transferred.
+        """
+        near_vector = {"vector": near_vector}
+        if max_distance is not None:
+            near_vector["distance"] = max_distance
+        query = (self.client.query
+            .get(self.db, properties)
+            .with_near_vector(near_vector)
+            .with_limit(limit)
+            .with_additional(additional))
+        if autocut is not None:
+            query = query.with_autocut(autocut)
+        return query.do()
         
     def object_count(self):
         return ((self.client.query
@@ -111,15 +136,21 @@ class WeaviateClient:
     
     def get_knowledge(self,embedded_question, max_tokens=4000, max_distance = 0.3, min_score = 0.003, keyword_filter=''):
         if keyword_filter != '':
-            knowledge_array = self.query_with_hybrid(near_vector=embedded_question, near_text=keyword_filter, additional=["score"])
+            # Like matches single tokens of the word-tokenized knowledge, so the objects are only filtered by
+            # Weaviate for single-word keywords; longer keywords are checked on the objects returned below
+            where = None
+            if re.fullmatch(r"\w+", keyword_filter):
+                where = {"path": ["knowledge"], "operator": "Like", "valueText": f"*{keyword_filter}*"}
+            knowledge_array = self.query_with_hybrid(near_vector=embedded_question, near_text=keyword_filter, additional=["score"], where=where)
         else:
-            knowledge_array = self.query_near_vector(near_vector=embedded_question, additional=["distance"], limit=self.limit)
+            knowledge_array = self.query_near_vector_filtered(near_vector=embedded_question, additional=["distance"], limit=self.limit, max_distance=max_distance, autocut=self.autocut)
         # knowledge_array = self.query_near_vector(near_vector=embedded_question, additional=["distance"], limit=self.limit)
         knowledge_array = knowledge_array["data"]["Get"][self.config["db"]]
         in_context = []
         distances = []
         cur_tokens = 0
         for knowledge in knowledge_array:
+            # Check the exact substring, which Like does not for keywords of several words
             if keyword_filter != '' and keyword_filter.lower() not in knowledge["knowledge"].lower():
                 continue
 
@@ -130,7 +161,7 @@ class WeaviateClient:
                 if float(knowledge['_additional']["score"]) < min_score:
                     break
             
-            cur_tokens += len(knowledge["knowledge"].split(" "))
+            cur_tokens += count_tokens(knowledge["knowledge"], self.encoding)
             if cur_tokens > max_tokens:
                 break
             in_context.append(knowledge["knowledge"])
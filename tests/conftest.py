@@ -0,0 +1,137 @@
+import logging
+
+import pytest
+
+from escargot.cache import LRUCache
+from escargot.controller import Controller
+from escargot.language_models import AbstractLanguageModel
+from escargot.operations import Generate
+from escargot.prompter import ESCARGOTPrompter
+
+
+class StubLanguageModel:
+    """
+    Language model answering each query without a backend, counting tokens like the real ones and recording the queries.
+    By default a query is answered with "<name>: <query>"; respond(query, num_responses) overrides the responses,
+    and the queries wait for the release event, if any, before answering.
+    """
+
+    def __init__(self, name="stub", respond=None, release=None):
+        self.name = name
+        self.respond = respond
+        self.release = release
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.queries = []
+
+    def query(self, query, num_responses=1):
+        self.queries.append((query, num_responses))
+        if self.release is not None:
+            self.release.wait(5)
+        if self.respond is not None:
+            return self.respond(query, num_responses)
+        return [f"{self.name}: {query}"] * num_responses
+
+    def get_response_texts(self, responses):
+        return responses
+
+
+class SamplingLanguageModel(AbstractLanguageModel):
+    """
+    Language model with a response cache, answering each query that is not served from the cache with a new sample.
+    """
+
+    def __init__(self):
+        super().__init__({"sampling": {"cache": True}}, "sampling")
+        self.prompt_token_cost = 0.0
+        self.response_token_cost = 0.0
+        self.samples = 0
+
+    def query(self, query, num_responses=1):
+        response = self.get_cached_response(query, num_responses)
+        if response is None:
+            self.samples += 1
+            response = [f"sample {self.samples}"]
+            self.set_cached_response(query, num_responses, response)
+        return response
+
+    def get_response_texts(self, query_responses):
+        return query_responses
+
+    def embed(self, texts):
+        return [[0.0] for text in texts]
+
+
+@pytest.fixture
+def logger():
+    return logging.getLogger("escargot.tests")
+
+
+@pytest.fixture
+def make_lm():
+    return StubLanguageModel
+
+
+@pytest.fixture
+def lm():
+    return StubLanguageModel()
+
+
+@pytest.fixture
+def sampling_lm():
+    return SamplingLanguageModel()
+
+
+@pytest.fixture
+def make_controller(logger):
+    """
+    Build a controller of a graph of operations that need no prompter, parser or coder.
+    """
+
+    def make(graph, max_workers=1, max_tokens=None, cancellation_event=None, lm=None, problem_parameters=None):
+        return Controller(
+            lm if lm is not None else StubLanguageModel(),
+            graph,
+            None,
+            None,
+            logger,
+            None,
+            problem_parameters or {"question": "question", "input": "", "phase": "planning"},
+            max_tokens=max_tokens,
+            cancellation_event=cancellation_event,
+            max_workers=max_workers,
+        )
+
+    return make
+
+
+@pytest.fixture
+def make_generate(logger):
+    """
+    Build a Generate operation outside of a controller, with the attributes the controller would set.
+    """
+
+    def make(speculation_executor=None, is_retry=False, max_tokens=None):
+        generate = Generate(1, 1)
+        generate.logger = logger
+        generate.speculation_executor = speculation_executor
+        generate.is_retry = is_retry
+        generate.max_tokens = max_tokens
+        return generate
+
+    return make
+
+
+@pytest.fixture
+def make_prompter(logger):
+    def make(graph_client=None, lm=None, knowledge_cache=None, plan_cache=None):
+        return ESCARGOTPrompter(
+            graph_client=graph_client,
+            lm=lm,
+            logger=logger,
+            knowledge_cache=knowledge_cache if knowledge_cache is not None else LRUCache(16),
+            plan_cache=plan_cache,
+        )
+
+    return make
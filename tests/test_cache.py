@@ -0,0 +1,91 @@
+import time
+
+from escargot.cache import LRUCache, SQLiteCache, build_cache, make_key
+from escargot.utils import retrying
+
+
+def test_make_key_depends_on_every_part():
+    assert make_key("a", 1, None) == make_key("a", 1, None)
+    assert make_key("a", 1) != make_key("a", 2)
+    assert make_key({"x": 1, "y": 2}) == make_key({"y": 2, "x": 1})
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert "a" not in cache
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "missing") == "missing"
+
+
+def test_sqlite_cache_persists_and_bounds_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCache(path, max_size=2)
+    cache["a"] = {"rows": [1, 2]}
+    time.sleep(0.01)
+    cache["b"] = 2
+    time.sleep(0.01)
+    cache["c"] = 3
+    assert len(cache) == 2
+    assert "a" not in cache
+    cache.close()
+
+    reopened = SQLiteCache(path, max_size=2)
+    assert reopened.get("b") == 2
+    assert reopened["c"] == 3
+    reopened.clear()
+    assert len(reopened) == 0
+    reopened.close()
+
+
+def test_build_cache_reads_prefixed_keys(tmp_path):
+    memory_cache = build_cache({"result_cache_size": 3, "result_cache_ttl": 10}, "result_cache")
+    assert isinstance(memory_cache, LRUCache)
+    assert (memory_cache.max_size, memory_cache.ttl) == (3, 10)
+
+    disk_cache = build_cache({"cache_path": str(tmp_path / "cache.db")})
+    assert isinstance(disk_cache, SQLiteCache)
+    disk_cache.close()
+
+
+
+def test_responses_are_cached(sampling_lm):
+    lm = sampling_lm
+
+    assert lm.query("prompt") == ["sample 1"]
+    assert lm.query("prompt") == ["sample 1"]
+    assert lm.query("prompt", num_responses=2) == ["sample 2"]
+
+
+def test_retries_are_not_served_cached_responses(sampling_lm):
+    lm = sampling_lm
+    lm.query("prompt")
+
+    with retrying():
+        assert lm.query("prompt") == ["sample 2"]
+    with retrying(False):
+        # the response of the retry replaced the one that failed
+        assert lm.query("prompt") == ["sample 2"]
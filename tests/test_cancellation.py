@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from escargot.language_models import ChatGPT
+from escargot.utils import OperationCancelled, reset_cancellation_event, run_cancellable, set_cancellation_event
+
+
+@pytest.fixture
+def cancellation_event():
+    event = threading.Event()
+    token = set_cancellation_event(event)
+    yield event
+    reset_cancellation_event(token)
+
+
+def test_run_cancellable_calls_directly_without_an_event():
+    assert run_cancellable(threading.current_thread) is threading.current_thread()
+
+
+def test_run_cancellable_returns_and_raises_like_the_call(cancellation_event):
+    assert run_cancellable(lambda a, b=0: a + b, 1, b=2) == 3
+    with pytest.raises(ValueError):
+        run_cancellable(int, "not a number")
+
+
+def test_run_cancellable_releases_the_caller_on_cancellation(cancellation_event):
+    release = threading.Event()
+    aborted = []
+    threading.Timer(0.1, cancellation_event.set).start()
+
+    start = time.time()
+    with pytest.raises(OperationCancelled):
+        run_cancellable(release.wait, 5, on_cancel=lambda: aborted.append(True), poll_interval=0.01)
+
+    assert time.time() - start < 1
+    assert aborted == [True]
+    release.set()
+
+
+def test_run_cancellable_does_not_start_cancelled_work(cancellation_event):
+    cancellation_event.set()
+    calls = []
+
+    with pytest.raises(OperationCancelled):
+        run_cancellable(calls.append, 1)
+    assert calls == []
+
+
+class BlockingCompletions:
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        raise AssertionError("the request should have been abandoned")
+
+
+def make_chatgpt(monkeypatch, logger, **config):
+    clients = []
+
+    class Client:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+            self.chat = type("Chat", (), {"completions": BlockingCompletions()})()
+            clients.append(self)
+
+    monkeypatch.setattr("escargot.language_models.chatgpt.OpenAI", Client)
+    monkeypatch.setattr("escargot.language_models.chatgpt.AsyncOpenAI", Client)
+    lm = ChatGPT(
+        {
+            "chatgpt": {
+                "model_id": "gpt-4o-mini",
+                "prompt_token_cost": 0.0,
+                "response_token_cost": 0.0,
+                "temperature": 0.0,
+                "max_tokens": 10,
+                "stop": None,
+                "organization": "organization",
+                "api_key": "key",
+                **config,
+            }
+        },
+        logger=logger,
+    )
+    return lm, clients
+
+
+def test_chatgpt_passes_the_request_timeout(monkeypatch, logger):
+    _, clients = make_chatgpt(monkeypatch, logger, request_timeout=30)
+
+    assert [client.kwargs["timeout"] for client in clients] == [30, 30]
+
+
+def test_chatgpt_abandons_the_request_of_a_cancelled_question(monkeypatch, logger, cancellation_event):
+    lm, _ = make_chatgpt(monkeypatch, logger)
+    threading.Timer(0.1, cancellation_event.set).start()
+
+    start = time.time()
+    with pytest.raises(OperationCancelled):
+        lm.query("question")
+
+    assert time.time() - start < 1
+    assert lm.client.chat.completions.calls == 1
+    lm.client.chat.completions.release.set()
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from escargot.cypher.connection_pool import ConnectionPool, close_pools, get_pool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """
+    gqlalchemy client returning fixed rows, whose health checks fail once it is marked broken.
+    """
+
+    def __init__(self, rows=None):
+        self._cached_connection = FakeConnection()
+        self.rows = rows if rows is not None else [{"n": 1}, {"n": 2}, {"n": 3}]
+        self.broken = False
+        self.queries = []
+
+    def execute_and_fetch(self, query):
+        self.queries.append(query)
+        if self.broken:
+            raise ConnectionError("connection lost")
+        return iter(self.rows)
+
+
+@pytest.fixture
+def clients():
+    return []
+
+
+@pytest.fixture
+def make_pool(clients):
+    def connect():
+        clients.append(FakeClient())
+        return clients[-1]
+
+    def make(**kwargs):
+        return ConnectionPool(connect, **kwargs)
+
+    return make
+
+
+def test_connections_are_reused(make_pool, clients):
+    pool = make_pool(size=2)
+
+    assert pool.execute("MATCH (n) RETURN n") == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert pool.execute("MATCH (n) RETURN n") == [{"n": 1}, {"n": 2}, {"n": 3}]
+
+    assert len(clients) == 1
+    assert not clients[0]._cached_connection.closed
+
+
+def test_connections_past_their_lifetime_are_closed(make_pool, clients):
+    pool = make_pool(max_lifetime=0.05)
+    pool.execute("RETURN 1")
+    time.sleep(0.1)
+
+    pool.execute("RETURN 1")
+
+    assert len(clients) == 2
+    assert clients[0]._cached_connection.closed
+    assert not clients[1]._cached_connection.closed
+
+
+def test_unhealthy_idle_connections_are_closed(make_pool, clients):
+    pool = make_pool(health_check_interval=0)
+    pool.execute("RETURN 1")
+    clients[0].broken = True
+
+    assert pool.execute("RETURN 1") == [{"n": 1}, {"n": 2}, {"n": 3}]
+
+    assert clients[0].queries[-1] == ConnectionPool.HEALTH_CHECK_QUERY
+    assert clients[0]._cached_connection.closed
+    assert len(clients) == 2
+
+
+def test_connections_failing_a_query_are_closed(make_pool, clients):
+    pool = make_pool()
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("query failed")
+
+    assert clients[0]._cached_connection.closed
+    assert pool.idle == []
+
+
+def test_streams_closed_early_close_their_connection(make_pool, clients):
+    pool = make_pool()
+    rows = pool.stream("MATCH (n) RETURN n")
+    assert next(rows) == {"n": 1}
+    rows.close()
+
+    assert clients[0]._cached_connection.closed
+    # the slot was returned
+    assert pool.execute("RETURN 1") == [{"n": 1}, {"n": 2}, {"n": 3}]
+
+
+def test_acquire_times_out_when_every_connection_is_in_use(make_pool):
+    pool = make_pool(size=1, timeout=0.1)
+    client, created = pool.acquire()
+
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+
+    pool.release(client, created)
+    released = threading.Event()
+    threading.Thread(target=lambda: (pool.release(*pool.acquire()), released.set())).start()
+    assert released.wait(1)
+
+
+def test_close_closes_idle_connections(make_pool, clients):
+    pool = make_pool()
+    pool.execute("RETURN 1")
+
+    pool.close()
+
+    assert clients[0]._cached_connection.closed
+    assert pool.idle == []
+
+
+def test_get_pool_shares_one_pool_per_database():
+    try:
+        pool = get_pool("memgraph", "localhost", 7687, FakeClient, {"pool_size": 3, "pool_timeout": 5})
+
+        assert get_pool("memgraph", "localhost", 7687, FakeClient) is pool
+        assert get_pool("neo4j", "localhost", 7687, FakeClient) is not pool
+        assert (pool.size, pool.timeout) == (3, 5)
+    finally:
+        close_pools()
@@ -0,0 +1,155 @@
+import threading
+import time
+
+from escargot.operations import GraphOfOperations, Operation, Thought
+
+
+class StubOperation(Operation):
+    """
+    Operation that records when it runs and produces a thought of a fixed phase, without any language model.
+    """
+
+    def __init__(self, name, log, phase="steps", action=None):
+        super().__init__()
+        self.name = name
+        self.log = log
+        self.phase = phase
+        self.action = action
+        self.thoughts = []
+
+    def _execute(self, lm, prompter, parser, got_steps, **kwargs):
+        self.log.append(("start", self.name))
+        if self.action is not None:
+            self.action(lm)
+        self.log.append(("end", self.name))
+        self.thoughts = [Thought({**kwargs, "phase": self.phase, "input": self.name})]
+
+    def get_thoughts(self):
+        return self.thoughts
+
+
+def diamond(log, action=None):
+    """
+    Build the graph first -> (left, right) -> last, where left and right are independent.
+    """
+    graph = GraphOfOperations()
+    first = StubOperation("first", log)
+    left = StubOperation("left", log, action=action)
+    right = StubOperation("right", log, action=action)
+    last = StubOperation("last", log, phase="output")
+    graph.add_operation(first)
+    left.add_predecessor(first)
+    right.add_predecessor(first)
+    graph.add_operation(left)
+    graph.add_operation(right)
+    last.add_predecessor(left)
+    last.add_predecessor(right)
+    graph.add_operation(last)
+    return graph
+
+
+def test_independent_steps_run_concurrently(make_controller):
+    log = []
+    # each branch waits for the other one, which only succeeds if both are in flight at once
+    barrier = threading.Barrier(2, timeout=5)
+    controller = make_controller(diamond(log, action=lambda lm: barrier.wait()), max_workers=2)
+
+    controller.run()
+
+    assert controller.run_executed
+    assert controller.final_thought.state["input"] == "last"
+    assert log[:2] == [("start", "first"), ("end", "first")]
+    assert log[-2:] == [("start", "last"), ("end", "last")]
+    assert {entry for entry in log[2:4]} == {("start", "left"), ("start", "right")}
+
+
+def test_dependent_steps_stay_ordered(make_controller):
+    log = []
+    controller = make_controller(diamond(log, action=lambda lm: time.sleep(0.01)), max_workers=4)
+
+    controller.run()
+
+    assert controller.run_executed
+    position = {entry: index for index, entry in enumerate(log)}
+    for branch in ("left", "right"):
+        assert position[("end", "first")] < position[("start", branch)]
+        assert position[("end", branch)] < position[("start", "last")]
+
+
+def test_sequential_run_executes_every_step_once(make_controller):
+    log = []
+    controller = make_controller(diamond(log), max_workers=1)
+
+    controller.run()
+
+    assert controller.run_executed
+    assert [name for event, name in log if event == "start"].count("last") == 1
+    assert len(log) == 8
+
+
+def test_token_limit_stops_the_run(make_controller, lm):
+    log = []
+
+    def spend(lm):
+        lm.prompt_tokens += 100
+
+    graph = GraphOfOperations()
+    graph.append_operation(StubOperation("first", log, action=spend))
+    graph.append_operation(StubOperation("second", log, phase="output"))
+    controller = make_controller(graph, max_tokens=50, lm=lm)
+
+    controller.run()
+
+    assert not controller.run_executed
+    assert controller.final_thought.state["phase"] == "token_limit_exceeded"
+    assert ("start", "second") not in log
+    # a stopped run is not retried
+    assert [name for event, name in log if event == "start"] == ["first"]
+
+
+def test_cancellation_stops_the_run(make_controller):
+    log = []
+    cancellation_event = threading.Event()
+    graph = GraphOfOperations()
+    graph.append_operation(StubOperation("first", log, action=lambda lm: cancellation_event.set()))
+    graph.append_operation(StubOperation("second", log, phase="output"))
+    controller = make_controller(graph, cancellation_event=cancellation_event, max_workers=2)
+
+    controller.run()
+
+    assert not controller.run_executed
+    assert controller.final_thought.state["phase"] == "cancelled"
+    assert [name for event, name in log if event == "start"] == ["first"]
+
+
+def test_cancellation_before_the_run_executes_nothing(make_controller):
+    log = []
+    cancellation_event = threading.Event()
+    cancellation_event.set()
+    controller = make_controller(diamond(log), cancellation_event=cancellation_event)
+
+    controller.run()
+
+    assert log == []
+    assert controller.final_thought.state["phase"] == "cancelled"
+
+
+def test_failed_operations_are_retried_without_the_response_cache(make_controller, sampling_lm):
+    sampling_lm.query("prompt")
+    answers = []
+
+    def answer(lm):
+        answers.append(lm.query("prompt")[0])
+        if answers[-1] == "sample 1":
+            raise ValueError("broken sample")
+
+    log = []
+    graph = GraphOfOperations()
+    graph.append_operation(StubOperation("first", log, phase="output", action=answer))
+    controller = make_controller(graph, lm=sampling_lm)
+
+    controller.run()
+
+    assert controller.run_executed
+    # the retry got a new sample instead of the cached broken one
+    assert answers == ["sample 1", "sample 2"]
@@ -0,0 +1,116 @@
+from escargot.prompter.utils import convert_rows, get_variable_name, uses_as_dict
+
+
+class Node:
+    def __init__(self, id, **properties):
+        self._id = id
+        self._properties = properties
+
+
+class Relationship:
+    def __init__(self, start, type, end):
+        self._start_node_id = start
+        self._end_node_id = end
+        self._type = type
+
+
+class Path:
+    def __init__(self, nodes, relationships):
+        self._nodes = nodes
+        self._relationships = relationships
+
+
+def test_get_variable_name_of_knowledge_assignments():
+    assert get_variable_name("genes = knowledge_extract('genes of APOE')") == "genes"
+    assert get_variable_name("x = 1\n  drugs=knowledge_request('drugs')") == "drugs"
+    assert get_variable_name("print(knowledge_extract('genes'))") is None
+    assert get_variable_name("genes += knowledge_extract('genes')") is None
+
+
+def test_uses_as_dict():
+    assert uses_as_dict("genes", "for gene, score in genes.items():")
+    assert uses_as_dict("genes", "score = genes.get('APOE', 0)")
+    assert uses_as_dict("genes", "score = genes['APOE']")
+    assert uses_as_dict("genes", 'score = genes[f"{name}"]')
+    assert not uses_as_dict("genes", "for gene, score in genes:")
+    assert not uses_as_dict("genes", "first = genes[0]")
+    # another variable whose name ends like this one
+    assert not uses_as_dict("genes", "all_genes.items()")
+
+
+def test_rows_are_kept_when_the_code_uses_their_columns():
+    rows = [{"gene": "APOE", "score": 0.9}, {"gene": "APP", "score": 0.7}]
+
+    assert convert_rows(rows, "genes", "names = [row['gene'] for row in genes]") is rows
+    assert convert_rows(rows, "genes", 'names = [row["score"] for row in genes]') is rows
+
+
+def test_paths_and_relationships_become_edges():
+    apoe = Node(1, geneSymbol="APOE")
+    alzheimer = Node(2, commonName="Alzheimer's disease")
+    donepezil = Node(3, commonName="Donepezil")
+    path = Path([apoe, alzheimer, donepezil], [Relationship(1, "ASSOCIATES", 2), Relationship(3, "TREATS", 2)])
+    rows = [{"p": path}, {"p": Relationship(1, "ASSOCIATES", 2)}]
+
+    assert convert_rows(rows, "paths", "for edge in paths:") == [
+        ("APOE", "ASSOCIATES", "Alzheimer's disease"),
+        ("Donepezil", "TREATS", "Alzheimer's disease"),
+    ]
+
+
+def test_unknown_nodes_of_relationships_are_named_by_id():
+    rows = [{"r": Relationship(1, "ASSOCIATES", 2)}]
+
+    assert convert_rows(rows, "edges", "") == [(1, "ASSOCIATES", 2)]
+
+
+def test_paths_mixed_with_values_are_not_converted():
+    rows = [{"p": Relationship(1, "ASSOCIATES", 2), "name": "APOE"}]
+
+    assert convert_rows(rows, "edges", "") is None
+
+
+def test_one_column_becomes_a_list():
+    rows = [{"g.geneSymbol": "APOE"}, {"g.geneSymbol": "APP"}]
+
+    assert convert_rows(rows, "genes", "for gene in genes:") == ["APOE", "APP"]
+
+
+def test_two_columns_become_a_dict_when_used_as_one():
+    rows = [{"gene": "APOE", "score": 0.9}, {"gene": "APP", "score": 0.7}]
+
+    assert convert_rows(rows, "scores", "for gene, score in scores.items():") == {"APOE": 0.9, "APP": 0.7}
+
+
+def test_two_columns_become_pairs_otherwise():
+    rows = [{"gene": "APOE", "score": 0.9}, {"gene": "APP", "score": 0.7}]
+
+    assert convert_rows(rows, "scores", "for gene, score in scores:") == [("APOE", 0.9), ("APP", 0.7)]
+
+
+def test_repeated_keys_gather_their_values():
+    rows = [{"drug": "Donepezil", "target": "ACHE"}, {"drug": "Memantine", "target": "GRIN1"}, {"drug": "Donepezil", "target": "BCHE"}]
+
+    assert convert_rows(rows, "targets", "for drug, genes in targets.items():") == {
+        "Donepezil": ["ACHE", "BCHE"],
+        "Memantine": ["GRIN1"],
+    }
+
+
+def test_unhashable_keys_are_not_converted_to_a_dict():
+    rows = [{"genes": ["APOE"], "score": 0.9}]
+
+    assert convert_rows(rows, "scores", "scores.items()") is None
+
+
+def test_rows_with_different_keys_are_not_converted():
+    rows = [{"gene": "APOE"}, {"drug": "Donepezil"}]
+
+    assert convert_rows(rows, "genes", "for gene in genes:") is None
+
+
+def test_other_shapes_are_not_converted():
+    assert convert_rows([], "genes", "") is None
+    assert convert_rows("APOE", "genes", "") is None
+    assert convert_rows([("APOE", 0.9)], "genes", "") is None
+    assert convert_rows([{"a": 1, "b": 2, "c": 3}], "values", "for value in values:") is None
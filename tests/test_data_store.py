@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import escargot.memory.data_store as data_store_module
+from escargot.memory import DataStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DataStore(str(tmp_path), blob_max_size=1024)
+    yield store
+    store.close()
+
+
+def test_arrays_round_trip_as_memory_maps(store):
+    array = np.arange(12, dtype=np.float32).reshape(4, 3)
+
+    assert store.put("array", array) == "npy"
+    assert store.locate("array") == "npy"
+    np.testing.assert_array_equal(store.get("array"), array)
+    np.testing.assert_array_equal(store.preview("array", 1, 3), array[1:3])
+
+
+@pytest.mark.parametrize("data", [[1, 2, 3], [0.5, 1.5], ["CAD", "PDS5B", "SEL1L"], [True, False]])
+def test_lists_of_one_type_round_trip(store, data):
+    assert store.put("list", data) == "list"
+
+    assert store.get("list") == data
+    assert store.preview("list", 1, 2) == data[1:2]
+    assert [type(item) for item in store.get("list")] == [type(item) for item in data]
+
+
+@pytest.mark.parametrize("data", [[1, "two", 3.0], [[1, 2], [3, 4]], [None], []])
+def test_other_lists_round_trip_as_blobs(store, data):
+    assert store.put("list", data) == "blob"
+
+    assert store.get("list") == data
+
+
+def test_small_objects_share_one_sqlite_file(store, tmp_path):
+    assert store.put("first", {"gene": "ABCC2"}) == "blob"
+    assert store.put("second", ("CAD", 1)) == "blob"
+
+    assert store.get("first") == {"gene": "ABCC2"}
+    assert store.get("second") == ("CAD", 1)
+    assert sorted(os.listdir(tmp_path)) == ["blobs.sqlite"]
+    # blobs are read back by a new store
+    store.close()
+    assert DataStore(str(tmp_path)).get("first", "blob") == {"gene": "ABCC2"}
+
+
+def test_large_objects_are_pickled_to_their_own_file(store):
+    data = {"genes": ["gene %d" % index for index in range(500)]}
+
+    assert store.put("large", data) == "pkl"
+    assert store.locate("large") == "pkl"
+    assert store.get("large") == data
+    assert store.preview("large", 0, 1) == data
+
+
+def test_data_frames_round_trip_as_feather(store):
+    pytest.importorskip("pyarrow")
+    frame = pd.DataFrame({"drug": ["Leucovorin", "Aspirin", "Ibuprofen"], "genes": [3, 1, 2]})
+
+    assert store.put("frame", frame) == "feather"
+    pd.testing.assert_frame_equal(store.get("frame"), frame)
+    pd.testing.assert_frame_equal(store.preview("frame", 1, 5).reset_index(drop=True), frame.iloc[1:].reset_index(drop=True))
+
+
+def test_data_frames_are_pickled_without_pyarrow(store, monkeypatch):
+    monkeypatch.setattr(data_store_module, "feather", None)
+    frame = pd.DataFrame({"drug": ["Leucovorin", "Aspirin"], "genes": [3, 1]})
+
+    assert store.put("frame", frame) == "blob"
+    pd.testing.assert_frame_equal(store.get("frame"), frame)
+    pd.testing.assert_frame_equal(store.preview("frame", 1, 2), frame.iloc[1:2])
+
+
+def test_legacy_pickle_files_are_read(store, tmp_path):
+    pd.to_pickle([1, "two"], os.path.join(tmp_path, "legacy.pkl"))
+
+    assert store.locate("legacy") == "pkl"
+    assert store.get("legacy") == [1, "two"]
+
+
+def test_missing_keys(store):
+    assert store.locate("missing") is None
+    with pytest.raises(KeyError):
+        store.get("missing")
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import escargot.escargot as escargot_module
+from escargot.escargot import Escargot
+
+
+class StubWriter:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, text, data=None, lm=None):
+        self.submitted.append((text, data, lm))
+
+
+class StubMemory:
+    collection_name = "test"
+
+    def __init__(self):
+        self.writer = StubWriter()
+
+    def get_writer(self, lm, logger):
+        return self.writer
+
+    def flush(self, timeout=None):
+        return True
+
+
+class StubController:
+    """
+    Controller answering "answer to <question>" with 10 prompt and 5 completion tokens,
+    failing the questions starting with "fail" and running the questions starting with "slow" until they are cancelled.
+    """
+
+    def __init__(self, question, lm, cancellation_event):
+        self.question = question
+        self.lm = lm
+        self.cancellation_event = cancellation_event
+        self.final_thought = None
+        self.graph = SimpleNamespace(operations=[])
+
+    def run(self):
+        self.lm.update_usage(10, 5)
+        if self.question.startswith("fail"):
+            raise ValueError("no plan")
+        if self.question.startswith("slow"):
+            self.cancellation_event.wait(5)
+            self.final_thought = SimpleNamespace(state={"phase": "cancelled"})
+            return
+        self.final_thought = SimpleNamespace(state={"phase": "output", "input": f"answer to {self.question}"})
+
+    async def arun(self, executor=None):
+        await asyncio.get_running_loop().run_in_executor(executor, self.run)
+
+
+@pytest.fixture
+def make_escargot(monkeypatch, sampling_lm):
+    """
+    Build an Escargot instance around the sampling language model, without vector or graph database,
+    whose questions are answered by StubController.
+    """
+
+    def make(**kwargs):
+        memory = StubMemory()
+        monkeypatch.setattr(escargot_module.language_models, "Ollama", lambda config, model_name, logger: sampling_lm)
+        monkeypatch.setattr(escargot_module, "LocalVectorClient", lambda config, logger: SimpleNamespace(client=None))
+        monkeypatch.setattr(escargot_module.memgraph, "MemgraphClient", lambda config, logger: SimpleNamespace(client=None))
+        monkeypatch.setattr(escargot_module.memory, "get_memory", lambda lm, collection_name="default": memory)
+        monkeypatch.setattr(
+            Escargot,
+            "_create_controller",
+            lambda self, question, answer_type, num_strategies, max_run_tries, cancellation_event=None, max_tokens=None, max_workers=1, lm=None, *args, **kwargs: StubController(question, lm or self.lm, cancellation_event),
+        )
+        return Escargot({"ollama": {}, "local_vector": {}, "memgraph": {}}, model_name="ollama", **kwargs), memory
+
+    return make
+
+
+def test_ask_many_reports_each_result_with_its_usage(make_escargot, sampling_lm):
+    escargot, memory = make_escargot()
+
+    results = sorted(escargot.ask_many(["first", "second", "third"], concurrency=2), key=lambda result: result["index"])
+
+    assert [(result["question"], result["output"], result["error"]) for result in results] == [
+        ("first", "answer to first", None),
+        ("second", "answer to second", None),
+        ("third", "answer to third", None),
+    ]
+    assert [(result["prompt_tokens"], result["completion_tokens"]) for result in results] == [(10, 5)] * 3
+    assert all(result["time"] >= 0 and "metrics" in result for result in results)
+    # each question has its own counters, added to the ones of the shared language model
+    assert (sampling_lm.prompt_tokens, sampling_lm.completion_tokens) == (30, 15)
+    assert len(memory.writer.submitted) == 3
+
+
+def test_ask_many_reports_errors_and_timeouts(make_escargot, sampling_lm):
+    escargot, memory = make_escargot()
+
+    results = {result["question"]: result for result in escargot.ask_many(["fail", "slow", "fine"], timeout=0.2)}
+
+    assert results["fail"]["output"] is None
+    assert results["fail"]["error"].startswith("An error occurred during execution: no plan")
+    assert results["slow"]["output"] is None
+    assert results["slow"]["error"] == "Timeout occurred after 0.2 seconds."
+    assert (results["fine"]["output"], results["fine"]["error"]) == ("answer to fine", None)
+    # the tokens of failed questions are reported too
+    assert [results[question]["prompt_tokens"] for question in ("fail", "slow", "fine")] == [10, 10, 10]
+    assert sampling_lm.prompt_tokens == 30
+    assert [text for text, data, lm in memory.writer.submitted] == [escargot._summary_prompt("fine", "answer to fine")]
+
+
+
+def test_answers_are_summarized_with_the_language_model_of_their_question(make_escargot, sampling_lm):
+    escargot, memory = make_escargot()
+
+    list(escargot.ask_many(["first"]))
+    escargot._remember(memory, "second", "answer to second", "natural")
+
+    first_lm, second_lm = [lm for text, data, lm in memory.writer.submitted]
+    # ask_many questions count their tokens on their own copy of the language model
+    assert first_lm is not sampling_lm and first_lm.prompt_tokens == 10
+    assert second_lm is sampling_lm
+
+
+def test_aask_logs_at_its_debug_level(make_escargot):
+    escargot, memory = make_escargot()
+    handlers = list(escargot.logger.handlers)
+
+    assert asyncio.run(escargot.aask("first", debug_level=0)) == "answer to first"
+    assert "Output: answer to first" not in escargot.log
+
+    assert asyncio.run(escargot.aask("second", debug_level=1)) == "answer to second"
+    assert "Output: answer to second" in escargot.log
+    assert escargot.logger.level == logging.WARNING
+    # the handlers of the question are removed once it is answered
+    assert escargot.logger.handlers == handlers
@@ -0,0 +1,220 @@
+import threading
+import time
+
+import pytest
+
+from escargot.cypher.connection_pool import close_pools
+from escargot.cypher.graph_client import GraphClient, inject_limit
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeDatabase:
+    """
+    gqlalchemy client answering each query with its configured rows after its configured delay.
+    A query stops waiting, and fails, when its connection is closed.
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+        self._cached_connection = FakeConnection()
+        self.queries = []
+
+    def execute_and_fetch(self, query):
+        self.queries.append(query)
+        delay, rows = self.answers.get(query, (0, []))
+        if self._cached_connection.closed.wait(delay):
+            raise ConnectionError("connection closed")
+        if isinstance(rows, Exception):
+            raise rows
+        yield from rows
+
+
+class StubGraphClient(GraphClient):
+    config_key = "stub"
+
+    def connect(self):
+        self.connections.append(FakeDatabase(self.answers))
+        return self.connections[-1]
+
+    def get_schema(self):
+        self.schema = "Node properties are the following:"
+        return "", ""
+
+
+@pytest.fixture
+def make_graph_client(logger):
+    def make(answers, **config):
+        client = StubGraphClient({"stub": {"host": "localhost", "port": 7687, **config}}, logger)
+        client.answers = answers
+        client.connections = []
+        client.get_schema()
+        return client
+
+    yield make
+    close_pools()
+
+
+def closed_queries(client):
+    return [connection.queries[-1] for connection in client.connections if connection._cached_connection.closed.is_set()]
+
+
+def test_first_validation_returns_the_first_non_empty_result_and_cancels_the_others(make_graph_client):
+    client = make_graph_client(
+        {"SLOW": (5, [{"n": "slow"}]), "EMPTY": (0, []), "FAST": (0.05, [{"n": "fast"}])},
+        validation="first",
+    )
+
+    start = time.time()
+    rows, response = client.validate_concurrently(["SLOW", "EMPTY", "FAST"], client.schema_fingerprint(), "statement")
+
+    assert (rows, response) == ([{"n": "fast"}], "FAST")
+    assert time.time() - start < 1
+    # the losing query is aborted by closing its connection
+    for _ in range(20):
+        if "SLOW" in closed_queries(client):
+            break
+        time.sleep(0.05)
+    assert closed_queries(client) == ["SLOW"]
+
+
+def test_merge_validation_merges_the_distinct_rows_in_rank_order(make_graph_client):
+    client = make_graph_client(
+        {
+            "FIRST": (0.1, [{"n": 1}, {"n": 2}]),
+            "EMPTY": (0, []),
+            "SECOND": (0, [{"n": 2}, {"n": 3}]),
+            "FAILING": (0, ValueError("syntax error")),
+        },
+        validation="merge",
+    )
+
+    rows, response = client.validate_concurrently(["FIRST", "EMPTY", "SECOND", "FAILING"], client.schema_fingerprint(), "statement")
+
+    assert rows == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert response == "FIRST"
+
+
+def test_each_candidate_gets_its_own_timeout(make_graph_client):
+    # one candidate at a time, so a shared timeout would be spent by the hanging candidate
+    client = make_graph_client(
+        {"HANGING": (5, [{"n": 0}]), "SECOND": (0.2, [{"n": 1}]), "THIRD": (0.2, [{"n": 2}])},
+        validation="merge",
+        max_concurrent_queries=1,
+        query_timeout=0.3,
+    )
+
+    start = time.time()
+    rows, response = client.validate_concurrently(["HANGING", "SECOND", "THIRD"], client.schema_fingerprint(), "statement")
+
+    assert (rows, response) == ([{"n": 1}, {"n": 2}], "SECOND")
+    assert time.time() - start < 2
+    assert closed_queries(client) == ["HANGING"]
+
+
+def test_timed_out_candidates_are_cancelled_when_rows_are_limited(make_graph_client):
+    client = make_graph_client({"MATCH (n) RETURN n LIMIT 10": (5, [{"n": 0}])}, validation="first", query_timeout=0.2, max_rows=10)
+
+    start = time.time()
+    rows, response = client.validate_concurrently(["MATCH (n) RETURN n"], client.schema_fingerprint(), "statement")
+
+    assert (rows, response) == ([], "")
+    assert time.time() - start < 2
+    assert closed_queries(client) == ["MATCH (n) RETURN n LIMIT 10"]
+
+
+def test_inject_limit():
+    assert inject_limit("MATCH (n) RETURN n", 10) == "MATCH (n) RETURN n LIMIT 10"
+    assert inject_limit("MATCH (n) RETURN n;  ", 10) == "MATCH (n) RETURN n LIMIT 10"
+    assert inject_limit("MATCH (n) return n limit 5", 10) == "MATCH (n) return n limit 5"
+    assert inject_limit("CREATE (n:Drug)", 10) == "CREATE (n:Drug)"
+
+
+def test_fetch_truncates_results_to_max_rows(make_graph_client, caplog):
+    rows = [{"n": i} for i in range(5)]
+    client = make_graph_client({"MATCH (n) RETURN n LIMIT 3": (0, rows), "MATCH (n) RETURN n": (0, rows)}, max_rows=3)
+
+    assert client.fetch("MATCH (n) RETURN n") == rows[:3]
+    assert client.connections[0].queries == ["MATCH (n) RETURN n LIMIT 3"]
+    assert "truncated to 3 rows" in caplog.text
+
+
+def test_fetch_does_not_warn_below_max_rows(make_graph_client, caplog):
+    client = make_graph_client({"MATCH (n) RETURN n LIMIT 3": (0, [{"n": 0}, {"n": 1}])}, max_rows=3)
+
+    assert client.fetch("MATCH (n) RETURN n") == [{"n": 0}, {"n": 1}]
+    assert "truncated" not in caplog.text
+
+
+def test_fetch_without_max_rows_reads_every_row(make_graph_client):
+    rows = [{"n": i} for i in range(5)]
+    client = make_graph_client({"MATCH (n) RETURN n": (0, rows)})
+
+    assert client.fetch("MATCH (n) RETURN n") == rows
+
+
+def test_stream_yields_at_most_max_rows_in_chunks(make_graph_client):
+    rows = [{"n": i} for i in range(10)]
+    client = make_graph_client({"MATCH (n) RETURN n LIMIT 5": (0, rows)}, max_rows=5)
+
+    assert list(client.stream("MATCH (n) RETURN n", chunk_size=2)) == [rows[0:2], rows[2:4], rows[4:5]]
+
+
+@pytest.fixture
+def cypher_lm(make_lm):
+    return make_lm(respond=lambda query, num_responses: ["```cypher\nMATCH (n:Drug) RETURN n.name\n```"] * num_responses)
+
+
+def database_queries(client):
+    return [query for connection in client.connections for query in connection.queries]
+
+
+def test_generated_cypher_and_results_are_cached(make_graph_client, cypher_lm):
+    client = make_graph_client({"MATCH (n:Drug) RETURN n.name": (0, [{"n.name": "Leucovorin"}])})
+
+    assert client.execute(cypher_lm, "prompt", "Which drugs exist?") == ([{"n.name": "Leucovorin"}], "MATCH (n:Drug) RETURN n.name")
+    # requests differing only in case and whitespace share their Cypher query
+    assert client.execute(cypher_lm, "prompt", "  which DRUGS exist? ") == ([{"n.name": "Leucovorin"}], "MATCH (n:Drug) RETURN n.name")
+
+    assert len(cypher_lm.queries) == 1
+    assert database_queries(client) == ["MATCH (n:Drug) RETURN n.name"]
+
+
+def test_schema_changes_invalidate_the_caches(make_graph_client, cypher_lm):
+    client = make_graph_client({"MATCH (n:Drug) RETURN n.name": (0, [{"n.name": "Leucovorin"}])})
+    client.execute(cypher_lm, "prompt", "Which drugs exist?")
+
+    client.schema = "Node properties are the following:\nNode name: 'Drug'"
+    client.execute(cypher_lm, "prompt", "Which drugs exist?")
+    client.schema_version = "2"
+    client.execute(cypher_lm, "prompt", "Which drugs exist?")
+
+    assert len(cypher_lm.queries) == 3
+    assert len(database_queries(client)) == 3
+
+
+def test_empty_results_are_not_cached(make_graph_client, cypher_lm):
+    client = make_graph_client({})
+
+    assert client.execute(cypher_lm, "prompt", "Which drugs exist?")[0] == []
+    client.answers["MATCH (n:Drug) RETURN n.name"] = (0, [{"n.name": "Leucovorin"}])
+
+    assert client.execute(cypher_lm, "prompt", "Which drugs exist?")[0] == [{"n.name": "Leucovorin"}]
+    assert len(cypher_lm.queries) == 2
+
+
+def test_clear_cache(make_graph_client, cypher_lm):
+    client = make_graph_client({"MATCH (n:Drug) RETURN n.name": (0, [{"n.name": "Leucovorin"}])})
+    client.execute(cypher_lm, "prompt", "Which drugs exist?")
+
+    client.clear_cache()
+    client.execute(cypher_lm, "prompt", "Which drugs exist?")
+
+    assert len(cypher_lm.queries) == 2
+    assert len(database_queries(client)) == 2
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from escargot.cache import EmbeddingCache
+from escargot.language_models import AbstractLanguageModel
+from escargot.language_models.ollama import Ollama
+
+
+class CountingLanguageModel(AbstractLanguageModel):
+    """
+    Language model embedding each text as its length, counting the texts sent to embed.
+    """
+
+    def __init__(self, embedding_batch_size=2):
+        super().__init__({"counting": {"embedding_batch_size": embedding_batch_size}}, "counting")
+        self.embedded = []
+
+    def query(self, query, num_responses=1):
+        return [query] * num_responses
+
+    def get_response_texts(self, query_responses):
+        return list(query_responses)
+
+    def embed(self, texts):
+        self.embedded.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_language_models_must_implement_embed():
+    class NoEmbeddings(AbstractLanguageModel):
+        def query(self, query, num_responses=1):
+            return query
+
+        def get_response_texts(self, query_responses):
+            return [query_responses]
+
+    with pytest.raises(TypeError):
+        NoEmbeddings({"none": {}}, "none")
+
+
+def test_get_embeddings_batches_and_caches():
+    lm = CountingLanguageModel(embedding_batch_size=2)
+
+    assert lm.get_embeddings(["a", "bb", "a", "ccc"]) == [[1.0], [2.0], [1.0], [3.0]]
+    # duplicates are embedded once, in batches of embedding_batch_size
+    assert lm.embedded == [["a", "bb"], ["ccc"]]
+
+    assert lm.get_embedding("bb") == [2.0]
+    assert lm.get_embeddings(["dddd", "a"]) == [[4.0], [1.0]]
+    assert lm.embedded[-1] == ["dddd"]
+
+
+def test_embedding_cache_reads_back_from_disk(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(max_size=1, path=path)
+    cache.set("a", [0.5, 0.25])
+    cache.set("b", [1.0, 2.0])
+
+    # "a" was evicted from memory and is read back from SQLite as float32
+    assert cache.get("a") == [0.5, 0.25]
+    assert EmbeddingCache(path=path).get("b") == [1.0, 2.0]
+    assert EmbeddingCache().get("a") is None
+
+
+class InFlight:
+    """
+    Count the requests in flight, recording the highest count.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.calls = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.calls += 1
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+
+def chat_response(index):
+    return SimpleNamespace(message=SimpleNamespace(content=f"response {index}"), prompt_eval_count=3, eval_count=2)
+
+
+@pytest.fixture
+def make_ollama(monkeypatch, logger):
+    in_flight = InFlight()
+
+    class Client:
+        def __init__(self, **kwargs):
+            pass
+
+        def chat(self, model, messages):
+            with in_flight:
+                time.sleep(0.05)
+                return chat_response(in_flight.calls)
+
+    class AsyncClient:
+        def __init__(self, **kwargs):
+            pass
+
+        async def chat(self, model, messages):
+            with in_flight:
+                await asyncio.sleep(0.05)
+                return chat_response(in_flight.calls)
+
+    monkeypatch.setattr("escargot.language_models.ollama.Client", Client)
+    monkeypatch.setattr("escargot.language_models.ollama.AsyncClient", AsyncClient)
+
+    def make(**config):
+        lm = Ollama(
+            {
+                "ollama": {
+                    "model_id": "llama3",
+                    "embedding_id": "nomic-embed-text",
+                    "prompt_token_cost": 0.0,
+                    "response_token_cost": 0.0,
+                    "temperature": 0.0,
+                    "max_tokens": 10,
+                    "stop": None,
+                    **config,
+                }
+            },
+            model_name="ollama",
+            logger=logger,
+        )
+        return lm, in_flight
+
+    return make
+
+
+def test_ollama_caps_concurrent_completions(make_ollama):
+    lm, in_flight = make_ollama(max_concurrency=3)
+
+    responses = lm.query("question", num_responses=7)
+
+    assert len(lm.get_response_texts(responses)) == 7
+    assert in_flight.peak == 3
+    assert (lm.prompt_tokens, lm.completion_tokens) == (21, 14)
+
+
+def test_ollama_requests_completions_one_by_one_without_concurrency(make_ollama):
+    lm, in_flight = make_ollama(max_concurrency=1)
+
+    lm.query("question", num_responses=3)
+
+    assert (in_flight.calls, in_flight.peak) == (3, 1)
+
+
+def test_ollama_caps_concurrent_async_completions(make_ollama):
+    lm, in_flight = make_ollama(max_concurrency=2)
+
+    responses = asyncio.run(lm.aquery("question", num_responses=5))
+
+    assert len(responses) == 5
+    assert in_flight.peak == 2
+    assert (lm.prompt_tokens, lm.completion_tokens) == (15, 10)
@@ -0,0 +1,64 @@
+import pytest
+
+from escargot.vector_db.local import LocalVectorClient, tokenize
+
+
+@pytest.fixture
+def make_client(tmp_path, logger):
+    def make(records, **config):
+        client = LocalVectorClient({"local_vector": {"path": str(tmp_path), **config}}, logger)
+        client.append(records)
+        client.open()
+        return client
+
+    return make
+
+
+RECORDS = [
+    {"knowledge": "Alzheimer's disease is associated with APOE", "vector": [1.0, 0.0]},
+    {"knowledge": "Disease of Alzheimer", "vector": [1.0, 0.1]},
+    {"knowledge": "Parkinson's disease is associated with SNCA", "vector": [0.9, 0.4]},
+    {"knowledge": "APOE is a gene", "vector": [0.0, 1.0]},
+]
+
+
+def test_tokenize_splits_words():
+    assert tokenize("Alzheimer's Disease") == ["alzheimer", "s", "disease"]
+
+
+def test_keyword_rows_match_multi_word_keywords(make_client):
+    client = make_client(RECORDS)
+
+    # both rows contain the words, only the first one contains the phrase
+    assert list(client.keyword_rows("Alzheimer's disease")) == [0]
+    assert list(client.keyword_rows("disease")) == [0, 1, 2]
+    assert list(client.keyword_rows("Huntington")) == []
+    assert list(client.keyword_rows("")) == []
+
+
+def test_keyword_requests_use_the_cosine_threshold(make_client):
+    client = make_client(RECORDS, keyword_max_distance=0.5)
+
+    knowledge, similarities = client.get_knowledge([1.0, 0.0], keyword_filter="disease")
+    assert knowledge == [RECORDS[0]["knowledge"], RECORDS[1]["knowledge"], RECORDS[2]["knowledge"]]
+    assert similarities[0] > similarities[1] > similarities[2]
+
+    # APOE is a gene is too far from the question for the threshold
+    knowledge, _ = client.get_knowledge([1.0, 0.0], keyword_filter="APOE")
+    assert knowledge == [RECORDS[0]["knowledge"]]
+
+
+def test_dense_requests_use_max_distance(make_client):
+    client = make_client(RECORDS)
+
+    knowledge, distances = client.get_knowledge([1.0, 0.0], max_distance=0.01)
+    assert knowledge == [RECORDS[0]["knowledge"], RECORDS[1]["knowledge"]]
+    assert all(distance <= 0.01 for distance in distances)
+
+
+def test_reopening_rebuilds_the_keyword_index(make_client):
+    client = make_client(RECORDS[:1])
+    client.append(RECORDS[1:])
+    client.open()
+
+    assert list(client.keyword_rows("gene")) == [3]
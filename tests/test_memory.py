@@ -0,0 +1,178 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import escargot.memory.memory as memory_module
+from escargot.memory import Memory, close_memories, flush_memories, get_memory
+
+
+class StubMemory:
+    """
+    Memory without ChromaDB or graph, recording how it is used.
+    """
+
+    opened = []
+
+    def __init__(self, lm, collection_name="default"):
+        self.lm = lm
+        self.collection_name = collection_name
+        self.flushes = 0
+        self.closed = False
+        StubMemory.opened.append(self)
+
+    def flush(self, timeout=None):
+        self.flushes += 1
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def stub_memories(monkeypatch):
+    close_memories()
+    StubMemory.opened = []
+    monkeypatch.setattr(memory_module, "Memory", StubMemory)
+    yield StubMemory.opened
+    close_memories()
+
+
+def test_get_memory_shares_one_memory_per_collection(stub_memories, lm):
+    default = get_memory(lm)
+
+    assert get_memory(lm, "default") is default
+    assert get_memory(lm, "other") is not default
+    assert [memory.collection_name for memory in stub_memories] == ["default", "other"]
+
+
+def test_get_memory_opens_a_collection_once_across_threads(stub_memories, lm):
+    memories = []
+    threads = [threading.Thread(target=lambda: memories.append(get_memory(lm, "shared"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(stub_memories) == 1
+    assert all(memory is stub_memories[0] for memory in memories)
+
+
+def test_flush_memories_flushes_every_open_memory(stub_memories, lm):
+    get_memory(lm, "first")
+    get_memory(lm, "second")
+
+    assert flush_memories(timeout=5)
+    assert [memory.flushes for memory in stub_memories] == [1, 1]
+
+
+def test_close_memories_closes_and_forgets_memories(stub_memories, lm):
+    first = get_memory(lm, "first")
+    second = get_memory(lm, "second")
+
+    close_memories("first")
+    assert first.closed and not second.closed
+    assert get_memory(lm, "first") is not first
+
+    close_memories()
+    assert all(memory.closed for memory in stub_memories)
+    assert get_memory(lm, "second") is not second
+
+
+class StubCollection:
+    def __init__(self):
+        self.ids = []
+
+    def add(self, ids, embeddings, metadatas):
+        self.ids.extend(ids)
+
+
+class StubChromaClient:
+    def __init__(self, path, settings=None):
+        # like ChromaDB, create the folder of the collection
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def get_or_create_collection(self, name):
+        return StubCollection()
+
+
+@pytest.fixture
+def make_memory(monkeypatch, tmp_path, sampling_lm):
+    """
+    Open memories in a temporary directory, with their graph and log on disk and their vectors in a stub collection.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory_module, "chromadb", SimpleNamespace(PersistentClient=StubChromaClient))
+    memories = []
+
+    def make(compact_every=1000):
+        memories.append(Memory(sampling_lm, collection_name="test", compact_every=compact_every))
+        return memories[-1]
+
+    yield make
+    for memory in memories:
+        memory.close()
+
+
+def read_log():
+    with open("./escargot_memory/test/graph.log") as f:
+        return f.readlines()
+
+
+def test_stored_memories_are_replayed_from_the_log(make_memory):
+    memory = make_memory()
+    memory.store_memories(["first", "second"])
+    memory.close()
+
+    assert len(read_log()) == 2
+    reopened = make_memory()
+    assert reopened.log_entries == 2
+    assert reopened.graph.count_nodes() == 2
+    # new nodes are inserted after the replayed ones
+    assert reopened.graph_timestamp == 3
+
+
+def test_lines_cut_short_by_a_crash_are_skipped_on_replay(make_memory):
+    memory = make_memory()
+    memory.store_memories(["first", "second"])
+    memory.close()
+    with open("./escargot_memory/test/graph.log", "a") as f:
+        f.write('{"timestamp": 3, "id": "third", "te')
+
+    assert make_memory().graph.count_nodes() == 2
+
+
+def test_the_log_is_compacted_into_a_snapshot(make_memory):
+    memory = make_memory(compact_every=3)
+    memory.store_memories(["first", "second"])
+    memory.store_memories(["third"])
+
+    assert read_log() == []
+    assert memory.log_entries == 0
+    assert os.listdir("./escargot_memory/test").count("graph.tmp") == 0
+    memory.close()
+    reopened = make_memory()
+    assert (reopened.log_entries, reopened.graph.count_nodes()) == (0, 3)
+
+
+def test_a_crash_while_saving_keeps_the_previous_snapshot_and_the_log(make_memory):
+    memory = make_memory()
+    memory.store_memories(["first", "second"])
+    graph = memory.graph
+
+    def crash(path):
+        with open(path, "w") as f:
+            f.write("partial snapshot")
+        raise OSError("disk full")
+
+    memory.graph = SimpleNamespace(save_to_file=crash)
+    with pytest.raises(OSError):
+        memory.save_graph()
+    memory.graph = graph
+    memory.close()
+
+    assert len(read_log()) == 2
+    reopened = make_memory()
+    assert reopened.graph.count_nodes() == 2
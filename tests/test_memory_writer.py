@@ -0,0 +1,38 @@
+import threading
+
+from escargot.memory import MemoryWriter
+
+
+class StubMemory:
+    collection_name = "test"
+
+    def __init__(self):
+        self.stored = []
+
+    def store_memories(self, texts, datas=None):
+        self.stored.extend(zip(texts, datas))
+
+
+def test_each_answer_is_summarized_with_its_language_model(make_lm):
+    memory = StubMemory()
+    writer = MemoryWriter(memory, make_lm("default"))
+    writer.submit("first", lm=make_lm("other"))
+    writer.submit("second", data=[1, 2])
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    assert memory.stored == [("other: first", None), ("default: second", [1, 2])]
+
+
+def test_flush_gives_up_after_the_timeout(make_lm):
+    release = threading.Event()
+    memory = StubMemory()
+    writer = MemoryWriter(memory, make_lm("stalled", release=release))
+    writer.submit("question")
+
+    assert not writer.flush(timeout=0.1)
+
+    release.set()
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert memory.stored == [("stalled: question", None)]
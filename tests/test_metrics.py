@@ -0,0 +1,124 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from escargot.metrics import InMemorySink, JSONLSink, MetricsRecorder, PrometheusSink, record, span, timed
+from escargot.utils import bind_cancellation, run_cancellable
+
+
+def test_nothing_is_recorded_outside_of_a_span():
+    record("llm_calls")
+    with span("knowledge", request="genes") as current:
+        assert current is None
+    with timed("cypher_seconds"):
+        pass
+
+
+def test_summary_totals_phases_and_nests_knowledge():
+    sink = InMemorySink()
+    recorder = MetricsRecorder([sink], labels={"question": "q"})
+    with recorder.span("phase", phase="planning", operation=1, step=None):
+        record("llm_calls")
+        record("prompt_tokens", 100)
+    with recorder.span("phase", phase="planning", operation=2, step=None):
+        record("llm_calls")
+    with recorder.span("phase", phase="steps", operation=3, step="1"):
+        with span("knowledge", request="genes"):
+            record("rows", 5)
+        record("retries")
+
+    summary = recorder.summary()
+
+    assert summary["phases"]["planning"]["operations"] == 2
+    assert summary["phases"]["planning"]["llm_calls"] == 2
+    assert summary["phases"]["planning"]["prompt_tokens"] == 100
+    # counters of a knowledge request are added to the enclosing phase
+    assert summary["phases"]["steps"]["rows"] == 5
+    assert summary["phases"]["steps"]["retries"] == 1
+    assert [knowledge["request"] for knowledge in summary["knowledge"]] == ["genes"]
+    assert summary["knowledge"][0]["rows"] == 5
+    assert [step["step"] for step in summary["steps"]] == ["1"]
+    assert summary["total"]["operations"] == 3
+    assert summary["total"]["llm_calls"] == 2
+    assert all(record["question"] == "q" for record in sink.records)
+    assert len(sink.records) == 4
+
+
+def test_spans_follow_work_on_other_threads():
+    recorder = MetricsRecorder()
+
+    def work():
+        with span("knowledge", request="genes"):
+            record("rows", 2)
+        run_cancellable(lambda: record("vector_hits", 3))
+
+    with recorder.span("phase", phase="steps", operation=1, step="1"):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(bind_cancellation(work)).result()
+
+    summary = recorder.summary()
+    assert summary["phases"]["steps"]["rows"] == 2
+    assert summary["phases"]["steps"]["vector_hits"] == 3
+
+
+def test_work_finishing_after_its_span_is_not_counted():
+    recorder = MetricsRecorder()
+    release = threading.Event()
+    done = threading.Event()
+
+    def late():
+        release.wait(5)
+        record("llm_calls")
+        done.set()
+
+    with recorder.span("phase", phase="planning", operation=1, step=None):
+        threading.Thread(target=bind_cancellation(late)).start()
+    release.set()
+    assert done.wait(5)
+    assert "llm_calls" not in recorder.summary()["phases"]["planning"]
+
+
+def test_jsonl_sink_writes_one_line_per_record(tmp_path):
+    path = tmp_path / "metrics" / "metrics.jsonl"
+    sink = JSONLSink(str(path))
+    recorder = MetricsRecorder([sink])
+    with recorder.span("phase", phase="planning", operation=1, step=None):
+        record("llm_calls")
+    recorder.close()
+    sink.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["phase"] == "planning"
+    assert lines[0]["llm_calls"] == 1
+
+
+def test_prometheus_sink_renders_labeled_totals(tmp_path):
+    path = tmp_path / "escargot.prom"
+    sink = PrometheusSink(str(path))
+    recorder = MetricsRecorder([sink])
+    for i in range(2):
+        with recorder.span("phase", phase="planning", operation=i, step=None):
+            record("prompt_tokens", 10)
+    with recorder.span("knowledge", request="genes"):
+        record("rows", 4)
+    recorder.close()
+
+    text = path.read_text()
+    assert "# TYPE escargot_phase_seconds summary" in text
+    assert 'escargot_phase_seconds_count{phase="planning"} 2' in text
+    assert 'escargot_phase_prompt_tokens_total{phase="planning"} 20' in text
+    assert "escargot_knowledge_rows_total 4" in text
+    # attributes such as the operation id are not exported as counters
+    assert "operation" not in text
+    assert text.count("# TYPE escargot_phase_seconds ") == 1
+
+
+def test_prometheus_sink_escapes_label_values():
+    sink = PrometheusSink()
+    recorder = MetricsRecorder([sink])
+    with recorder.span("phase", phase='plan "a"\\b\nc'):
+        record("llm_calls")
+    recorder.close()
+
+    assert 'escargot_phase_llm_calls_total{phase="plan \\"a\\"\\\\b\\nc"} 1' in sink.render()
@@ -0,0 +1,15 @@
+from escargot.parser import ESCARGOTParser
+
+
+def test_fast_answer_without_steps_falls_back_to_got_planning(logger):
+    parser = ESCARGOTParser(logger)
+    state = {"question": "question", "input": "", "phase": "planning", "method": "fast", "num_strategies": 5}
+
+    new_state = parser.parse_generate_answer(state, "I cannot answer this question.")
+
+    assert new_state["method"] == "got"
+    assert new_state["phase"] == "planning"
+    assert new_state["input"] == ""
+    # as many plans as a question asked with the got method
+    assert new_state["num_branches_response"] == 5
+    assert new_state["generate_successors"] == 1
@@ -0,0 +1,76 @@
+from escargot.cache import LRUCache, PlanCache
+
+NODE_TYPES = "Gene, Drug, Disease"
+
+
+def test_mask_keeps_stop_words_and_node_types():
+    template, entities = PlanCache(LRUCache(4)).mask("Which genes are associated with the disease?", NODE_TYPES)
+
+    assert template == "which genes are associated with the disease?"
+    assert entities == []
+
+
+def test_mask_named_entities():
+    template, entities = PlanCache(LRUCache(4)).mask("What does  CYP3A4 metabolize?")
+
+    assert template == "what does __entity_1__ metabolize?"
+    assert entities == ["CYP3A4"]
+
+
+def test_mask_entity_after_a_node_type():
+    plan_cache = PlanCache(LRUCache(4))
+
+    assert plan_cache.mask("List the genes which bind to the drug loxapine", NODE_TYPES) == (
+        "list the genes which bind to the drug __entity_1__",
+        ["loxapine"],
+    )
+
+
+def test_mask_multiple_choice_options():
+    template, entities = PlanCache(LRUCache(4)).mask("Which of these treats Alzheimer? 1. Dolasetron 2. Trastuzumab 3. Insulin pork", NODE_TYPES)
+
+    assert entities == ["Dolasetron", "Trastuzumab", "Insulin pork", "Alzheimer"]
+    assert template == "which of these treats __entity_4__? 1. __entity_1__ 2. __entity_2__ 3. __entity_3__"
+
+
+PLAN = {
+    "xml": "<Step><Code>genes = knowledge_extract('genes binding to Stanozolol')</Code></Step>",
+    "full_plan": "Find the genes binding to Stanozolol.",
+    "full_code": "genes = knowledge_extract('genes binding to Stanozolol')",
+}
+
+
+def test_round_trip_substitutes_the_entities():
+    plan_cache = PlanCache(LRUCache(4))
+
+    assert plan_cache.set("List the genes which bind to the drug Stanozolol", NODE_TYPES, "schema", PLAN)
+    plan = plan_cache.get("List the genes which bind to the drug Loxapine", NODE_TYPES, "schema")
+
+    assert plan == {field: value.replace("Stanozolol", "Loxapine") for field, value in PLAN.items()}
+
+
+def test_plans_are_keyed_on_answer_type_and_method():
+    plan_cache = PlanCache(LRUCache(4))
+    question = "List the genes which bind to the drug Stanozolol"
+
+    assert plan_cache.set(question, NODE_TYPES, "schema", PLAN, answer_type="array", method="got")
+
+    assert plan_cache.get(question, NODE_TYPES, "schema", answer_type="array", method="got") is not None
+    assert plan_cache.get(question, NODE_TYPES, "schema", answer_type="natural", method="got") is None
+    assert plan_cache.get(question, NODE_TYPES, "schema", answer_type="array", method="fast") is None
+
+
+def test_plans_of_another_schema_are_dropped():
+    plan_cache = PlanCache(LRUCache(4))
+    question = "List the genes which bind to the drug Stanozolol"
+    plan_cache.set(question, NODE_TYPES, "schema", PLAN)
+
+    assert plan_cache.get(question, NODE_TYPES, "new schema") is None
+    assert plan_cache.get(question, NODE_TYPES, "schema") is None
+
+
+def test_plans_missing_an_entity_are_not_stored():
+    plan_cache = PlanCache(LRUCache(4))
+
+    assert not plan_cache.set("List the genes which bind to the drug Loxapine", NODE_TYPES, "schema", PLAN)
+    assert not plan_cache.set("Which genes are associated with the disease?", NODE_TYPES, "schema", PLAN)
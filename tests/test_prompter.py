@@ -0,0 +1,51 @@
+class StubGraphClient:
+    """
+    Graph client returning fixed rows and counting the Cypher queries executed.
+    """
+
+    schema = ""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = 0
+
+    def execute(self, lm, prompt, statement):
+        self.executed += 1
+        return [dict(row) for row in self.rows], "MATCH (n) RETURN n"
+
+    def schema_fingerprint(self):
+        return "schema"
+
+
+ROWS = [{"gene": "APOE", "score": 0.9}, {"gene": "APP", "score": 0.7}]
+
+
+def test_cached_rows_are_converted_for_the_code_of_each_step(make_prompter):
+    prompter = make_prompter(StubGraphClient(ROWS))
+    request = "genes associated with Alzheimer's disease and their scores"
+
+    as_dict = prompter.get_knowledge(
+        request, "Get the genes", "genes = knowledge_extract('genes')", "genes = knowledge_extract('genes')\nfor gene, score in genes.items():\n    pass"
+    )
+    as_pairs = prompter.get_knowledge(
+        request, "Get the genes", "pairs = knowledge_extract('genes')", "pairs = knowledge_extract('genes')\nfor gene, score in pairs:\n    pass"
+    )
+    as_rows = prompter.get_knowledge(
+        request, "Get the genes", "rows = knowledge_extract('genes')", "rows = knowledge_extract('genes')\nnames = [row['gene'] for row in rows]"
+    )
+
+    assert prompter.graph_client.executed == 1
+    assert as_dict == {"APOE": 0.9, "APP": 0.7}
+    assert as_pairs == [("APOE", 0.9), ("APP", 0.7)]
+    assert as_rows == ROWS
+
+
+def test_cached_rows_are_not_modified_by_the_steps(make_prompter):
+    prompter = make_prompter(StubGraphClient(ROWS))
+    code = "rows = knowledge_extract('genes')"
+    full_code = code + "\nrows[0]['gene'] = 'changed'"
+
+    prompter.get_knowledge("genes", "Get the genes", code, full_code)[0]["gene"] = "changed"
+
+    assert prompter.get_knowledge("genes", "Get the genes", code, full_code) == ROWS
+    assert prompter.graph_client.executed == 1
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from escargot.memory import BM25Index, fuse_rankings
+from escargot.memory.retrieval import tokenize
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("APOE binds, to Tau!") == ["apoe", "binds", "to", "tau"]
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = BM25Index()
+    index.add_many([
+        ("apoe", "APOE is a gene associated with Alzheimer's disease"),
+        ("tau", "Tau is a protein; tau tangles appear in Alzheimer's disease"),
+        ("insulin", "Insulin is a hormone"),
+    ])
+
+    results = index.search("tau tangles")
+    assert [doc_id for doc_id, score in results] == ["tau"]
+
+    results = index.search("alzheimer gene")
+    assert results[0][0] == "apoe"
+    assert "insulin" not in [doc_id for doc_id, score in results]
+
+
+def test_bm25_replaces_and_removes_documents():
+    index = BM25Index()
+    index.add("a", "red apple")
+    index.add("a", "green pear")
+    assert index.search("apple") == []
+    assert [doc_id for doc_id, score in index.search("pear")] == ["a"]
+
+    index.remove("a")
+    assert len(index) == 0
+    assert index.search("pear") == []
+    assert index.postings == {}
+
+
+def test_bm25_limits_results():
+    index = BM25Index()
+    index.add_many((str(i), "common word") for i in range(5))
+    assert len(index.search("common", max_results=3)) == 3
+
+
+def test_fuse_rankings_rewards_agreement():
+    fused = fuse_rankings([["a", "b", "c"], ["b", "c", "a"]], [1.0, 1.0])
+    assert fused[0][0] == "b"
+    assert {doc_id for doc_id, score in fused} == {"a", "b", "c"}
+
+
+def test_fuse_rankings_applies_weights():
+    fused = fuse_rankings([["a", "b"], ["b", "a"]], [1.0, 3.0])
+    assert [doc_id for doc_id, score in fused] == ["b", "a"]
+    assert fuse_rankings([["a"], []], [0.0, 1.0]) == [("a", 0.0)]
+
+
+def test_window_memory_ids_keeps_the_memories_of_the_window():
+    raphtory = pytest.importorskip("raphtory")
+    from escargot.memory import Memory
+
+    # only the graph of the memory is needed, not its ChromaDB collection
+    memory = Memory.__new__(Memory)
+    memory.lock = threading.RLock()
+    memory.graph = raphtory.Graph()
+    for timestamp, memory_id in [(1, "first"), (2, "second"), (3, "third")]:
+        memory.add_graph_node({"timestamp": timestamp, "id": memory_id, "text": memory_id, "vector_ref": memory_id})
+
+    assert sorted(memory.window_memory_ids(2, 4)) == ["second", "third"]
+    assert memory.window_memory_ids(4, 10) == []
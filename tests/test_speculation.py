@@ -0,0 +1,68 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+
+class StubPrompter:
+    def generate_prompt(self, **state):
+        return f"{state['phase']}: {state['input']}"
+
+
+class StubParser:
+    num_conversions = 2
+
+    def parse_generate_answer(self, state, response):
+        return {**state, "scores": [1, 5, 2], "phase": "python_conversion", "select_highest_score": 1}
+
+
+def respond(prompt, num_responses):
+    if prompt.startswith("plan_assessment"):
+        return ["<Approach><Score>1</Score></Approach>"]
+    return [f"code of {prompt}"] * num_responses
+
+
+@pytest.fixture
+def lm(make_lm):
+    return make_lm(respond=respond)
+
+
+STATE = {"question": "question", "phase": "plan_assessment", "input": ["plan A", "plan B", "plan C"], "speculative": True}
+
+
+def test_selected_plan_keeps_its_speculative_conversions(lm, make_generate):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        _, _, new_states = make_generate(executor).generate_from_single_thought(lm, StubPrompter(), StubParser(), dict(STATE))
+
+    assert new_states[0]["input"] == "plan B"
+    assert new_states[0]["speculative_responses"] == ["code of python_conversion: plan B"] * 2
+    # the conversions are requested as many times as the python_conversion phase does
+    assert {num_responses for prompt, num_responses in lm.queries if prompt.startswith("python_conversion")} == {2}
+
+
+def test_retries_do_not_speculate(lm, make_generate):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        _, _, new_states = make_generate(executor, is_retry=True).generate_from_single_thought(lm, StubPrompter(), StubParser(), dict(STATE))
+
+    assert "speculative_responses" not in new_states[0]
+    assert [prompt for prompt, _ in lm.queries if prompt.startswith("python_conversion")] == []
+
+
+def test_speculation_needs_an_executor_and_tokens_left(lm, make_generate):
+    assert make_generate().speculate_conversions(lm, StubPrompter(), dict(STATE), 2) is None
+
+    lm.prompt_tokens = 101
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert make_generate(executor, max_tokens=100).speculate_conversions(lm, StubPrompter(), dict(STATE), 2) is None
+    assert lm.queries == []
+
+
+def test_unselected_conversions_are_cancelled(make_generate):
+    speculations = {index: Future() for index in range(3)}
+    speculations[2].set_running_or_notify_cancel()
+
+    make_generate().cancel_speculations(speculations, keep=1)
+
+    assert speculations[0].cancelled()
+    assert not speculations[1].cancelled()
+    # a conversion already running finishes in the background
+    assert not speculations[2].cancelled()
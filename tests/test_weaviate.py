@@ -0,0 +1,83 @@
+import pytest
+
+from escargot.vector_db.weaviate import WeaviateClient
+
+
+class FakeQuery:
+    """
+    Query builder recording the hybrid query and its filter, and returning fixed objects.
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.where = None
+        self.hybrid = None
+
+    def get(self, db, properties):
+        return self
+
+    def with_hybrid(self, **kwargs):
+        self.hybrid = kwargs
+        return self
+
+    def with_autocut(self, autocut):
+        return self
+
+    def with_additional(self, additional):
+        return self
+
+    def with_where(self, where):
+        self.where = where
+        return self
+
+    def do(self):
+        return {"data": {"Get": {"AlzKB": self.objects}}}
+
+
+class FakeWeaviate:
+    def __init__(self, objects):
+        self.query = FakeQuery(objects)
+
+
+@pytest.fixture
+def make_client(logger):
+    def make(objects):
+        client = WeaviateClient({}, logger)
+        client.config = {"db": "AlzKB"}
+        client.db = "AlzKB"
+        client.limit = 200
+        client.autocut = None
+        client.encoding = "cl100k_base"
+        client.client = FakeWeaviate(objects)
+        return client
+
+    return make
+
+
+OBJECTS = [
+    {"knowledge": "Alzheimer's disease is associated with APOE", "_additional": {"score": "0.9"}},
+    {"knowledge": "Disease of Alzheimer", "_additional": {"score": "0.8"}},
+    {"knowledge": "APOE is a gene", "_additional": {"score": "0.001"}},
+]
+
+
+def test_multi_word_keyword_is_filtered_after_the_hybrid_query(make_client):
+    client = make_client(OBJECTS)
+
+    knowledge, scores = client.get_knowledge([1.0, 0.0], keyword_filter="Alzheimer's disease")
+
+    # Like would match nothing for several tokens, so it is not sent
+    assert client.client.query.where is None
+    assert client.client.query.hybrid["query"] == "Alzheimer's disease"
+    assert knowledge == [OBJECTS[0]["knowledge"]]
+    assert scores == [0.9]
+
+
+def test_single_word_keyword_is_filtered_by_weaviate(make_client):
+    client = make_client(OBJECTS)
+
+    knowledge, _ = client.get_knowledge([1.0, 0.0], keyword_filter="APOE")
+
+    assert client.client.query.where == {"path": ["knowledge"], "operator": "Like", "valueText": "*APOE*"}
+    # the last object is below min_score
+    assert knowledge == [OBJECTS[0]["knowledge"]]